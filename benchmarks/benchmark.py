@@ -0,0 +1,292 @@
+"""Throughput and latency benchmark for the JDS6600 driver.
+
+Drives the real SerialConnection / signalGenerator_write / signalGenerator_read
+stack against the pty simulator and writes the results as JSON:
+
+    python -m benchmarks.benchmark --output bench_output.json --latency 0.0005
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+from datetime import datetime, timezone
+
+from core.serialHandler import SerialConnection
+from core.simulator import JDS6600Simulator
+from core.device.readFunctions import signalGenerator_read
+from core.device.writeFunctions import signalGenerator_write
+from core.device.channelConfig import ChannelConfig
+from core.sweep import FrequencySweep
+from core.metrics import CommandMetrics
+from core.utils.utils import parameters, channel, unit, amplitude, waveform
+import logger
+
+CHANNEL_CONFIG = ChannelConfig(waveform=waveform.SINE, frequency=1000, amplitude=2,
+                               offset=1, duty_cycle=25, phase=10, enable=True)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies, commands_per_op=1):
+    # latencies: seconds per operation
+    total = sum(latencies)
+    return {
+        'operations': len(latencies),
+        'ops_per_s': len(latencies) / total if total else None,
+        'commands_per_s': len(latencies) * commands_per_op / total if total else None,
+        'mean_ms': statistics.fmean(latencies) * 1e3,
+        'p50_ms': percentile(latencies, 50) * 1e3,
+        'p95_ms': percentile(latencies, 95) * 1e3,
+        'p99_ms': percentile(latencies, 99) * 1e3,
+        'max_ms': max(latencies) * 1e3,
+    }
+
+
+def measure(operation, repeat):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        operation()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_round_trip(read, repeat):
+    return summarize(measure(lambda: read.get_waveform(channel.CH1), repeat))
+
+
+def bench_channel_setup_sequential(write, repeat):
+    def setup():
+        write.set_waveform(channel.CH1, waveform.SINE)
+        write.set_frequency(channel.CH1, 1, unit.KHZ)
+        write.set_amplitude(channel.CH1, 2, amplitude.VOLT)
+        write.set_offset(channel.CH1, 1, amplitude.VOLT)
+        write.set_duty_cycle(channel.CH1, 25)
+        write.set_phase(channel.CH1, 10)
+        write.set_channel_enable(channel.CH1)
+    return summarize(measure(setup, repeat), commands_per_op=7)
+
+
+def bench_channel_setup_apply(write, repeat):
+    return summarize(measure(lambda: write.apply(channel.CH1, CHANNEL_CONFIG), repeat), commands_per_op=7)
+
+
+def bench_round_trip_metrics(conn, read, repeat):
+    # Same round trip with a CommandMetrics attached (phase timing on), to
+    # compare against round_trip for the instrumentation overhead
+    conn.metrics = CommandMetrics(phases=True)
+    try:
+        return summarize(measure(lambda: read.get_waveform(channel.CH1), repeat))
+    finally:
+        conn.metrics = None
+
+
+def bench_shared_connection(read, repeat, thread_counts=(1, 2, 4, 8)):
+    # Round trips/s with several threads sharing one connection; with
+    # per-transaction locking this should stay flat rather than collapse
+    results = {}
+    for threads in thread_counts:
+        per_thread = max(repeat // threads, 1)
+        def worker():
+            for _ in range(per_thread):
+                read.get_waveform(channel.CH1)
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        results[f'threads_{threads}_cmd_per_s'] = per_thread * threads / (time.perf_counter() - start)
+    return results
+
+
+def bench_readback_sequential(read, repeat):
+    def readback():
+        read.get_channel_enable()
+        for ch in (channel.CH1, channel.CH2):
+            read.get_waveform(ch)
+            read.get_frequency(ch)
+            read.get_amplitude(ch)
+            read.get_offset(ch)
+            read.get_duty_cycle(ch)
+            read.get_phase(ch)
+    return summarize(measure(readback, repeat), commands_per_op=13)
+
+
+def bench_readback_burst(conn, repeat):
+    commands = [f':r{register}=' for register in range(20, 33)]
+    return summarize(measure(lambda: conn.send_commands(commands), repeat), commands_per_op=13)
+
+
+def bench_arbitrary_readback(repeat):
+    # Host cost of a 10 kB slot readback: framing and decoding, with the
+    # device answering instantly (at 115200 baud the wire alone takes ~0.9 s)
+    with JDS6600Simulator(seed=1) as sim:
+        conn = SerialConnection(sim.port, timeout=1)
+        read = signalGenerator_read(conn)
+        stats = summarize(measure(lambda: read.get_arbitrary_waveform_data(1), repeat))
+        conn.close()
+    return stats
+
+
+def bench_sweep_steps(write, steps):
+    frequencies = [100 + 10 * i for i in range(steps)]
+    latencies = []
+    for frequency in frequencies:
+        start = time.perf_counter()
+        write.set_frequency(channel.CH1, frequency, unit.HZ)
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+
+def bench_sweep_engine(conn, steps):
+    # Precomputed command stream, dwell 0 so only the per-step cost counts
+    report = FrequencySweep(channel.CH1, 100, 100 + 10 * (steps - 1), steps, dwell=0).run(
+        conn, sleep=lambda seconds: None)
+    step_times = [b - a for a, b in zip(report.timing_errors, report.timing_errors[1:])]
+    return summarize(step_times or [0.0])
+
+
+def bench_hot_path(write, read, number):
+    # CPU cost of encode/parse alone, no I/O (microseconds per call)
+    timer = timeit.Timer
+    return {
+        'encode_frequency_us': timer(lambda: write._encode_frequency(channel.CH1, 1234.5, unit.HZ)).timeit(number) / number * 1e6,
+        'encode_apply_us': timer(lambda: write._encode_apply(channel.CH1, CHANNEL_CONFIG)).timeit(number) / number * 1e6,
+        'parse_response_us': timer(lambda: read._parse_response(':r23=123450,0.')).timeit(number) / number * 1e6,
+    }
+
+
+class _NullConnection:
+    # Answers instantly, so only the driver's own per-command cost is timed
+    def send_command(self, command, timeout=None):
+        return ':ok' if command.startswith(':w') else ':r25=2000.'
+
+
+IMPORT_SCRIPT = """
+import os, time
+start = time.perf_counter()
+import core.device.writeFunctions, core.device.readFunctions
+print(time.perf_counter() - start, os.path.exists('test'))
+"""
+
+
+def bench_import():
+    # Fresh interpreter in an empty directory: import time of the driver and
+    # whether importing it created any files (it should not)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    with tempfile.TemporaryDirectory() as cwd:
+        output = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT], cwd=cwd, env=env,
+                                capture_output=True, text=True, check=True).stdout.split()
+    return {'import_ms': float(output[0]) * 1e3, 'created_files': output[1] == 'True'}
+
+
+def bench_logging_overhead(number):
+    # Microseconds per set/get call with test logging off, on but filtered
+    # out by level, and on (records handed to the queue listener)
+    write = signalGenerator_write(_NullConnection())
+    read = signalGenerator_read(_NullConnection())
+    def per_call():
+        timer = timeit.Timer
+        return (timer(lambda: write.set_frequency(channel.CH1, 1234.5, unit.HZ)).timeit(number) / number * 1e6,
+                timer(lambda: read.get_amplitude(channel.CH1)).timeit(number) / number * 1e6)
+    results = {}
+    saved_level = logger.test_logger.level
+    with tempfile.TemporaryDirectory() as log_dir:
+        previous_log_dir = logger.set_log_dir(log_dir)
+        try:
+            parameters.TEST = False
+            results['set_us_off'], results['get_us_off'] = per_call()
+            parameters.TEST = True
+            logger.set_level(logging.WARNING)
+            results['set_us_filtered'], results['get_us_filtered'] = per_call()
+            logger.set_level(logging.INFO)
+            results['set_us_queued'], results['get_us_queued'] = per_call()
+        finally:
+            parameters.TEST = False
+            logger.set_level(saved_level)
+            logger.set_log_dir(previous_log_dir)
+    return results
+
+
+def run(repeat=200, latency=0.0005, jitter=0.0001, baudrate=115200, min_gap=0.0):
+    # Measure the driver itself, without debug prints and test logging
+    saved = parameters.DEBUG, parameters.TEST
+    parameters.DEBUG = parameters.TEST = False
+    try:
+        return _run(repeat, latency, jitter, baudrate, min_gap)
+    finally:
+        parameters.DEBUG, parameters.TEST = saved
+
+
+def _run(repeat, latency, jitter, baudrate, min_gap):
+    results = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'device': {'latency_s': latency, 'jitter_s': jitter, 'baudrate': baudrate},
+        'repeat': repeat,
+        'benchmarks': {},
+    }
+    with JDS6600Simulator(latency=latency, jitter=jitter, baudrate=baudrate, seed=1) as sim:
+        conn = SerialConnection(sim.port, timeout=1, min_gap=min_gap)
+        write = signalGenerator_write(conn)
+        read = signalGenerator_read(conn)
+        bench = results['benchmarks']
+        bench['round_trip'] = bench_round_trip(read, repeat)
+        bench['round_trip_metrics'] = bench_round_trip_metrics(conn, read, repeat)
+        bench['channel_setup_sequential'] = bench_channel_setup_sequential(write, max(repeat // 10, 5))
+        bench['channel_setup_apply'] = bench_channel_setup_apply(write, max(repeat // 10, 5))
+        bench['shared_connection'] = bench_shared_connection(read, repeat)
+        bench['readback_sequential'] = bench_readback_sequential(read, max(repeat // 10, 5))
+        bench['readback_burst'] = bench_readback_burst(conn, max(repeat // 10, 5))
+        bench['arbitrary_readback'] = bench_arbitrary_readback(max(repeat // 10, 5))
+        bench['sweep_step'] = bench_sweep_steps(write, repeat)
+        bench['sweep_engine_step'] = bench_sweep_engine(conn, repeat)
+        bench['hot_path'] = bench_hot_path(write, read, repeat * 50)
+        bench['logging_overhead'] = bench_logging_overhead(repeat * 10)
+        bench['import'] = bench_import()
+        conn.close()
+    return results
+
+
+def print_summary(results):
+    for name, stats in results['benchmarks'].items():
+        if 'p50_ms' in stats:
+            print(f"{name:28s} {stats['commands_per_s']:9.0f} cmd/s  "
+                  f"p50 {stats['p50_ms']:7.3f} ms  p95 {stats['p95_ms']:7.3f} ms  p99 {stats['p99_ms']:7.3f} ms")
+        else:
+            print(name, ', '.join(f"{key} {value:.2f}" for key, value in stats.items()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default='bench_output.json')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.0005, help="simulated device processing time (s)")
+    parser.add_argument('--jitter', type=float, default=0.0001)
+    parser.add_argument('--baudrate', type=int, default=115200, help="simulated wire speed, 0 disables")
+    options = parser.parse_args(argv)
+    results = run(options.repeat, options.latency, options.jitter, options.baudrate or None)
+    with open(options.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print_summary(results)
+    print(f"Results written to {options.output}")
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+import asyncio
+import contextvars
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+import serial
+from core.utils.utils import parameters
+from logger import get_logger
+
+# Per-command traces, enable with logger.set_level(logging.DEBUG, 'core.asyncSerialHandler')
+log = get_logger(__name__)
+
+# Set by AsyncSerialConnection.priority() for the current task
+_priority = contextvars.ContextVar('jds6600_priority', default=False)
+
+
+class AsyncTransactionLock:
+    """asyncio counterpart of TransactionLock (not re-entrant).
+
+    On release the oldest waiter in the priority lane gets the lock, then
+    the oldest normal waiter.
+    """
+    def __init__(self):
+        self._locked = False
+        self._lanes = (deque(), deque())  # priority, normal
+
+    async def acquire(self, priority=False):
+        if not self._locked:
+            self._locked = True
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        lane = self._lanes[0 if priority else 1]
+        lane.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # handed over just as the task was cancelled
+            elif waiter in lane:
+                lane.remove(waiter)
+            raise
+
+    def release(self):
+        for lane in self._lanes:
+            while lane:
+                waiter = lane.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+                    return
+        self._locked = False
+
+
+class AsyncSerialConnection:
+    """asyncio counterpart of SerialConnection.
+
+    The port is opened non-blocking and its file descriptor is watched with
+    loop.add_reader(), so no thread is needed per device (POSIX only).
+    Open it with `await AsyncSerialConnection.open(port)`.
+    """
+    def __init__(self, ser, timeout=1, min_gap=0.0, window=8, metrics=None):
+        self.ser = ser
+        self.timeout = timeout
+        self.min_gap = min_gap
+        self.window = window
+        self.metrics = metrics
+        if metrics is not None and metrics.port is None:
+            metrics.port = ser.port
+        self._buffer = bytearray()
+        self._data_ready = asyncio.Event()
+        self._lock = AsyncTransactionLock()
+        self._orphans = 0  # replies still owed to cancelled commands
+        self._failure = None  # error that stopped reading the port
+        self._last_command_end = 0.0
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(ser.fileno(), self._on_readable)
+
+    @classmethod
+    async def open(cls, port, timeout=1, min_gap=0.0, window=8, metrics=None):
+        try:
+            ser = serial.Serial(
+                port=port,
+                baudrate=115200,
+                bytesize=serial.EIGHTBITS,
+                parity=serial.PARITY_NONE,
+                stopbits=serial.STOPBITS_ONE,
+                timeout=0
+            )
+            if parameters.DEBUG: print("Serial port opened successfully.")
+        except serial.SerialException as e:
+            if parameters.DEBUG: print(f"Failed to open serial port: {e}")
+            raise
+        return cls(ser, timeout=timeout, min_gap=min_gap, window=window, metrics=metrics)
+
+    def _on_readable(self):
+        try:
+            data = self.ser.read(self.ser.in_waiting or 1)
+        except OSError as e:
+            # Port gone (e.g. EIO on hangup): stop watching it and wake the
+            # waiting readers, or the loop would spin on the readable fd
+            self._loop.remove_reader(self.ser.fileno())
+            self._failure = e
+            self._data_ready.set()
+            return
+        if data:
+            self._buffer += data
+            self._data_ready.set()
+
+    async def _next_line(self):
+        while True:
+            end = self._buffer.find(b'\r\n')
+            if end >= 0:
+                line = bytes(self._buffer[:end])
+                del self._buffer[:end + 2]
+                if self._orphans:
+                    # Late reply to a cancelled command, not ours
+                    self._orphans -= 1
+                    continue
+                return line
+            if self._failure is not None:
+                raise serial.SerialException(f"Serial port failed: {self._failure}") from self._failure
+            self._data_ready.clear()
+            await self._data_ready.wait()
+
+    @contextmanager
+    def priority(self):
+        # Commands of the current task inside the block go ahead of waiting
+        # normal ones, like SerialConnection.priority()
+        token = _priority.set(True)
+        try:
+            yield self
+        finally:
+            _priority.reset(token)
+
+    @asynccontextmanager
+    async def _exclusive(self):
+        await self._lock.acquire(_priority.get())
+        try:
+            yield
+        finally:
+            self._lock.release()
+
+    async def _wait_min_gap(self):
+        if self.min_gap > 0:
+            remaining = self._last_command_end + self.min_gap - time.monotonic()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+
+    def _discard_stale(self):
+        # Anything buffered between commands is a late reply to a timed out
+        # command. Replies owed to cancelled commands are skipped by count.
+        if not self._orphans:
+            self._buffer.clear()
+
+    def _write_command(self, command):
+        full_command = f"{command}\r\n"
+        log.debug("Sending command: %s", command)
+        self.ser.write(full_command.encode())
+
+    async def _read_replies(self, count, timeout, commands=None):
+        # Collect `count` replies in order. On timeout the remaining replies
+        # are assumed lost and the input buffer is dropped; on cancellation
+        # they are assumed still in transit and skipped when they arrive.
+        # With metrics, `commands` are the ones just written.
+        responses = []
+        started = time.perf_counter()
+
+        async def collect():
+            while len(responses) < count:
+                line = await self._next_line()
+                responses.append(line.decode().strip())
+                if self.metrics is not None:
+                    command = commands[len(responses) - 1]
+                    self.metrics.observe_command(command, time.perf_counter() - started,
+                                                 len(command) + 2, len(line) + 2)
+
+        try:
+            await asyncio.wait_for(collect(), timeout)
+        except asyncio.TimeoutError:
+            if self.metrics is not None:
+                for command in commands[len(responses):]:
+                    self.metrics.observe_command(command, time.perf_counter() - started,
+                                                 len(command) + 2, 0, timed_out=True)
+            self._buffer.clear()
+            self._orphans = 0
+            responses += [''] * (count - len(responses))
+        except asyncio.CancelledError:
+            self._orphans += count - len(responses)
+            raise
+        finally:
+            self._last_command_end = time.monotonic()
+        log.debug("Received responses: %s", responses)
+        return responses
+
+    async def send_command(self, command, timeout=None):
+        async with self._exclusive():
+            await self._wait_min_gap()
+            self._discard_stale()
+            self._write_command(command)
+            responses = await self._read_replies(1, timeout or self.timeout, [command])
+        return responses[0]
+
+    async def send_raw(self, data, timeout=None):
+        # Send a pre-encoded command line (terminator included), e.g. an
+        # arbitrary waveform upload
+        async with self._exclusive():
+            await self._wait_min_gap()
+            self._discard_stale()
+            log.debug("Sending command: %r", data)
+            self.ser.write(data)
+            responses = await self._read_replies(1, timeout or self.timeout, [bytes(data).rstrip(b'\r\n')])
+        return responses[0]
+
+    async def send_commands(self, commands, window=None):
+        # Pipelined burst: keep up to `window` commands in flight, replies
+        # are matched in FIFO order
+        window = window or self.window
+        responses = []
+        async with self._exclusive():
+            for start in range(0, len(commands), window):
+                chunk = commands[start:start + window]
+                await self._wait_min_gap()
+                self._discard_stale()
+                for command in chunk:
+                    self._write_command(command)
+                responses += await self._read_replies(len(chunk), self.timeout, chunk)
+        return responses
+
+    async def close(self):
+        if self.ser.is_open:
+            self._loop.remove_reader(self.ser.fileno())
+            self.ser.close()
+            if parameters.DEBUG: print("Serial port closed.")
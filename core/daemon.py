@@ -0,0 +1,364 @@
+"""Local control daemon: one process owns the serial port, others connect.
+
+    python -m core.daemon /dev/ttyUSB0 --socket /tmp/jds6600.sock
+
+Clients talk to it over a Unix socket with DaemonConnection, which has the
+SerialConnection interface, so the usual classes work unchanged:
+
+    conn = DaemonConnection('/tmp/jds6600.sock')
+    signal_gen_read = signalGenerator_read(conn)
+
+Frames are a small binary header plus the command text:
+
+    request:  <B op> <f timeout, 0 = default> <I length> <payload>
+    reply:    <B status> <I length> <payload>
+
+While a request waits for the port, a read of a register that is already
+queued joins the queued read, and a write to a register with a queued
+write replaces that write's value (all callers get the one reply). Single
+commands from different clients are sent to the device as one pipelined
+burst; bursts (apply()) and raw lines stay atomic. A client inside
+DaemonConnection.transaction() holds the device: until it ends, only that
+client's requests are served and nothing is coalesced.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from core.device.readFunctions import signalGenerator_read
+from core.device.writeFunctions import signalGenerator_write
+from core.device.registerCache import split_command
+from core.utils.utils import parameters
+
+DEFAULT_SOCKET = '/tmp/jds6600.sock'
+
+REQUEST = struct.Struct('<BfI')
+REPLY = struct.Struct('<BI')
+OP_COMMAND = 1
+OP_BATCH = 2   # commands separated by '\n', replies likewise
+OP_RAW = 3     # pre-encoded line, terminator included
+OP_BEGIN = 4   # hold the device for this client until OP_END
+OP_END = 5
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+
+class DaemonError(RuntimeError):
+    """The daemon could not execute a request (e.g. the port failed)."""
+
+
+class _Slot:
+    # One queued device operation and everyone waiting for its reply
+    __slots__ = ('op', 'key', 'payload', 'timeout', 'owner', 'futures')
+
+    def __init__(self, op, key, payload, timeout, owner, future):
+        self.op = op
+        self.key = key          # ('r'|'w', register) for single reads/writes, else None
+        self.payload = payload
+        self.timeout = timeout
+        self.owner = owner      # client that queued it, for transactions
+        self.futures = [future]
+
+
+class ControlDaemon:
+    """Serves one SerialConnection to many local clients."""
+    def __init__(self, serial_connection, path=DEFAULT_SOCKET):
+        self.serial_connection = serial_connection
+        self.path = path
+        self.stats = {'requests': 0, 'device_commands': 0, 'coalesced_reads': 0, 'merged_writes': 0,
+                      'transactions': 0}
+        self._queue = []
+        self._holder = None  # client inside a transaction
+        self._wakeup = None
+        self._server = None
+        self._dispatcher = None
+        # All port I/O on one thread, the event loop only moves frames
+        self._port_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix='jds6600-daemon')
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # left over from a previous run
+        self._wakeup = asyncio.Event()
+        self._server = await asyncio.start_unix_server(self._serve_client, path=self.path)
+        self._dispatcher = asyncio.create_task(self._dispatch())
+        if parameters.DEBUG: print(f"Daemon listening on {self.path}")
+        return self
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+        self._dispatcher.cancel()
+        self._port_thread.shutdown(wait=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def _serve_client(self, reader, writer):
+        owner = object()
+        try:
+            while True:
+                header = await reader.readexactly(REQUEST.size)
+                op, timeout, length = REQUEST.unpack(header)
+                payload = await reader.readexactly(length)
+                try:
+                    reply = await self.submit(op, payload, timeout or None, owner)
+                    frame = REPLY.pack(STATUS_OK, len(reply)) + reply
+                except Exception as e:
+                    message = f"{type(e).__name__}: {e}".encode()
+                    frame = REPLY.pack(STATUS_ERROR, len(message)) + message
+                writer.write(frame)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if self._holder is owner:
+                # Client went away inside a transaction
+                self._holder = None
+                self._wakeup.set()
+            writer.close()
+
+    def submit(self, op, payload, timeout=None, owner=None):
+        # Queue a request, returns a future for the reply bytes
+        future = asyncio.get_running_loop().create_future()
+        self.stats['requests'] += 1
+        key = None
+        if op == OP_COMMAND:
+            kind, register, _ = split_command(payload.decode())
+            if kind in ('r', 'w'):
+                key = (kind, register)
+        if key is not None and self._merge(key, payload, timeout, future):
+            return future
+        self._queue.append(_Slot(op, key, payload, timeout, owner, future))
+        self._wakeup.set()
+        return future
+
+    def _merge(self, key, payload, timeout, future):
+        # Join a queued read of the same register, or overwrite a queued
+        # write to it, unless a later queued operation touches the register.
+        # Never while a transaction holds the device: the slot joined could
+        # be one that waits for the transaction to end.
+        if self._holder is not None:
+            return False
+        kind, register = key
+        for slot in reversed(self._queue):
+            if slot.key is None:
+                if slot.op != OP_COMMAND:
+                    return False  # don't move across a burst or raw line
+                continue
+            if slot.key[1] != register:
+                continue
+            if slot.key[0] != kind:
+                return False
+            if kind == 'r':
+                self.stats['coalesced_reads'] += 1
+            else:
+                slot.payload = payload
+                self.stats['merged_writes'] += 1
+            slot.timeout = max(slot.timeout or 0, timeout or 0) or None
+            slot.futures.append(future)
+            return True
+        return False
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while True:
+                slots = self._take()
+                if not slots:
+                    break
+                if slots[0].op in (OP_BEGIN, OP_END):
+                    self._hold(slots[0])
+                    continue
+                if slots[0].op == OP_COMMAND:
+                    work = lambda slots=slots: self._run_commands(slots)
+                else:
+                    work = lambda slot=slots[0]: self._run_single(slot)
+                try:
+                    replies = await loop.run_in_executor(self._port_thread, work)
+                except Exception as e:
+                    for slot in slots:
+                        for future in slot.futures:
+                            if not future.done():
+                                future.set_exception(e)
+                    continue
+                for slot, reply in zip(slots, replies):
+                    for future in slot.futures:
+                        if not future.done():
+                            future.set_result(reply)
+
+    def _take(self):
+        # Next slots to run. During a transaction only the holder's requests
+        # are served; otherwise consecutive single commands go out as one
+        # pipelined burst.
+        if self._holder is not None:
+            for i, slot in enumerate(self._queue):
+                if slot.owner is self._holder:
+                    return [self._queue.pop(i)]
+            return []
+        if not self._queue:
+            return []
+        if self._queue[0].op == OP_COMMAND:
+            count = next((i for i, slot in enumerate(self._queue) if slot.op != OP_COMMAND), len(self._queue))
+            slots, self._queue = self._queue[:count], self._queue[count:]
+            return slots
+        return [self._queue.pop(0)]
+
+    def _hold(self, slot):
+        if slot.op == OP_BEGIN:
+            self._holder = slot.owner
+            self.stats['transactions'] += 1
+        elif self._holder is slot.owner:
+            self._holder = None
+        for future in slot.futures:
+            if not future.done():
+                future.set_result(b'')
+
+    def _run_commands(self, slots):
+        commands = [slot.payload.decode() for slot in slots]
+        self.stats['device_commands'] += len(commands)
+        if len(slots) == 1:
+            return [self.serial_connection.send_command(commands[0], timeout=slots[0].timeout).encode()]
+        return [reply.encode() for reply in self.serial_connection.send_commands(commands)]
+
+    def _run_single(self, slot):
+        if slot.op == OP_BATCH:
+            commands = slot.payload.decode().split('\n')
+            self.stats['device_commands'] += len(commands)
+            return ['\n'.join(self.serial_connection.send_commands(commands)).encode()]
+        if slot.op == OP_RAW:
+            self.stats['device_commands'] += 1
+            return [self.serial_connection.send_raw(slot.payload, timeout=slot.timeout).encode()]
+        raise DaemonError(f"Unknown request type {slot.op}.")
+
+
+class DaemonConnection:
+    """Client side: same interface as SerialConnection, served by the daemon.
+
+    One request at a time per DaemonConnection (calls from several threads
+    are serialised); open one per thread or process for concurrency.
+    transaction() holds the device on the daemon, so a read-modify-write
+    is not interleaved with other clients. priority() is accepted for
+    compatibility but has no effect: the daemon serves requests in the
+    order they arrive.
+
+    If a reply does not arrive within `timeout` seconds (for example while
+    another client holds a transaction), the late reply would be read as
+    the answer to the next request, so the socket is closed and every
+    further request raises DaemonError; open a new DaemonConnection.
+    """
+    def __init__(self, path=DEFAULT_SOCKET, timeout=5):
+        self.path = path
+        self.timeout = timeout
+        self.metrics = None
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._broken = None
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        self._sock.connect(path)
+
+    def _receive(self, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self._sock.recv(size - len(data))
+            if not chunk:
+                raise DaemonError("Daemon closed the connection.")
+            data += chunk
+        return bytes(data)
+
+    def _request(self, op, payload, timeout=None):
+        with self._lock:
+            if self._broken:
+                raise DaemonError(f"Connection to the daemon is unusable: {self._broken}")
+            try:
+                # Never give up on a reply sooner than the device read it waits for
+                self._sock.settimeout(max(self.timeout, timeout or 0))
+                self._sock.sendall(REQUEST.pack(op, timeout or 0, len(payload)) + payload)
+                status, length = REPLY.unpack(self._receive(REPLY.size))
+                reply = self._receive(length).decode()
+            except Exception as e:
+                # Part of a frame may still be on its way: the socket is out of step
+                self._broken = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+                self._sock.close()
+                raise
+        if status != STATUS_OK:
+            raise DaemonError(reply)
+        return reply
+
+    @contextmanager
+    def transaction(self):
+        # Re-entrant; other threads using this connection wait as well
+        with self._lock:
+            if not self._depth:
+                self._request(OP_BEGIN, b'')
+            self._depth += 1
+            try:
+                yield self
+            finally:
+                self._depth -= 1
+                if not self._depth and not self._broken:
+                    self._request(OP_END, b'')
+
+    @contextmanager
+    def priority(self):
+        yield self
+
+    def send_command(self, command, timeout=None):
+        return self._request(OP_COMMAND, command.encode(), timeout)
+
+    def send_commands(self, commands, window=None):
+        if not commands:
+            return []
+        return self._request(OP_BATCH, '\n'.join(commands).encode()).split('\n')
+
+    def send_raw(self, data, timeout=None):
+        return self._request(OP_RAW, bytes(data), timeout)
+
+    def close(self):
+        self._sock.close()
+
+
+class DaemonClient:
+    # Reader/writer pair on a daemon connection, like PoolDevice
+    def __init__(self, path=DEFAULT_SOCKET, timeout=5):
+        self.serial_connection = DaemonConnection(path, timeout)
+        self.read = signalGenerator_read(self.serial_connection)
+        self.write = signalGenerator_write(self.serial_connection)
+
+    def close(self):
+        self.serial_connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def main(argv=None):  # pragma: no cover - runs until interrupted
+    from core.serialHandler import SerialConnection
+    parser = argparse.ArgumentParser(description="Share one JDS6600 between local processes.")
+    parser.add_argument('port', help="serial port of the generator")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help="Unix socket path")
+    options = parser.parse_args(argv)
+    serial_conn = SerialConnection(options.port)
+    try:
+        asyncio.run(ControlDaemon(serial_conn, options.socket).serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        serial_conn.close()
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
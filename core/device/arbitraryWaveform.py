@@ -0,0 +1,75 @@
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - only needed for waveform upload
+    np = None
+
+# Arbitrary waveform memory: 60 slots of 2048 points, 12 bit each
+ARB_SLOTS = 60
+ARB_POINTS = 2048
+ARB_MAX = 4095
+# Reading a slot back is ~10 kB at 115200 baud, about 0.9 s on the wire
+ARB_TRANSFER_TIMEOUT = 3
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("Arbitrary waveform upload requires numpy (pip install numpy).")
+
+
+def _check_slot(slot):
+    if not (1 <= slot <= ARB_SLOTS):
+        raise ValueError("Invalid arbitrary waveform number. Use a value between 1 and 60.")
+
+
+def quantise(data, normalize=False):
+    """Resample and quantise a waveform to the device's 2048 x 12 bit format.
+
+    data is an array of floats in -1..1 (one period, any length) or a
+    function evaluated on 2048 phase points in [0, 1). With normalize=True
+    the data's own min..max is stretched to the full range instead.
+    Returns a uint16 array of 2048 codes in 0..4095.
+    """
+    _require_numpy()
+    if callable(data):
+        samples = np.asarray(data(np.arange(ARB_POINTS) / ARB_POINTS), dtype=float)
+    else:
+        samples = np.asarray(data, dtype=float).ravel()
+    if samples.size < 2:
+        raise ValueError("A waveform needs at least 2 samples.")
+    if samples.size != ARB_POINTS:
+        # Linear resampling over one period
+        positions = np.arange(ARB_POINTS) * (samples.size / ARB_POINTS)
+        samples = np.interp(positions, np.arange(samples.size), samples, period=samples.size)
+    if normalize:
+        low, high = samples.min(), samples.max()
+        samples = (samples - low) / (high - low) * 2 - 1 if high > low else np.zeros_like(samples)
+    codes = np.rint((np.clip(samples, -1.0, 1.0) + 1.0) * (ARB_MAX / 2))
+    return codes.astype(np.uint16)
+
+
+def encode_upload(slot, codes):
+    # One ':aNN=v1,v2,...,v2048.' line, terminator included
+    _check_slot(slot)
+    if len(codes) != ARB_POINTS:
+        raise ValueError("Arbitrary waveforms have exactly 2048 points.")
+    payload = ','.join(map(str, codes.tolist() if hasattr(codes, 'tolist') else codes))
+    return f':a{slot:02d}={payload}.\r\n'.encode()
+
+
+def decode_readback(response):
+    # ':bNN=v1,...,v2048.' -> uint16 array. numpy parses the text in C, no
+    # Python object is created per value.
+    _require_numpy()
+    start = response.find('=') + 1
+    end = len(response.rstrip())
+    if response[end - 1:end] == '.':
+        end -= 1
+    if not start or response.count(',', start, end) != ARB_POINTS - 1:
+        raise ValueError("Invalid response format.")
+    try:
+        codes = np.fromstring(response[start:end], dtype=np.int32, sep=',')
+    except ValueError:
+        raise ValueError("Invalid response format.")
+    if codes.size != ARB_POINTS or codes.min() < 0 or codes.max() > 0xFFFF:
+        raise ValueError("Invalid response format.")
+    return codes.astype(np.uint16)
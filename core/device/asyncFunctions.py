@@ -0,0 +1,138 @@
+import time
+from core.device.readFunctions import signalGenerator_read
+from core.device.writeFunctions import signalGenerator_write
+from core.device.snapshot import SNAPSHOT_COMMANDS, decode_snapshot
+from core.measurement import measurement_command
+from core.device.arbitraryWaveform import quantise, ARB_TRANSFER_TIMEOUT
+from core.utils.utils import parameters
+from logger import test_logger
+
+class asyncSignalGenerator_write(signalGenerator_write):
+    """Awaitable version of signalGenerator_write for an AsyncSerialConnection.
+
+    Validation, command encoding and the cache/priority options are
+    inherited unchanged, only the transport calls are awaited.
+    """
+    def __init__(self, serial_connection, cache=None, priority=False):
+        super().__init__(serial_connection, cache, priority)
+
+    async def _send_command(self, command):
+        if self.cache is not None and self._skip(command):
+            return ':ok'
+        with self._lane():
+            response = await self.serial_connection.send_command(command)
+        if self.cache is not None:
+            self._record(command, response)
+        return response
+
+    async def _send_commands(self, commands):
+        if self.cache is None:
+            with self._lane():
+                return await self.serial_connection.send_commands(commands)
+        responses, pending = self._pending(commands)
+        with self._lane():
+            sent = await self.serial_connection.send_commands(pending) if pending else []
+        return self._merge_sent(commands, responses, sent)
+
+    async def set_channel_enable(self, *channels):
+        return await self._send_command(self._encode_channel_enable(*channels))
+
+    async def set_waveform(self, channel_num, waveform):
+        return await self._send_command(self._encode_waveform(channel_num, waveform))
+
+    async def set_arbitrary_waveform(self, channel_num, waveform_num):
+        return await self._send_command(self._encode_arbitrary_waveform(channel_num, waveform_num))
+
+    async def upload_arbitrary_waveform(self, waveform_num, data, normalize=False):
+        return await self.upload_arbitrary_codes(waveform_num, quantise(data, normalize))
+
+    async def upload_arbitrary_codes(self, waveform_num, codes):
+        command = self._encode_upload(waveform_num, codes)
+        return await self.serial_connection.send_raw(command, timeout=ARB_TRANSFER_TIMEOUT)
+
+    async def set_frequency(self, channel_num, frequency, unit):
+        return await self._send_command(self._encode_frequency(channel_num, frequency, unit))
+
+    async def set_amplitude(self, channel_num, amplitude_value, amplitude_unit):
+        return await self._send_command(self._encode_amplitude(channel_num, amplitude_value, amplitude_unit))
+
+    async def set_offset(self, channel_num, offset_value, offset_unit):
+        return await self._send_command(self._encode_offset(channel_num, offset_value, offset_unit))
+
+    async def set_duty_cycle(self, channel_num, duty_cycle):
+        return await self._send_command(self._encode_duty_cycle(channel_num, duty_cycle))
+
+    async def set_phase(self, channel_num, phase):
+        return await self._send_command(self._encode_phase(channel_num, phase))
+
+    async def apply(self, channel_num, config=None):
+        commands = self._encode_apply(channel_num, config)
+        if parameters.TEST: test_logger.info("Applying configuration: %s", commands)
+        responses = await self._send_commands(commands)
+        return {int(command[2:4]): response for command, response in zip(commands, responses)}
+
+
+class asyncSignalGenerator_read(signalGenerator_read):
+    """Awaitable version of signalGenerator_read for an AsyncSerialConnection."""
+    def __init__(self, serial_connection, cache=None, max_age=0.0):
+        super().__init__(serial_connection, cache, max_age)
+
+    async def _send_command(self, command):
+        if self.cache is None:
+            return await self.serial_connection.send_command(command)
+        response = self._cached_response(command)
+        if response is None:
+            response = await self.serial_connection.send_command(command)
+            self._update_cache([response])
+        return response
+
+    async def _send_commands(self, commands):
+        return await self.serial_connection.send_commands(commands)
+
+    async def getSerialnumber(self) -> str:
+        return (await self._send_command(':r00=')).strip()
+
+    async def getDevicetype(self) -> str:
+        return (await self._send_command(':r01=')).strip()
+
+    async def snapshot(self):
+        timestamp = time.monotonic()
+        responses = await self._send_commands(SNAPSHOT_COMMANDS)
+        self._update_cache(responses)
+        try:
+            return decode_snapshot(responses, timestamp)
+        except ValueError:
+            self._count_malformed('snapshot')
+            raise
+
+    async def get_channel_enable(self) -> str:
+        return self._report_channel_enable(await self._send_command(':r20='))
+
+    async def get_waveform(self, channel_num) -> str:
+        return self._report_waveform(await self._send_command(self._read_command('waveform', channel_num)))
+
+    async def get_arbitrary_waveform(self, channel_num) -> str:
+        return self._report_arbitrary_waveform(await self._send_command(self._read_command('arbitrary_readback', channel_num)))
+
+    async def get_arbitrary_waveform_data(self, waveform_num):
+        command = self._arbitrary_readback_command(waveform_num)
+        response = await self.serial_connection.send_command(command, timeout=ARB_TRANSFER_TIMEOUT)
+        return self._report_arbitrary_waveform_data(waveform_num, response)
+
+    async def get_measurement(self, name) -> float:
+        return self._report_measurement(name, await self.serial_connection.send_command(measurement_command(name)))
+
+    async def get_frequency(self, channel_num) -> str:
+        return self._report_frequency(await self._send_command(self._read_command('frequency', channel_num)))
+
+    async def get_amplitude(self, channel_num) -> str:
+        return self._report_amplitude(await self._send_command(self._read_command('amplitude', channel_num)))
+
+    async def get_offset(self, channel_num) -> str:
+        return self._report_offset(await self._send_command(self._read_command('offset', channel_num)))
+
+    async def get_duty_cycle(self, channel_num) -> str:
+        return self._report_duty_cycle(await self._send_command(self._read_command('duty_cycle', channel_num)))
+
+    async def get_phase(self, channel_num) -> str:
+        return self._report_phase(await self._send_command(self._read_command('phase', channel_num)))
@@ -0,0 +1,14 @@
+from dataclasses import dataclass
+from typing import Optional
+
+@dataclass(frozen=True)
+class ChannelConfig:
+    # Settings for one channel, fields left as None are not written.
+    # Units: Hz, V, V, percent and degrees.
+    waveform: Optional[int] = None
+    frequency: Optional[float] = None
+    amplitude: Optional[float] = None
+    offset: Optional[float] = None
+    duty_cycle: Optional[float] = None
+    phase: Optional[float] = None
+    enable: Optional[bool] = None
@@ -1,23 +1,60 @@
 import serial
 import time
-from core.utils.utils import amplitude, channel, unit, waveform, parameters
+from core.utils.utils import amplitude, channel, unit, waveform
 from core.serialHandler import SerialConnection
-from logger import test_logger
+from logger import get_logger
+from core.device.registerCache import split_command
+from core.device.registerMap import ENCODER
+from core.device.snapshot import SNAPSHOT_COMMANDS, decode_snapshot
+from core.measurement import MeasurementStream, measurement_command, decode_measurement
+from core.device.arbitraryWaveform import decode_readback, ARB_SLOTS, ARB_TRANSFER_TIMEOUT
+
+# Getter traces, enable with logger.set_level(logging.DEBUG, 'core.device.readFunctions')
+log = get_logger(__name__)
 
 class signalGenerator_read:
-    def __init__(self, serial_connection):
+    def __init__(self, serial_connection, cache=None, max_age=0.0):
+        # cache:   optional RegisterCache shared with the writer
+        # max_age: answer getters from the cache when the entry is at most
+        #          this many seconds old, None accepts any age
         self.serial_connection = serial_connection
+        self.cache = cache
+        self.max_age = max_age
 
     def _send_command(self, command):
-        return self.serial_connection.send_command(command)
+        if self.cache is None:
+            return self.serial_connection.send_command(command)
+        response = self._cached_response(command)
+        if response is None:
+            response = self.serial_connection.send_command(command)
+            self._update_cache([response])
+        return response
+
+    def _cached_response(self, command):
+        # Reply built from a fresh enough cache entry, None to ask the device
+        kind, register, _ = split_command(command)
+        payload = self.cache.get(register, self.max_age)
+        if payload is None:
+            return None
+        return f':r{register:02d}={payload}.'
+
+    def _send_commands(self, commands):
+        return self.serial_connection.send_commands(commands)
     
     def _parse_response(self, response: str) -> float:
         try:
             value = response.split('=')[1].strip().strip('.').replace(',', '.')
             return float(value)
         except (IndexError, ValueError):
+            self._count_malformed('parse_response')
             raise ValueError("Invalid response format.")
 
+    def _count_malformed(self, operation):
+        # Feeds the connection's CommandMetrics, if it has any
+        metrics = getattr(self.serial_connection, 'metrics', None)
+        if metrics is not None:
+            metrics.observe_malformed(operation)
+
     def getSerialnumber(self) -> str:
         response = self._send_command(':r00=')
         return response.strip()
@@ -26,12 +63,43 @@ class signalGenerator_read:
         response = self._send_command(':r01=')
         return response.strip()
 
+    def _read_command(self, name, channel_num):
+        return ENCODER.read_command(name, channel_num)
+
+    def _decode(self, name, response):
+        # ':r23=100000,0.' -> value in the register table's unit (Hz here)
+        try:
+            return ENCODER.decode(name, response.split('=', 1)[1])
+        except (IndexError, ValueError):
+            self._count_malformed(name)
+            raise ValueError("Invalid response format.")
+
+    def snapshot(self):
+        # Full state of both channels in one pipelined burst, decoded into a
+        # Snapshot. Nothing is printed or logged, so it is cheap to poll.
+        timestamp = time.monotonic()
+        responses = self._send_commands(SNAPSHOT_COMMANDS)
+        self._update_cache(responses)
+        try:
+            return decode_snapshot(responses, timestamp)
+        except ValueError:
+            self._count_malformed('snapshot')
+            raise
+
+    def _update_cache(self, responses):
+        if self.cache is None:
+            return
+        for response in responses:
+            kind, register, payload = split_command(response)
+            if kind == 'r' and payload:
+                self.cache.update(register, payload)
+
     def get_channel_enable(self) -> str:
-        response = self._send_command(':r20=')
-        
+        return self._report_channel_enable(self._send_command(':r20='))
+
+    def _report_channel_enable(self, response) -> str:
         # Log the response for debugging
-        if parameters.DEBUG: print(f"Response for get_channel_enable: {response}")
-        if parameters.TEST: test_logger.info(f"Response for get_channel_enable: {response}")
+        log.debug("Response for get_channel_enable: %s", response)
         
         # Parse the response
         try:
@@ -39,30 +107,25 @@ class signalGenerator_read:
             ch1_enable = int(values[0])
             ch2_enable = int(values[1])
         except (IndexError, ValueError):
+            self._count_malformed('channel_enable')
             raise ValueError("Invalid response format.")
         
         ch1_status = "CH1 - ON" if ch1_enable else "CH1 - OFF"
         ch2_status = "CH2 - ON" if ch2_enable else "CH2 - OFF"
         
-        if parameters.DEBUG: print(f"{ch1_status},\n{ch2_status}")
-        if parameters.TEST: test_logger.info(f"{ch1_status}, {ch2_status}")
+        log.debug("%s, %s", ch1_status, ch2_status)
         
         return response
 
     def get_waveform(self, channel_num) -> str:
-        if channel_num == channel.CH1:
-            response = self._send_command(':r21=')
-        elif channel_num == channel.CH2:
-            response = self._send_command(':r22=')
-        else:
-            raise ValueError("Invalid channel. Use channel.CH1 or channel.CH2.")
-        
+        return self._report_waveform(self._send_command(self._read_command('waveform', channel_num)))
+
+    def _report_waveform(self, response) -> str:
         # Log the response for debugging
-        if parameters.DEBUG: print(f"Response for get_waveform: {response}")
-        if parameters.TEST: test_logger.info(f"Response for get_waveform: {response}")
+        log.debug("Response for get_waveform: %s", response)
         
         # Parse the response
-        waveform_value = self._parse_response(response)
+        waveform_value = self._decode('waveform', response)
         
         # Mapping of waveform types to their names
         waveform_types = {
@@ -87,45 +150,67 @@ class signalGenerator_read:
         
         waveform_name = waveform_types.get(waveform_value, "UNKNOWN")
         
-        if parameters.DEBUG: print(f"Waveform value: {waveform_name}")
-        if parameters.TEST: test_logger.info(f"Waveform value: {waveform_name}")
+        log.debug("Waveform value: %s", waveform_name)
         
         return response
 
     def get_arbitrary_waveform(self, channel_num) -> str:
-        if channel_num == channel.CH1:
-            response = self._send_command(':r33=')
-        elif channel_num == channel.CH2:
-            response = self._send_command(':r34=')
-        else:
-            raise ValueError("Invalid channel. Use channel.CH1 or channel.CH2.")
-        
+        return self._report_arbitrary_waveform(self._send_command(self._read_command('arbitrary_readback', channel_num)))
+
+    def _report_arbitrary_waveform(self, response) -> str:
         # Log the response for debugging
-        if parameters.DEBUG: print(f"Response for get_arbitrary_waveform: {response}")
-        if parameters.TEST: test_logger.info(f"Response for get_arbitrary_waveform: {response}")
+        log.debug("Response for get_arbitrary_waveform: %s", response)
         
         # Parse the response
         arbitrary_waveform_value = self._parse_response(response)
         
-        if parameters.DEBUG: print(f"Arbitrary waveform value: {arbitrary_waveform_value}")
-        if parameters.TEST: test_logger.info(f"Arbitrary waveform value: {arbitrary_waveform_value}")
+        log.debug("Arbitrary waveform value: %s", arbitrary_waveform_value)
         
         return response
 
+    def get_measurement(self, name) -> float:
+        # One measurement page reading ('frequency', 'period', ...), SI units
+        return self._report_measurement(name, self.serial_connection.send_command(measurement_command(name)))
+
+    def _report_measurement(self, name, response) -> float:
+        try:
+            return decode_measurement(name, response)
+        except ValueError:
+            self._count_malformed(name)
+            raise
+
+    def measurement_stream(self, quantities=('frequency',), rate=10.0, decimation=1):
+        # Timed polling of the measurement page, see core.measurement
+        return MeasurementStream(self.serial_connection, quantities, rate, decimation)
+
+    def get_arbitrary_waveform_data(self, waveform_num):
+        # Read the 2048 points stored in arbitrary slot 1..60 (uint16 array)
+        command = self._arbitrary_readback_command(waveform_num)
+        response = self.serial_connection.send_command(command, timeout=ARB_TRANSFER_TIMEOUT)
+        return self._report_arbitrary_waveform_data(waveform_num, response)
+
+    def _arbitrary_readback_command(self, waveform_num):
+        if not (1 <= waveform_num <= ARB_SLOTS):
+            raise ValueError("Invalid arbitrary waveform number. Use a value between 1 and 60.")
+        return f':b{waveform_num:02d}='
+
+    def _report_arbitrary_waveform_data(self, waveform_num, response):
+        log.debug("Read back arbitrary waveform %s: %s bytes", waveform_num, len(response))
+        try:
+            return decode_readback(response)
+        except ValueError:
+            self._count_malformed('arbitrary_readback')
+            raise
+
     def get_frequency(self, channel_num) -> str:
-        if channel_num == channel.CH1:
-            response = self._send_command(':r23=')
-        elif channel_num == channel.CH2:
-            response = self._send_command(':r24=')
-        else:
-            raise ValueError("Invalid channel. Use channel.CH1 or channel.CH2.")
-        
+        return self._report_frequency(self._send_command(self._read_command('frequency', channel_num)))
+
+    def _report_frequency(self, response) -> str:
         # Log the response for debugging
-        if parameters.DEBUG: print(f"Response for get_frequency: {response}")
-        if parameters.TEST: test_logger.info(f"Response for get_frequency: {response}")
+        log.debug("Response for get_frequency: %s", response)
         
         # Parse the response
-        frequency_value = self._parse_response(response)
+        frequency_value = self._decode('frequency', response)
         
         if frequency_value >= 1000000:
             frequency_value /= 1000000
@@ -136,113 +221,68 @@ class signalGenerator_read:
         else:
             unit = "Hz"
         
-        if parameters.DEBUG: print(f"Frequency value: {frequency_value} {unit}")
-        if parameters.TEST: test_logger.info(f"Frequency value: {frequency_value} {unit}")
+        log.debug("Frequency value: %s %s", frequency_value, unit)
         
         return response
 
     def get_amplitude(self, channel_num) -> str:
-        if channel_num == channel.CH1:
-            response = self._send_command(':r25=')
-        elif channel_num == channel.CH2:
-            response = self._send_command(':r26=')
-        else:
-            raise ValueError("Invalid channel. Use channel.CH1 or channel.CH2.")
-        
+        return self._report_amplitude(self._send_command(self._read_command('amplitude', channel_num)))
+
+    def _report_amplitude(self, response) -> str:
         # Log the response for debugging
-        if parameters.DEBUG: print(f"Response for get_amplitude: {response}")
-        if parameters.TEST: test_logger.info(f"Response for get_amplitude: {response}")
+        log.debug("Response for get_amplitude: %s", response)
         
         # Parse the response
-        amplitude_value = self._parse_response(response)
-        
-        if amplitude_value >= 1000:
-            amplitude_value = amplitude_value / 1000
-            unit = amplitude.VOLT
-        else:
-            unit = amplitude.MILLIVOLT
+        amplitude_value = self._decode('amplitude', response)
         
-        if unit == amplitude.VOLT:
-            if parameters.DEBUG: print(f"Amplitude value: {amplitude_value} V")
-            if parameters.TEST: test_logger.info(f"Amplitude value: {amplitude_value} V")
+        if amplitude_value >= 1:
+            log.debug("Amplitude value: %s V", amplitude_value)
         else:
-            if parameters.DEBUG: print(f"Amplitude value: {amplitude_value} mV")
-            if parameters.TEST: test_logger.info(f"Amplitude value: {amplitude_value} mV")
+            log.debug("Amplitude value: %s mV", amplitude_value * 1000)
         
         return response
 
     def get_offset(self, channel_num) -> str:
-        if channel_num == channel.CH1:
-            response = self._send_command(':r27=')
-        elif channel_num == channel.CH2:
-            response = self._send_command(':r28=')
-        else:
-            raise ValueError("Invalid channel. Use channel.CH1 or channel.CH2.")
-        
+        return self._report_offset(self._send_command(self._read_command('offset', channel_num)))
+
+    def _report_offset(self, response) -> str:
         # Log the response for debugging
-        if parameters.DEBUG: print(f"Response for get_offset: {response}")
-        if parameters.TEST: test_logger.info(f"Response for get_offset: {response}")
+        log.debug("Response for get_offset: %s", response)
         
         # Parse the response
-        offset_value = self._parse_response(response)
-        
-        offset_value = (offset_value - 1000) / 100.0
+        offset_value = self._decode('offset', response)
         
         if abs(offset_value) >= 1:
-            unit = amplitude.VOLT
-        else:
-            unit = amplitude.MILLIVOLT
-        
-        if unit == amplitude.VOLT:
-            if parameters.DEBUG: print(f"Offset value: {offset_value} V")
-            if parameters.TEST: test_logger.info(f"Offset value: {offset_value} V")
+            log.debug("Offset value: %s V", offset_value)
         else:
-            if parameters.DEBUG: print(f"Offset value: {offset_value * 1000} mV")
-            if parameters.TEST: test_logger.info(f"Offset value: {offset_value * 1000} mV")
+            log.debug("Offset value: %s mV", offset_value * 1000)
         
         return response
 
     def get_duty_cycle(self, channel_num) -> str:
-        if channel_num == channel.CH1:
-            response = self._send_command(':r29=')
-        elif channel_num == channel.CH2:
-            response = self._send_command(':r30=')
-        else:
-            raise ValueError("Invalid channel. Use channel.CH1 or channel.CH2.")
-        
+        return self._report_duty_cycle(self._send_command(self._read_command('duty_cycle', channel_num)))
+
+    def _report_duty_cycle(self, response) -> str:
         # Log the response for debugging
-        if parameters.DEBUG: print(f"Response for get_duty_cycle: {response}")
-        if parameters.TEST: test_logger.info(f"Response for get_duty_cycle: {response}")
+        log.debug("Response for get_duty_cycle: %s", response)
         
         # Parse the response
-        duty_cycle = self._parse_response(response) / 10.0
+        duty_cycle = self._decode('duty_cycle', response)
         
-        if parameters.DEBUG: print(f"Duty cycle value: {duty_cycle}%")
-        if parameters.TEST: test_logger.info(f"Duty cycle value: {duty_cycle}%")
+        log.debug("Duty cycle value: %s%%", duty_cycle)
         
         return response
 
     def get_phase(self, channel_num) -> str:
-        if channel_num == channel.CH1:
-            response = self._send_command(':r31=')
-        elif channel_num == channel.CH2:
-            response = self._send_command(':r32=')
-        else:
-            raise ValueError("Invalid channel. Use channel.CH1 or channel.CH2.")
-        
+        return self._report_phase(self._send_command(self._read_command('phase', channel_num)))
+
+    def _report_phase(self, response) -> str:
         # Log the response for debugging
-        if parameters.DEBUG: print(f"Response for get_phase: {response}")
-        if parameters.TEST: test_logger.info(f"Response for get_phase: {response}")
+        log.debug("Response for get_phase: %s", response)
         
         # Parse the response
-        phase_value = self._parse_response(response)
-        
-        if phase_value > 3600:
-            phase_value -= 3600
-        
-        phase_value = phase_value / 10.0
+        phase_value = self._decode('phase', response)
         
-        if parameters.DEBUG: print(f"Phase value: {phase_value} deg")
-        if parameters.TEST: test_logger.info(f"Phase value: {phase_value} deg")
+        log.debug("Phase value: %s deg", phase_value)
         
         return response
\ No newline at end of file
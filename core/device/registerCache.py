@@ -0,0 +1,64 @@
+import time
+
+# Channel setting registers shadowed by the cache (w20 enable .. w32 phase CH2)
+CACHED_REGISTERS = range(20, 33)
+
+
+def split_command(command):
+    # ':w23=100000,0.' -> ('w', 23, '100000,0'), also used for ':r23=...' replies
+    try:
+        kind = command[1]
+        register = int(command[2:4])
+        payload = command.split('=', 1)[1].strip().rstrip('.')
+    except (IndexError, ValueError):
+        return None, None, None
+    return kind, register, payload
+
+
+class RegisterCache:
+    """Host-side shadow of the device's channel registers.
+
+    Holds the last payload written to or read from each register together
+    with the time it was stored. Share one instance between the
+    signalGenerator_write and signalGenerator_read of the same device.
+    """
+    def __init__(self):
+        self._values = {}
+
+    def get(self, register, max_age=None):
+        # Returns the cached payload, or None if missing or older than max_age
+        entry = self._values.get(register)
+        if entry is None:
+            return None
+        payload, stamp = entry
+        if max_age is not None and time.monotonic() - stamp > max_age:
+            return None
+        return payload
+
+    def update(self, register, payload):
+        if register in CACHED_REGISTERS:
+            self._values[register] = (payload, time.monotonic())
+
+    def matches(self, register, payload):
+        entry = self._values.get(register)
+        return entry is not None and entry[0] == payload
+
+    def invalidate(self, register=None):
+        # Forget one register, or everything (e.g. after front panel use)
+        if register is None:
+            self._values.clear()
+        else:
+            self._values.pop(register, None)
+
+    def resync(self, serial_connection):
+        # Re-read every cached register from the device in one burst
+        self._values.clear()
+        commands = [f':r{register:02d}=' for register in CACHED_REGISTERS]
+        for response in serial_connection.send_commands(commands):
+            kind, register, payload = split_command(response)
+            if kind == 'r' and payload:
+                self.update(register, payload)
+        return self.as_dict()
+
+    def as_dict(self):
+        return {register: entry[0] for register, entry in self._values.items()}
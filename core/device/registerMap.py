@@ -0,0 +1,168 @@
+from core.utils.utils import channel
+
+CHANNEL_ERROR = "Invalid channel. Use channel.CH1 or channel.CH2."
+
+# Second operand of w23/w24. For Hz, kHz and MHz the first operand is always
+# in 0.01 Hz (the unit only changes the display); mHz and uHz rescale it.
+FREQUENCY_UNIT_SCALE = {0: 1.0, 1: 1.0, 2: 1.0, 3: 1e-3, 4: 1e-6}
+
+
+class Register:
+    """One channel parameter: register numbers, scaling and valid range.
+
+    raw = round(value * scale) + offset, after the range check. `wrap` is
+    added to negative values first (phase -90 deg is sent as 270 deg).
+    """
+    __slots__ = ('name', 'numbers', 'scale', 'offset', 'minimum', 'maximum',
+                 'integer', 'wrap', 'suffix', 'error')
+
+    def __init__(self, name, ch1, ch2, scale=1, offset=0, minimum=None, maximum=None,
+                 integer=False, wrap=None, suffix='', error=None):
+        self.name = name
+        self.numbers = {channel.CH1: ch1, channel.CH2: ch2}
+        self.scale = scale
+        self.offset = offset
+        self.minimum = minimum
+        self.maximum = maximum
+        self.integer = integer
+        self.wrap = wrap
+        self.suffix = suffix
+        self.error = error or f"{name} out of range."
+
+    def to_raw(self, value):
+        if self.integer and value != int(value):
+            raise ValueError(self.error)
+        if (self.minimum is not None and value < self.minimum) or \
+                (self.maximum is not None and value > self.maximum):
+            raise ValueError(self.error)
+        if self.wrap is not None and value < 0:
+            value += self.wrap
+        return int(round(value * self.scale)) + self.offset
+
+    def decode(self, payload):
+        # Device payload ('100000,0', '1500', ...) -> value in the table's unit
+        try:
+            fields = payload.strip().rstrip('.').split(',')
+            raw = int(fields[0])
+            if self.name == 'frequency' and len(fields) > 1:
+                return raw / self.scale * FREQUENCY_UNIT_SCALE.get(int(fields[1]), 1.0)
+            if self.wrap is not None and raw >= self.wrap * self.scale:
+                raw -= int(self.wrap * self.scale)
+        except (IndexError, ValueError):
+            raise ValueError("Invalid response format.")
+        return (raw - self.offset) / self.scale
+
+
+# Channel parameters in SI-style units: Hz, V, percent, degrees
+REGISTERS = {register.name: register for register in (
+    Register('waveform', 21, 22, minimum=0, maximum=16, integer=True,
+             error="Invalid waveform. Use a value between 0 and 16."),
+    Register('arbitrary_waveform', 21, 22, offset=100, minimum=1, maximum=60, integer=True,
+             error="Invalid arbitrary waveform number. Use a value between 1 and 60."),
+    Register('frequency', 23, 24, scale=100, minimum=0, maximum=60000000, suffix=',0',
+             error="Maximum frequency is 60 MHz."),
+    Register('amplitude', 25, 26, scale=1000, minimum=0,
+             error="Amplitude must not be negative."),
+    Register('offset', 27, 28, scale=100, offset=1000, minimum=-9.99, maximum=9.99,
+             error="Offset value out of range. Must be between -9.99V and 9.99V."),
+    Register('duty_cycle', 29, 30, scale=10, minimum=0, maximum=100,
+             error="Duty cycle out of range. Must be between 0 and 100."),
+    Register('phase', 31, 32, scale=10, minimum=-360, maximum=360, wrap=360,
+             error="Phase value out of range. Must be between -360 and 360 degrees."),
+    Register('arbitrary_readback', 33, 34),
+)}
+
+# Measurement page readouts of the counter input, read-only. Numbers and
+# raw units follow community protocol notes (not in the bundled PDF); the
+# device must be on its measurement page. name -> (register, raw per unit)
+MEASUREMENT_REGISTERS = {
+    'count': (80, 1),               # counter value
+    'frequency': (81, 10),          # 0.1 Hz
+    'pulse_width_high': (83, 1e9),  # ns
+    'pulse_width_low': (84, 1e9),   # ns
+    'period': (85, 1e9),            # ns
+    'duty_cycle': (86, 10),         # 0.1 %
+}
+
+CHANNEL_ENABLE = 20
+# Built-in sweep engine setup, following the community protocol notes (the
+# bundled PDF does not cover it). The sweep channel and start/stop registers
+# are not documented anywhere and are deliberately left out; DeviceSweep
+# takes them from the caller.
+SWEEP_REGISTERS = {
+    'start': 40,       # start frequency, 0.01 Hz, ',0' suffix like w23
+    'stop': 41,        # stop frequency
+    'time': 42,        # sweep time in 0.1 s
+    'direction': 43,   # 0 rising, 1 falling, 2 rising and falling
+    'spacing': 44,     # 0 linear, 1 logarithmic
+}
+# Order used for full channel readback
+CHANNEL_PARAMETERS = ('waveform', 'frequency', 'amplitude', 'offset', 'duty_cycle', 'phase')
+
+
+class CommandEncoder:
+    """Turns (parameter, channel, value) into protocol commands.
+
+    Command prefixes are built once from the register table, and encoded
+    commands are memoised by raw value so repeated values (sweeps, polling,
+    test loops) skip formatting entirely.
+    """
+    CACHE_SIZE = 4096
+
+    def __init__(self, registers=REGISTERS):
+        self.registers = registers
+        self._write_prefix = {}
+        self._read_command = {}
+        for register in registers.values():
+            for channel_num, number in register.numbers.items():
+                self._write_prefix[register.name, channel_num] = f':w{number:02d}='
+                self._read_command[register.name, channel_num] = f':r{number:02d}='
+        self._commands = {}
+        self._lines = {}
+
+    def register_number(self, name, channel_num):
+        try:
+            return self.registers[name].numbers[channel_num]
+        except KeyError:
+            raise ValueError(CHANNEL_ERROR)
+
+    def encode(self, name, channel_num, value):
+        register = self.registers[name]
+        raw = register.to_raw(value)
+        key = (name, channel_num, raw)
+        command = self._commands.get(key)
+        if command is None:
+            try:
+                prefix = self._write_prefix[name, channel_num]
+            except KeyError:
+                raise ValueError(CHANNEL_ERROR)
+            if len(self._commands) >= self.CACHE_SIZE:
+                self._commands.clear()
+            command = self._commands[key] = f'{prefix}{raw}{register.suffix}.'
+        return command
+
+    def encode_line(self, name, channel_num, value):
+        # Same as encode(), as bytes with the line terminator
+        command = self.encode(name, channel_num, value)
+        line = self._lines.get(command)
+        if line is None:
+            if len(self._lines) >= self.CACHE_SIZE:
+                self._lines.clear()
+            line = self._lines[command] = f'{command}\r\n'.encode()
+        return line
+
+    def encode_enable(self, ch1_on, ch2_on):
+        return f':w{CHANNEL_ENABLE}={int(bool(ch1_on))},{int(bool(ch2_on))}.'
+
+    def read_command(self, name, channel_num):
+        try:
+            return self._read_command[name, channel_num]
+        except KeyError:
+            raise ValueError(CHANNEL_ERROR)
+
+    def decode(self, name, payload):
+        return self.registers[name].decode(payload)
+
+
+# Shared by all reader/writer instances so the memoised commands are reused
+ENCODER = CommandEncoder()
@@ -0,0 +1,149 @@
+from dataclasses import dataclass, fields
+from typing import NamedTuple, Optional
+from core.device.channelConfig import ChannelConfig
+from core.device.registerMap import ENCODER, REGISTERS, CHANNEL_ENABLE, CHANNEL_PARAMETERS
+from core.utils.utils import channel
+
+# Waveform register values above this select an arbitrary slot (101..160)
+ARBITRARY_BASE = REGISTERS['arbitrary_waveform'].offset
+
+
+class _Slotted:
+    # Frozen dataclasses with explicit __slots__ (dataclass(slots=True)
+    # needs Python 3.10) can't restore state by setattr, so copy and
+    # pickle rebuild them through the constructor instead
+    __slots__ = ()
+
+    def __reduce__(self):
+        return type(self), tuple(getattr(self, name) for name in self.__slots__)
+
+
+@dataclass(frozen=True)
+class ChannelState(_Slotted):
+    # Decoded state of one channel. Units: Hz, V, V, percent and degrees.
+    # waveform is None while an arbitrary slot is selected and vice versa.
+    __slots__ = ('enable', 'waveform', 'arbitrary_waveform', 'frequency', 'amplitude', 'offset',
+                 'duty_cycle', 'phase')
+    enable: bool
+    waveform: Optional[int]
+    arbitrary_waveform: Optional[int]
+    frequency: float
+    amplitude: float
+    offset: float
+    duty_cycle: float
+    phase: float
+
+    def to_config(self):
+        # Settings that apply() would need to restore this state
+        return ChannelConfig(waveform=self.waveform, frequency=self.frequency, amplitude=self.amplitude,
+                             offset=self.offset, duty_cycle=self.duty_cycle, phase=self.phase,
+                             enable=self.enable)
+
+
+@dataclass(frozen=True)
+class Snapshot(_Slotted):
+    # Both channels read in one burst; timestamp is time.monotonic()
+    __slots__ = ('ch1', 'ch2', 'timestamp')
+    ch1: ChannelState
+    ch2: ChannelState
+    timestamp: float
+
+    def channel(self, channel_num):
+        if channel_num == channel.CH1:
+            return self.ch1
+        if channel_num == channel.CH2:
+            return self.ch2
+        raise ValueError("Invalid channel. Use channel.CH1 or channel.CH2.")
+
+
+class Change(NamedTuple):
+    channel: int
+    name: str
+    register: int
+    old: object
+    new: object
+
+
+# Every register a snapshot reads, in burst order
+SNAPSHOT_COMMANDS = [f':r{CHANNEL_ENABLE:02d}='] + [
+    ENCODER.read_command(name, channel_num)
+    for channel_num in (channel.CH1, channel.CH2) for name in CHANNEL_PARAMETERS
+]
+
+_STATE_FIELDS = [f.name for f in fields(ChannelState)]
+
+
+def _register_of(name, channel_num):
+    if name == 'enable':
+        return CHANNEL_ENABLE
+    if name == 'arbitrary_waveform':
+        name = 'waveform'
+    return ENCODER.register_number(name, channel_num)
+
+
+def _payload(response):
+    try:
+        return response.split('=', 1)[1]
+    except IndexError:
+        raise ValueError("Invalid response format.")
+
+
+def _decode_channel(enabled, payloads):
+    # payloads are in CHANNEL_PARAMETERS order
+    waveform, frequency, amplitude, offset, duty_cycle, phase = payloads
+    try:
+        selected = int(waveform.strip().rstrip('.'))
+    except ValueError:
+        raise ValueError("Invalid response format.")
+    if selected > ARBITRARY_BASE:
+        waveform, arbitrary_waveform = None, selected - ARBITRARY_BASE
+    else:
+        waveform, arbitrary_waveform = selected, None
+    return ChannelState(
+        enable=enabled,
+        waveform=waveform,
+        arbitrary_waveform=arbitrary_waveform,
+        frequency=ENCODER.decode('frequency', frequency),
+        amplitude=ENCODER.decode('amplitude', amplitude),
+        offset=ENCODER.decode('offset', offset),
+        duty_cycle=ENCODER.decode('duty_cycle', duty_cycle),
+        phase=ENCODER.decode('phase', phase),
+    )
+
+
+def decode_snapshot(responses, timestamp):
+    # Responses to SNAPSHOT_COMMANDS -> Snapshot
+    if len(responses) != len(SNAPSHOT_COMMANDS):
+        raise ValueError("Invalid response format.")
+    payloads = [_payload(response) for response in responses]
+    try:
+        ch1_on, ch2_on = (int(value) for value in payloads[0].strip().rstrip('.').split(','))
+    except ValueError:
+        raise ValueError("Invalid response format.")
+    count = len(CHANNEL_PARAMETERS)
+    return Snapshot(
+        ch1=_decode_channel(bool(ch1_on), payloads[1:1 + count]),
+        ch2=_decode_channel(bool(ch2_on), payloads[1 + count:]),
+        timestamp=timestamp,
+    )
+
+
+def diff(old, new, tolerance=0.0):
+    """List the settings that differ between two snapshots.
+
+    Returns a list of Change(channel, name, register, old, new). Numeric
+    values within `tolerance` of each other count as unchanged, which
+    hides display rounding when comparing against a requested config.
+    """
+    changes = []
+    for channel_num, before, after in ((channel.CH1, old.ch1, new.ch1), (channel.CH2, old.ch2, new.ch2)):
+        if before == after:
+            continue
+        for name in _STATE_FIELDS:
+            a, b = getattr(before, name), getattr(after, name)
+            if a == b:
+                continue
+            if isinstance(a, float) and isinstance(b, float) and abs(a - b) <= tolerance:
+                continue
+            changes.append(Change(channel_num, name, _register_of(name, channel_num), a, b))
+    return changes
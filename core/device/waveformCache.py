@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+from core.device.arbitraryWaveform import quantise, ARB_SLOTS
+from core.utils.utils import parameters
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'jds6600', 'waveforms.json')
+
+
+def waveform_digest(codes):
+    # Content address of quantised waveform codes
+    return hashlib.sha256(codes.astype('<u2').tobytes()).hexdigest()
+
+
+class ArbitraryWaveformCache:
+    """Keeps track of which waveform is resident in which arbitrary slot.
+
+    The index maps device serial number -> slot -> (content hash, last use)
+    and is stored as JSON between runs. load() only uploads when the
+    quantised data is not already resident; otherwise it just selects the
+    slot. New data goes to an empty slot first, then to the least
+    recently used one.
+    """
+    def __init__(self, signal_gen_write, signal_gen_read, path=DEFAULT_INDEX_PATH, slots=range(1, ARB_SLOTS + 1)):
+        self.write = signal_gen_write
+        self.read = signal_gen_read
+        self.path = path
+        self.slots = list(slots)
+        if not self.slots or any(not (1 <= slot <= ARB_SLOTS) for slot in self.slots):
+            raise ValueError("Invalid arbitrary waveform number. Use a value between 1 and 60.")
+        self.serial_number = None
+        self._index = {}
+        self._slots = {}
+
+    def open(self, verify_recent=0):
+        # Cheap startup check: one identity round trip picks the index entry
+        # for the connected unit, so a swapped generator never reuses
+        # another unit's slot map. verify_recent additionally reads back the
+        # N most recently used slots (about 1 s each).
+        self.serial_number = self.read.getSerialnumber()
+        if not self.serial_number:
+            raise ValueError("Could not read the device serial number.")
+        self._index = self._load_index()
+        self._slots = self._index.setdefault(self.serial_number, {})
+        recent = sorted(self._slots, key=lambda slot: self._slots[slot]['used'], reverse=True)
+        for slot in recent[:verify_recent]:
+            self.verify(int(slot))
+        if parameters.DEBUG: print(f"Waveform cache: {len(self._slots)} known slots for {self.serial_number}")
+        return self
+
+    def _load_index(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump(self._index, f)
+        os.replace(temporary, self.path)
+
+    def find(self, digest):
+        for slot, entry in self._slots.items():
+            if entry['hash'] == digest and int(slot) in self.slots:
+                return int(slot)
+        return None
+
+    def _victim(self):
+        # Unused slot first, otherwise the least recently used one
+        for slot in self.slots:
+            if str(slot) not in self._slots:
+                return slot
+        return min(self.slots, key=lambda slot: self._slots[str(slot)]['used'])
+
+    def load(self, channel_num, data, normalize=False):
+        # Make `data` the output of channel_num; returns (slot, uploaded)
+        if self.serial_number is None:
+            self.open()
+        codes = quantise(data, normalize)
+        digest = waveform_digest(codes)
+        slot = self.find(digest)
+        uploaded = slot is None
+        if uploaded:
+            slot = self._victim()
+            # Forget the old content first, a failed upload leaves it unknown
+            self._slots.pop(str(slot), None)
+            response = self.write.upload_arbitrary_codes(slot, codes)
+            if response != ':ok':
+                self.save()
+                raise ValueError(f"Upload to arbitrary slot {slot} failed: {response!r}")
+        # LRU order is kept as a use counter, which survives restarts
+        used = max((entry['used'] for entry in self._slots.values()), default=0) + 1
+        self._slots[str(slot)] = {'hash': digest, 'used': used}
+        self.save()
+        self.write.set_arbitrary_waveform(channel_num, slot)
+        return slot, uploaded
+
+    def verify(self, slot):
+        # Full readback of one slot against the index, drops it on mismatch
+        entry = self._slots.get(str(slot))
+        if entry is None:
+            return False
+        if waveform_digest(self.read.get_arbitrary_waveform_data(slot)) == entry['hash']:
+            return True
+        del self._slots[str(slot)]
+        self.save()
+        return False
+
+    def invalidate(self, slot=None):
+        if slot is None:
+            self._slots.clear()
+        else:
+            self._slots.pop(str(slot), None)
+        self.save()
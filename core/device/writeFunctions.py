@@ -1,135 +1,207 @@
 import serial
 import time
+from contextlib import nullcontext
 from core.utils.utils import amplitude, channel, unit, waveform, parameters
 from core.serialHandler import SerialConnection
+from core.device.channelConfig import ChannelConfig
+from core.device.registerCache import split_command
+from core.device.registerMap import ENCODER, CHANNEL_PARAMETERS
+from core.device.arbitraryWaveform import quantise, encode_upload, ARB_TRANSFER_TIMEOUT
 from logger import test_logger
 
 DEBUG = True
 
 class signalGenerator_write:
-    def __init__(self, serial_connection):
+    def __init__(self, serial_connection, cache=None, priority=False):
+        # cache:    optional RegisterCache, writes of unchanged values are skipped
+        # priority: send through the connection's priority lane, so writes
+        #           go ahead of other threads' queued polling
         self.serial_connection = serial_connection
+        self.cache = cache
+        self.priority = priority
+
+    def _lane(self):
+        if self.priority:
+            return self.serial_connection.priority()
+        return nullcontext()
+
+    def _is_cached(self, command):
+        kind, register, payload = split_command(command)
+        return kind == 'w' and self.cache.matches(register, payload)
+
+    def _record(self, command, response):
+        kind, register, payload = split_command(command)
+        if response == ':ok':
+            self.cache.update(register, payload)
+        else:
+            # Unknown outcome, the next write must go out
+            self.cache.invalidate(register)
+
+    def _skip(self, command):
+        # True when the cache shows the register already holds this value
+        if not self._is_cached(command):
+            return False
+        if parameters.TEST: test_logger.info("Skipping unchanged register: %s", command)
+        return True
 
     def _send_command(self, command):
-        return self.serial_connection.send_command(command)
+        if self.cache is None:
+            with self._lane():
+                return self.serial_connection.send_command(command)
+        if self._skip(command):
+            return ':ok'
+        with self._lane():
+            response = self.serial_connection.send_command(command)
+        self._record(command, response)
+        return response
 
-    def set_channel_enable(self, *channels):
-        ch1 = 1 if channel.CH1 in channels else 0
-        ch2 = 1 if channel.CH2 in channels else 0
+    def _pending(self, commands):
+        # Cached commands answered ':ok' up front, the rest left as None
+        responses = [':ok' if self._is_cached(command) else None for command in commands]
+        return responses, [command for command, response in zip(commands, responses) if response is None]
+
+    def _merge_sent(self, commands, responses, sent):
+        sent = iter(sent)
+        for i, command in enumerate(commands):
+            if responses[i] is None:
+                responses[i] = next(sent)
+                self._record(command, responses[i])
+        return responses
+
+    def _send_commands(self, commands):
+        if self.cache is None:
+            with self._lane():
+                return self.serial_connection.send_commands(commands)
+        responses, pending = self._pending(commands)
+        with self._lane():
+            sent = self.serial_connection.send_commands(pending) if pending else []
+        return self._merge_sent(commands, responses, sent)
+
+    def _encode_channel_enable(self, *channels):
         if any(ch not in (channel.CH1, channel.CH2) for ch in channels):
             raise ValueError("Invalid channel. Use channel.CH1 or channel.CH2.")
-        if parameters.TEST: test_logger.info(f"Setting channel enable: CH1={ch1}, CH2={ch2}")
-        return self._send_command(f':w20={ch1},{ch2}.')
+        return ENCODER.encode_enable(channel.CH1 in channels, channel.CH2 in channels)
+
+    def _encode_waveform(self, channel_num, waveform):
+        return ENCODER.encode('waveform', channel_num, waveform)
+
+    def _encode_arbitrary_waveform(self, channel_num, waveform_num):
+        return ENCODER.encode('arbitrary_waveform', channel_num, waveform_num)
+
+    def _encode_frequency(self, channel_num, frequency, unit):
+        if not isinstance(unit, (int, float)):
+            raise ValueError("Invalid frequency unit. Use unit.HZ, unit.KHZ or unit.MHZ.")
+        # Convert the frequency to Hz
+        return ENCODER.encode('frequency', channel_num, frequency * unit)
+
+    def _encode_amplitude(self, channel_num, amplitude_value, amplitude_unit):
+        if amplitude_unit not in [amplitude.VOLT, amplitude.MILLIVOLT]:
+            raise ValueError("Invalid amplitude unit. Use amplitude.VOLT or amplitude.MILLIVOLT.")
+        return ENCODER.encode('amplitude', channel_num, amplitude_value * amplitude_unit / amplitude.VOLT)
+
+    def _encode_offset(self, channel_num, offset_value, offset_unit):
+        if offset_unit not in [amplitude.VOLT, amplitude.MILLIVOLT]:
+            raise ValueError("Invalid offset unit. Use amplitude.VOLT or amplitude.MILLIVOLT.")
+        return ENCODER.encode('offset', channel_num, offset_value * offset_unit / amplitude.VOLT)
+
+    def _encode_duty_cycle(self, channel_num, duty_cycle):
+        return ENCODER.encode('duty_cycle', channel_num, duty_cycle)
+
+    def _encode_phase(self, channel_num, phase):
+        return ENCODER.encode('phase', channel_num, phase)
+
+    def set_channel_enable(self, *channels):
+        command = self._encode_channel_enable(*channels)
+        if parameters.TEST: test_logger.info("Setting channel enable: CH1=%s, CH2=%s", int(channel.CH1 in channels), int(channel.CH2 in channels))
+        return self._send_command(command)
 
     def set_waveform(self, channel_num, waveform):
-        if waveform not in range(17):  # Ensure waveform is valid
-            raise ValueError("Invalid waveform. Use a value between 0 and 16.")
-        if parameters.TEST: test_logger.info(f"Setting waveform: Channel={channel_num}, Waveform={waveform}")
-        if channel_num == channel.CH1:
-            command = f':w21={waveform}.'
-        elif channel_num == channel.CH2:
-            command = f':w22={waveform}.'
-        else:
-            raise ValueError("Invalid channel. Use channel.CH1 or channel.CH2.")
-        if parameters.TEST: test_logger.info(f"Sending command: {command}")
+        command = self._encode_waveform(channel_num, waveform)
+        if parameters.TEST: test_logger.info("Setting waveform: Channel=%s, Waveform=%s", channel_num, waveform)
+        if parameters.TEST: test_logger.info("Sending command: %s", command)
         response = self._send_command(command)
-        if parameters.TEST: test_logger.info(f"Response for set_waveform: {response}")
+        if parameters.TEST: test_logger.info("Response for set_waveform: %s", response)
         return response
 
     def set_arbitrary_waveform(self, channel_num, waveform_num):
-        if not (1 <= waveform_num <= 60):
-            raise ValueError("Invalid arbitrary waveform number. Use a value between 1 and 60.")
-        if parameters.TEST: test_logger.info(f"Setting arbitrary waveform: Channel={channel_num}, Waveform Number={waveform_num}")
-        if channel_num == channel.CH1:
-            return self._send_command(f':w21={100 + waveform_num}.')
-        elif channel_num == channel.CH2:
-            return self._send_command(f':w22={100 + waveform_num}.')
-        else:
-            raise ValueError("Invalid channel. Use channel.CH1 or channel.CH2.")
+        command = self._encode_arbitrary_waveform(channel_num, waveform_num)
+        if parameters.TEST: test_logger.info("Setting arbitrary waveform: Channel=%s, Waveform Number=%s", channel_num, waveform_num)
+        return self._send_command(command)
 
-    def set_frequency(self, channel_num, frequency, unit):
-        # Convert the frequency to Hz
-        frequency_in_hz = frequency * unit
+    def upload_arbitrary_waveform(self, waveform_num, data, normalize=False):
+        # Quantise `data` (float array in -1..1 or a function of phase) and
+        # write it to arbitrary slot 1..60 as a single bulk line
+        return self.upload_arbitrary_codes(waveform_num, quantise(data, normalize))
 
-        # Frequency limits for Hz
-        if frequency_in_hz > 60000000:
-            raise ValueError("Maximum frequency is 60 MHz.")
+    def upload_arbitrary_codes(self, waveform_num, codes):
+        # Write 2048 already quantised 12 bit codes to arbitrary slot 1..60
+        command = self._encode_upload(waveform_num, codes)
+        return self.serial_connection.send_raw(command, timeout=ARB_TRANSFER_TIMEOUT)
 
-        # Round to nearest 0.01 value and calculate the frequency value
-        freq = int(round(frequency_in_hz * 100))
-        value = f"{freq},0"  # 0 corresponds to Hz
+    def _encode_upload(self, waveform_num, codes):
+        command = encode_upload(waveform_num, codes)
+        if parameters.TEST: test_logger.info("Uploading arbitrary waveform: Waveform Number=%s", waveform_num)
+        return command
 
-        if parameters.TEST: test_logger.info(f"Setting frequency: Channel={channel_num}, Frequency={frequency_in_hz} Hz")
-        if channel_num == channel.CH1:
-            return self._send_command(f':w23={value}.')
-        elif channel_num == channel.CH2:
-            return self._send_command(f':w24={value}.')
-        else:
-            raise ValueError("Invalid channel. Use channel.CH1 or channel.CH2.")
+    def set_frequency(self, channel_num, frequency, unit):
+        command = self._encode_frequency(channel_num, frequency, unit)
+        if parameters.TEST: test_logger.info("Setting frequency: Channel=%s, Frequency=%s Hz", channel_num, frequency * unit)
+        return self._send_command(command)
 
     def set_amplitude(self, channel_num, amplitude_value, amplitude_unit):
-        if amplitude_unit not in [amplitude.VOLT, amplitude.MILLIVOLT]:
-            raise ValueError("Invalid amplitude unit. Use amplitude.VOLT or amplitude.MILLIVOLT.")
-        amplitude_value_converted = amplitude_value * amplitude_unit
-        if parameters.TEST: test_logger.info(f"Setting amplitude: Channel={channel_num}, Amplitude Value={amplitude_value}, Amplitude Unit={amplitude_unit}")
-        if channel_num == channel.CH1:
-            return self._send_command(f':w25={amplitude_value_converted}.')
-        elif channel_num == channel.CH2:
-            return self._send_command(f':w26={amplitude_value_converted}.')
-        else:
-            raise ValueError("Invalid channel. Use channel.CH1 or channel.CH2.")
+        command = self._encode_amplitude(channel_num, amplitude_value, amplitude_unit)
+        if parameters.TEST: test_logger.info("Setting amplitude: Channel=%s, Amplitude Value=%s, Amplitude Unit=%s", channel_num, amplitude_value, amplitude_unit)
+        return self._send_command(command)
 
     def set_offset(self, channel_num, offset_value, offset_unit):
-        if offset_unit not in [amplitude.VOLT, amplitude.MILLIVOLT]:
-            raise ValueError("Invalid offset unit. Use amplitude.VOLT or amplitude.MILLIVOLT.")
-        
-        # Convert the offset value to volts if necessary
-        if offset_unit == amplitude.MILLIVOLT:
-            offset_value = offset_value / 1000.0
-
-        # Ensure the range is between -9.99V and 9.99V
-        if not (-9.99 <= offset_value <= 9.99):
-            raise ValueError("Offset value out of range. Must be between -9.99V and 9.99V.")
-
-        # Map the offset value to the appropriate format
-        offset_value_converted = int(round(offset_value * 100)) + 1000
-
-        if parameters.TEST: test_logger.info(f"Setting offset: Channel={channel_num}, Offset Value={offset_value}, Offset Unit={offset_unit}")
-        if channel_num == channel.CH1:
-            return self._send_command(f':w27={offset_value_converted}.')
-        elif channel_num == channel.CH2:
-            return self._send_command(f':w28={offset_value_converted}.')
-        else:
-            raise ValueError("Invalid channel. Use channel.CH1 or channel.CH2.")
+        command = self._encode_offset(channel_num, offset_value, offset_unit)
+        if parameters.TEST: test_logger.info("Setting offset: Channel=%s, Offset Value=%s, Offset Unit=%s", channel_num, offset_value, offset_unit)
+        return self._send_command(command)
 
     def set_duty_cycle(self, channel_num, duty_cycle):
-        if not (0 <= duty_cycle <= 100):
-            raise ValueError("Duty cycle out of range. Must be between 0 and 100.")
-        duty_cycle_mod = duty_cycle * 10
-        if parameters.TEST: test_logger.info(f"Setting duty cycle: Channel={channel_num}, Duty Cycle={duty_cycle}")
-        if channel_num == channel.CH1:
-            return self._send_command(f':w29={duty_cycle_mod}.')
-        elif channel_num == channel.CH2:
-            return self._send_command(f':w30={duty_cycle_mod}.')
-        else:
-            raise ValueError("Invalid channel. Use channel.CH1 or channel.CH2.")
+        command = self._encode_duty_cycle(channel_num, duty_cycle)
+        if parameters.TEST: test_logger.info("Setting duty cycle: Channel=%s, Duty Cycle=%s", channel_num, duty_cycle)
+        return self._send_command(command)
         
     def set_phase(self, channel_num, phase):
-        # Ensure the range is between -360 and 360 degrees
-        if not (-360 <= phase <= 360):
-            raise ValueError("Phase value out of range. Must be between -360 and 360 degrees.")
-
-        # Adjust phase if it is negative
-        if phase < 0:
-            phase += 360
-
-        # Round to the nearest 0.1 value and convert to the appropriate format
-        phase_converted = int(round(phase * 10))
-
-        if parameters.TEST: test_logger.info(f"Setting phase: Channel={channel_num}, Phase={phase}")
-        if channel_num == channel.CH1:
-            return self._send_command(f':w31={phase_converted}.')
-        elif channel_num == channel.CH2:
-            return self._send_command(f':w32={phase_converted}.')
+        command = self._encode_phase(channel_num, phase)
+        if parameters.TEST: test_logger.info("Setting phase: Channel=%s, Phase=%s", channel_num, phase)
+        return self._send_command(command)
+
+    def _encode_config(self, channel_num, config):
+        # ChannelConfig fields are named after the register table entries
+        return [ENCODER.encode(name, channel_num, getattr(config, name))
+                for name in CHANNEL_PARAMETERS if getattr(config, name) is not None]
+
+    def _encode_apply(self, channel_num, config=None):
+        # Accepts (channel.CH1, cfg), ((channel.CH1, channel.CH2), cfg)
+        # or ({channel.CH1: cfg1, channel.CH2: cfg2})
+        if isinstance(channel_num, dict):
+            configs = channel_num
+        elif isinstance(channel_num, (tuple, list, set)):
+            configs = {ch: config for ch in channel_num}
         else:
-            raise ValueError("Invalid channel. Use channel.CH1 or channel.CH2.")
\ No newline at end of file
+            configs = {channel_num: config}
+        if any(cfg is None for cfg in configs.values()):
+            raise ValueError("Missing channel configuration.")
+
+        commands = []
+        for channel_num, cfg in configs.items():
+            commands.extend(self._encode_config(channel_num, cfg))
+
+        # w20 holds both channel outputs; like set_channel_enable(), channels
+        # not enabled here are switched off. It is written last so outputs
+        # only turn on once the waveform is fully configured.
+        if any(cfg.enable is not None for cfg in configs.values()):
+            enabled = [ch for ch, cfg in configs.items() if cfg.enable]
+            commands.append(self._encode_channel_enable(*enabled))
+        return commands
+
+    def apply(self, channel_num, config=None):
+        # Every command is validated and encoded before the first byte is sent,
+        # so a bad value never leaves the device half-configured
+        commands = self._encode_apply(channel_num, config)
+        if parameters.TEST: test_logger.info("Applying configuration: %s", commands)
+        responses = self._send_commands(commands)
+        # Register number -> device response
+        return {int(command[2:4]): response for command, response in zip(commands, responses)}
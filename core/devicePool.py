@@ -0,0 +1,95 @@
+from concurrent.futures import ThreadPoolExecutor
+from core.serialHandler import SerialConnection
+from core.device.readFunctions import signalGenerator_read
+from core.device.writeFunctions import signalGenerator_write
+from core.utils.utils import parameters
+
+class PoolResult:
+    """Outcome of one device in a fan-out operation."""
+    __slots__ = ('port', 'value', 'error')
+
+    def __init__(self, port, value=None, error=None):
+        self.port = port
+        self.value = value
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        if self.ok:
+            return f"PoolResult({self.port!r}, value={self.value!r})"
+        return f"PoolResult({self.port!r}, error={self.error!r})"
+
+
+class PoolDevice:
+    # One generator in the pool: its connection plus reader/writer pair
+    def __init__(self, port, serial_connection):
+        self.port = port
+        self.serial_connection = serial_connection
+        self.read = signalGenerator_read(serial_connection)
+        self.write = signalGenerator_write(serial_connection)
+
+
+class DevicePool:
+    """Drives several JDS6600 units in parallel, one worker thread per port.
+
+    Each device has its own single-thread executor, so commands to the same
+    unit stay ordered while different units run concurrently. A failing
+    device only affects its own PoolResult.
+    """
+    def __init__(self, ports, connection_factory=SerialConnection, **connection_options):
+        self.devices = {}
+        self.errors = {}
+        self._workers = {}
+        # Open all ports concurrently as well, opening can take a while on USB
+        with ThreadPoolExecutor(max_workers=max(len(ports), 1)) as opener:
+            futures = {port: opener.submit(connection_factory, port, **connection_options) for port in ports}
+        for port, future in futures.items():
+            try:
+                self.devices[port] = PoolDevice(port, future.result())
+            except Exception as e:
+                if parameters.DEBUG: print(f"Failed to open {port}: {e}")
+                self.errors[port] = e
+                continue
+            self._workers[port] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"jds6600-{port}")
+
+    def run(self, operation, ports=None):
+        # Call operation(device) on every device (or the given ports) and
+        # collect {port: PoolResult} once all of them have finished. A port
+        # that failed to open or is not in the pool gets an error result.
+        ports = list(self.devices) if ports is None else ports
+        futures = {port: self._workers[port].submit(operation, self.devices[port])
+                   for port in ports if port in self.devices}
+        results = {}
+        for port in ports:
+            if port not in futures:
+                error = self.errors.get(port) or ValueError(f"{port} is not in the pool.")
+                results[port] = PoolResult(port, error=error)
+                continue
+            try:
+                results[port] = PoolResult(port, value=futures[port].result())
+            except Exception as e:
+                if parameters.DEBUG: print(f"Operation failed on {port}: {e}")
+                results[port] = PoolResult(port, error=e)
+        return results
+
+    def apply_all(self, channel_num, config=None):
+        return self.run(lambda device: device.write.apply(channel_num, config))
+
+    def read_all(self, getter, *args):
+        # e.g. pool.read_all('get_frequency', channel.CH1)
+        return self.run(lambda device: getattr(device.read, getter)(*args))
+
+    def close(self):
+        for worker in self._workers.values():
+            worker.shutdown(wait=True)
+        for device in self.devices.values():
+            device.serial_connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,133 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+import serial
+from serial.tools import list_ports
+from core.serialHandler import SerialConnection
+from core.utils.utils import parameters
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'jds6600', 'ports.json')
+# A JDS6600 answers :r00= in a few ms; silent ports should not hold up startup
+PROBE_TIMEOUT = 0.15
+
+
+class DeviceInfo(NamedTuple):
+    port: str
+    serial_number: str
+    device_type: str
+
+
+def candidate_ports():
+    # Every serial port the OS reports, USB adapters first
+    ports = list_ports.comports()
+    return [p.device for p in sorted(ports, key=lambda p: p.vid is None)]
+
+
+def _value(response):
+    # ':r00=1234567890.' -> '1234567890'
+    if not response.startswith((':r00=', ':r01=')):
+        return None
+    return response.split('=', 1)[1].strip().rstrip('.')
+
+
+def probe(port, timeout=PROBE_TIMEOUT, connection_factory=SerialConnection):
+    """Identify the generator on `port`, or None if nothing answers.
+
+    Serial number and device type are requested in one pipelined burst,
+    so a live device costs a single round trip.
+    """
+    # ValueError covers replies that do not decode (UnicodeDecodeError) or
+    # parse: some other device is talking on that port
+    try:
+        conn = connection_factory(port, timeout=timeout)
+    except (serial.SerialException, OSError, ValueError) as e:
+        if parameters.DEBUG: print(f"Probe of {port} failed: {e}")
+        return None
+    try:
+        serial_number, device_type = (_value(response) for response in conn.send_commands([':r00=', ':r01=']))
+    except (serial.SerialException, OSError, ValueError) as e:
+        if parameters.DEBUG: print(f"Probe of {port} failed: {e}")
+        return None
+    finally:
+        conn.close()
+    if not serial_number:
+        return None
+    return DeviceInfo(port, serial_number, device_type or '')
+
+
+def discover(ports=None, timeout=PROBE_TIMEOUT, connection_factory=SerialConnection):
+    # Probe all ports concurrently; returns {serial number: DeviceInfo}
+    ports = candidate_ports() if ports is None else list(ports)
+    if not ports:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(ports)) as probes:
+        found = probes.map(lambda port: probe(port, timeout, connection_factory), ports)
+        return {info.serial_number: info for info in found if info is not None}
+
+
+class PortMap:
+    """Serial number -> port map, cached on disk between runs.
+
+    refresh() first re-probes only the cached ports (one round trip each,
+    in parallel). A full scan of the remaining ports only happens when a
+    cached entry no longer answers with the same serial number or its port
+    is gone (USB re-enumeration), when a wanted serial number is missing,
+    or when full=True. The cache is best effort: if it cannot be written,
+    refresh() still returns what it found.
+    """
+    def __init__(self, path=DEFAULT_CACHE_PATH, timeout=PROBE_TIMEOUT, connection_factory=SerialConnection):
+        self.path = path
+        self.timeout = timeout
+        self.connection_factory = connection_factory
+        self.devices = {}
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return {serial_number: DeviceInfo(*entry) for serial_number, entry in json.load(f).items()}
+        except (OSError, ValueError, TypeError):
+            return {}
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump({serial_number: list(info) for serial_number, info in self.devices.items()}, f)
+        os.replace(temporary, self.path)
+
+    def refresh(self, ports=None, wanted=(), full=False):
+        ports = candidate_ports() if ports is None else list(ports)
+        entries = self._load()
+        cached = {info.port: info for info in entries.values() if info.port in ports}
+        self.devices = {} if full else {
+            info.serial_number: info
+            for info in discover(cached, self.timeout, self.connection_factory).values()
+            if cached[info.port].serial_number == info.serial_number
+        }
+        # Entries whose port has disappeared count as stale too
+        stale = len(self.devices) < len(entries)
+        missing = any(serial_number not in self.devices for serial_number in wanted)
+        if full or stale or missing or not cached:
+            known = {info.port for info in self.devices.values()}
+            rest = [port for port in ports if port not in known]
+            self.devices.update(discover(rest, self.timeout, self.connection_factory))
+        try:
+            self.save()
+        except OSError as e:
+            if parameters.DEBUG: print(f"Could not save port cache {self.path}: {e}")
+        return self.devices
+
+    def port_for(self, serial_number, ports=None):
+        # Port of one generator, rescanning only if it moved
+        info = self.refresh(ports, wanted=(serial_number,)).get(serial_number)
+        if info is None:
+            raise ValueError(f"No generator with serial number {serial_number} found.")
+        return info.port
+
+
+def find_devices(ports=None, path=DEFAULT_CACHE_PATH):
+    # {serial number: DeviceInfo} for every generator attached
+    return PortMap(path).refresh(ports)
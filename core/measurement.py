@@ -0,0 +1,185 @@
+"""Streaming readout of the measurement page (frequency counter).
+
+    stream = MeasurementStream(conn, ('frequency', 'duty_cycle'), rate=20)
+    for sample in itertools.islice(stream, 100):
+        print(sample.time, sample.values)
+
+    stream.record('run.npy', count=1_000_000)   # constant memory, .npy on disk
+
+Each poll reads all requested quantities in one pipelined burst. Polls are
+scheduled against absolute deadlines (start + i / rate), like sweeps; a
+poll that comes too late skips the slots it missed instead of bursting to
+catch up, and counts them in `overruns`. With decimation N, N consecutive
+polls are averaged into one sample.
+"""
+import asyncio
+import inspect
+import math
+import time
+from typing import NamedTuple, Tuple
+from core.device.registerCache import split_command
+from core.device.registerMap import MEASUREMENT_REGISTERS
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - only needed for bulk recording
+    np = None
+
+# Rows written to a recording between two flushes to disk
+FLUSH_ROWS = 4096
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("Bulk measurement recording requires numpy (pip install numpy).")
+
+
+def measurement_command(name):
+    try:
+        register, _ = MEASUREMENT_REGISTERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown measurement {name!r}. Use one of {', '.join(MEASUREMENT_REGISTERS)}.")
+    return f':r{register:02d}='
+
+
+def decode_measurement(name, response):
+    # ':r81=10000.' -> 1000.0 (Hz); raises ValueError for anything else
+    register, scale = MEASUREMENT_REGISTERS[name]
+    kind, number, payload = split_command(response)
+    if kind != 'r' or number != register or not payload:
+        raise ValueError("Invalid response format.")
+    try:
+        return int(payload) / scale
+    except ValueError:
+        raise ValueError("Invalid response format.")
+
+
+class Sample(NamedTuple):
+    time: float                 # seconds since the stream started
+    values: Tuple[float, ...]   # one per quantity, Hz / s / %; nan if unreadable
+
+
+class MeasurementStream:
+    """Polls measurement registers at `rate` Hz and yields Samples.
+
+    Iterate it (sync or async) for an endless stream, or fill an array
+    with collect()/to_array()/record(). `malformed` counts readings that
+    could not be decoded (they are nan in the sample).
+    """
+    def __init__(self, serial_connection, quantities=('frequency',), rate=10.0, decimation=1,
+                 clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError("Polling rate must be positive.")
+        if decimation < 1:
+            raise ValueError("Decimation must be at least 1.")
+        self.serial_connection = serial_connection
+        self.quantities = tuple(quantities)
+        self.commands = [measurement_command(name) for name in self.quantities]
+        self.rate = rate
+        self.decimation = decimation
+        self.clock = clock
+        self.sleep = sleep
+        self.polls = 0
+        self.overruns = 0
+        self.malformed = 0
+        self._start = None
+        self._slot = 0
+
+    @property
+    def columns(self):
+        # Column names of collect()/to_array()/record() rows
+        return ('time',) + self.quantities
+
+    def _decode(self, responses):
+        values = []
+        for name, response in zip(self.quantities, responses):
+            try:
+                values.append(decode_measurement(name, response))
+            except ValueError:
+                self.malformed += 1
+                values.append(math.nan)
+        return values
+
+    def _wait_time(self, now):
+        # Seconds until the next poll slot
+        if self._start is None:
+            self._start = now
+        deadline = self._start + self._slot / self.rate
+        missed = math.floor((now - deadline) * self.rate + 1e-9)
+        if missed > 0:
+            self.overruns += missed
+            self._slot += missed
+            deadline = self._start + self._slot / self.rate
+        self._slot += 1
+        return deadline - now
+
+    def _accumulate(self, total, sent, received, responses):
+        # Adds one poll to the running sum: [time, *values]
+        self.polls += 1
+        total[0] += (sent + received) / 2 - self._start
+        for i, value in enumerate(self._decode(responses), 1):
+            total[i] += value
+
+    def _sample(self, total):
+        return Sample(total[0] / self.decimation, tuple(value / self.decimation for value in total[1:]))
+
+    def _restart(self):
+        # Every iteration is a new schedule starting at its first poll
+        self._start = None
+        self._slot = 0
+
+    def __iter__(self):
+        self._restart()
+        while True:
+            total = [0.0] * (len(self.quantities) + 1)
+            for _ in range(self.decimation):
+                remaining = self._wait_time(self.clock())
+                if remaining > 0:
+                    self.sleep(remaining)
+                sent = self.clock()
+                responses = self.serial_connection.send_commands(self.commands)
+                self._accumulate(total, sent, self.clock(), responses)
+            yield self._sample(total)
+
+    async def __aiter__(self):
+        # Works with AsyncSerialConnection, other connections are polled
+        # from a worker thread so the event loop is never blocked
+        poll = self.serial_connection.send_commands
+        if not inspect.iscoroutinefunction(poll):
+            blocking = poll
+            poll = lambda commands: asyncio.to_thread(blocking, commands)
+        self._restart()
+        while True:
+            total = [0.0] * (len(self.quantities) + 1)
+            for _ in range(self.decimation):
+                remaining = self._wait_time(self.clock())
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+                sent = self.clock()
+                responses = await poll(self.commands)
+                self._accumulate(total, sent, self.clock(), responses)
+            yield self._sample(total)
+
+    def collect(self, out):
+        # Fill every row of a (rows, 1 + quantities) array in place
+        for row, sample in zip(range(len(out)), self):
+            out[row, 0] = sample.time
+            out[row, 1:] = sample.values
+            if np is not None and isinstance(out, np.memmap) and row % FLUSH_ROWS == FLUSH_ROWS - 1:
+                out.flush()
+        return out
+
+    def to_array(self, count):
+        _require_numpy()
+        return self.collect(np.empty((count, len(self.columns))))
+
+    def record(self, path, count):
+        # Stream `count` samples into a memory-mapped .npy file; memory use
+        # does not grow with the length of the run
+        _require_numpy()
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=(count, len(self.columns)))
+        try:
+            self.collect(out)
+        finally:
+            out.flush()
+        return out
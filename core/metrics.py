@@ -0,0 +1,193 @@
+import bisect
+import os
+import threading
+import time
+
+# Latency bucket upper bounds in seconds (Prometheus 'le'), +Inf is implicit
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+OPERATIONS = {'w': 'write', 'r': 'read', 'a': 'arbitrary_upload', 'b': 'arbitrary_readback'}
+# Where the time of one round trip goes, see SerialConnection
+PHASES = ('format', 'gap_wait', 'write', 'settle', 'wait_reply', 'decode')
+
+
+def command_labels(command):
+    # ':r23=' / b':w23=...' -> ('read', '23'), unknown commands -> ('other', '')
+    if isinstance(command, (bytes, bytearray)):
+        command = command[:4].decode('ascii', 'replace')
+    if len(command) >= 4 and command[0] == ':' and command[1] in OPERATIONS and command[2:4].isdigit():
+        return OPERATIONS[command[1]], command[2:4]
+    return 'other', ''
+
+
+class Histogram:
+    """Cumulative-on-export latency histogram with fixed buckets."""
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else None,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+        }
+
+
+class CommandMetrics:
+    """Counters and latency histograms for one serial connection.
+
+    Pass an instance as SerialConnection(..., metrics=CommandMetrics()).
+    Round-trip latency is always kept per (operation, register). The
+    per-phase breakdown (format, write, reply wait, decode, ...) costs a
+    few extra clock reads per command and is only collected with
+    phases=True. Without a metrics object the connection skips all of it.
+    """
+    def __init__(self, port=None, phases=False, buckets=DEFAULT_BUCKETS):
+        self.port = port
+        self.phases = phases
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.latency = {}       # (operation, register) -> Histogram
+            self.phase_latency = {phase: Histogram(self.buckets) for phase in PHASES}
+            self.commands = {}      # (operation, register) -> count
+            self.timeouts = {}      # (operation, register) -> count
+            self.malformed = {}     # operation (getter name) -> count
+            self.bytes_sent = 0
+            self.bytes_received = 0
+            self.started = time.time()
+
+    def observe_command(self, command, latency, sent, received, timed_out=False):
+        key = command_labels(command)
+        with self._lock:
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = Histogram(self.buckets)
+            histogram.observe(latency)
+            self.commands[key] = self.commands.get(key, 0) + 1
+            if timed_out:
+                self.timeouts[key] = self.timeouts.get(key, 0) + 1
+            self.bytes_sent += sent
+            self.bytes_received += received
+
+    def observe_phase(self, phase, seconds):
+        with self._lock:
+            self.phase_latency[phase].observe(seconds)
+
+    def observe_malformed(self, operation):
+        with self._lock:
+            self.malformed[operation] = self.malformed.get(operation, 0) + 1
+
+    def stats(self):
+        # Plain-dict view for in-process checks and dashboards
+        with self._lock:
+            return {
+                'port': self.port,
+                'since': self.started,
+                'commands': sum(self.commands.values()),
+                'timeouts': sum(self.timeouts.values()),
+                'malformed': sum(self.malformed.values()),
+                'bytes_sent': self.bytes_sent,
+                'bytes_received': self.bytes_received,
+                'latency': {f"{operation}:{register}": histogram.as_dict()
+                            for (operation, register), histogram in sorted(self.latency.items())},
+                'timeouts_by_register': {f"{operation}:{register}": count
+                                         for (operation, register), count in sorted(self.timeouts.items())},
+                'malformed_by_operation': dict(self.malformed),
+                'phases': {phase: histogram.as_dict()
+                           for phase, histogram in self.phase_latency.items() if histogram.count},
+            }
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels.items() if value is not None) + '}'
+
+
+def _histogram_lines(name, histogram, labels):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.bounds + (float('inf'),), histogram.counts):
+        cumulative += count
+        le = '+Inf' if bound == float('inf') else repr(bound)
+        lines.append(f"{name}_bucket{_labels(**labels, le=le)} {cumulative}")
+    lines.append(f"{name}_sum{_labels(**labels)} {histogram.sum!r}")
+    lines.append(f"{name}_count{_labels(**labels)} {histogram.count}")
+    return lines
+
+
+def prometheus_text(*metrics):
+    """Prometheus text exposition of one or more connections' metrics."""
+    families = {
+        'jds6600_command_duration_seconds': ('histogram', "Command round-trip time."),
+        'jds6600_phase_duration_seconds': ('histogram', "Time spent in each phase of a round trip."),
+        'jds6600_commands_total': ('counter', "Commands sent."),
+        'jds6600_timeouts_total': ('counter', "Commands that got no reply before the deadline."),
+        'jds6600_malformed_responses_total': ('counter', "Replies that could not be parsed."),
+        'jds6600_bytes_sent_total': ('counter', "Bytes written to the port."),
+        'jds6600_bytes_received_total': ('counter', "Bytes read from the port."),
+    }
+    samples = {name: [] for name in families}
+    for m in metrics:
+        with m._lock:
+            port = m.port
+            for (operation, register), histogram in sorted(m.latency.items()):
+                samples['jds6600_command_duration_seconds'] += _histogram_lines(
+                    'jds6600_command_duration_seconds', histogram,
+                    {'port': port, 'operation': operation, 'register': register})
+            for phase, histogram in m.phase_latency.items():
+                if histogram.count:
+                    samples['jds6600_phase_duration_seconds'] += _histogram_lines(
+                        'jds6600_phase_duration_seconds', histogram, {'port': port, 'phase': phase})
+            for (operation, register), count in sorted(m.commands.items()):
+                samples['jds6600_commands_total'].append(
+                    f"jds6600_commands_total{_labels(port=port, operation=operation, register=register)} {count}")
+            for (operation, register), count in sorted(m.timeouts.items()):
+                samples['jds6600_timeouts_total'].append(
+                    f"jds6600_timeouts_total{_labels(port=port, operation=operation, register=register)} {count}")
+            for operation, count in sorted(m.malformed.items()):
+                samples['jds6600_malformed_responses_total'].append(
+                    f"jds6600_malformed_responses_total{_labels(port=port, operation=operation)} {count}")
+            samples['jds6600_bytes_sent_total'].append(f"jds6600_bytes_sent_total{_labels(port=port)} {m.bytes_sent}")
+            samples['jds6600_bytes_received_total'].append(
+                f"jds6600_bytes_received_total{_labels(port=port)} {m.bytes_received}")
+    lines = []
+    for name, (kind, help_text) in families.items():
+        if samples[name]:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"] + samples[name]
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path, *metrics):
+    # For node_exporter's textfile collector: replaced atomically so the
+    # collector never reads a half-written file
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w') as f:
+        f.write(prometheus_text(*metrics))
+    os.replace(temporary, path)
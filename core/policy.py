@@ -0,0 +1,251 @@
+"""Response validation and retries on top of any connection.
+
+    conn = PolicyConnection(SerialConnection(port), RetryPolicy(retries=3))
+    signal_gen_write = signalGenerator_write(conn)
+    with conn.deadline(2.0):
+        signal_gen_write.apply(channel.CH1, config)
+
+Every reply is checked against what its command type must answer (`:ok`
+for writes, `:rNN=....` for a read of register NN, ...). A command with a
+missing or wrong reply is sent again after a jittered backoff, up to
+`retries` times, and ResponseError is raised once the retries are used up.
+Commands that are not idempotent are never resent, their outcome is unknown.
+deadline() puts one time budget on a whole high-level operation; the
+per-command read timeouts are cut down to fit it.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from core.device.registerCache import split_command
+from logger import get_logger
+
+log = get_logger(__name__)
+
+
+class ResponseError(ValueError):
+    """A command got no valid reply within the retry policy."""
+    def __init__(self, message, command=None, response=None):
+        super().__init__(message)
+        self.command = command
+        self.response = response
+
+
+class DeadlineExceeded(ResponseError, TimeoutError):
+    """The time budget of a deadline() block ran out."""
+
+
+def _reply_to_read(command, response):
+    # ':r23=' must be answered by ':r23=<payload>.', same for ':b'
+    return response.startswith(command[:4] + '=') and response.endswith('.')
+
+
+def _acknowledged(command, response):
+    return response == ':ok'
+
+
+# Command type (second character) -> check(command, response)
+EXPECTED_RESPONSES = {
+    'w': _acknowledged,
+    'a': _acknowledged,
+    'r': _reply_to_read,
+    'b': _reply_to_read,
+}
+
+
+class RetryPolicy:
+    """What counts as a valid reply and how to retry when it is not.
+
+    retries:        resends per command after the first attempt
+    backoff:        wait before the first resend, doubled for each further one
+    jitter:         relative random spread of every wait (0.5 = +-50 %)
+    expected:       overrides/extra entries for EXPECTED_RESPONSES
+    non_idempotent: register numbers whose writes must not be sent twice
+                    (e.g. a trigger); a bad reply raises instead of resending
+    """
+    def __init__(self, retries=2, backoff=0.02, jitter=0.5, expected=None, non_idempotent=(), seed=None):
+        if retries < 0:
+            raise ValueError("Retries must not be negative.")
+        self.retries = retries
+        self.backoff = backoff
+        self.jitter = jitter
+        self.expected = {**EXPECTED_RESPONSES, **(expected or {})}
+        self.non_idempotent = set(non_idempotent)
+        self._random = random.Random(seed)
+
+    def valid(self, command, response):
+        if not response:
+            return False
+        check = self.expected.get(command[1:2])
+        return check is None or check(command, response)
+
+    def idempotent(self, command):
+        kind, register, _ = split_command(command)
+        return not (kind == 'w' and register in self.non_idempotent)
+
+    def delay(self, attempt):
+        # Wait before resend number `attempt` (1, 2, ...)
+        base = self.backoff * 2 ** (attempt - 1)
+        return max(base * (1 + self._random.uniform(-self.jitter, self.jitter)), 0.0)
+
+
+class PolicyConnection:
+    """Wraps a SerialConnection (or anything with its interface) with a RetryPolicy.
+
+    stats counts commands, retries, invalid and missing replies and the
+    commands given up on, so a degrading link shows up long before it fails.
+    """
+    def __init__(self, serial_connection, policy=None):
+        self.serial_connection = serial_connection
+        self.policy = policy or RetryPolicy()
+        self.stats = {'commands': 0, 'retries': 0, 'invalid': 0, 'timeouts': 0, 'failed': 0}
+        self._stats_lock = threading.Lock()
+        self._budget = threading.local()
+
+    def __getattr__(self, name):
+        # metrics, transaction(), priority(), close(), ... of the wrapped connection
+        return getattr(self.serial_connection, name)
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    @contextmanager
+    def deadline(self, seconds):
+        # Time budget for everything this thread sends inside the block;
+        # nested blocks can only shorten it
+        previous = getattr(self._budget, 'end', None)
+        end = time.monotonic() + seconds
+        self._budget.end = end if previous is None else min(end, previous)
+        try:
+            yield self
+        finally:
+            self._budget.end = previous
+
+    def remaining(self):
+        # Seconds left in the current deadline() block, None outside one
+        end = getattr(self._budget, 'end', None)
+        return None if end is None else end - time.monotonic()
+
+    def _check_deadline(self, command):
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            self._count('failed')
+            raise DeadlineExceeded(f"Deadline exceeded before {command!r} got a valid reply.", command)
+        return remaining
+
+    def _timeout(self, timeout, command):
+        remaining = self._check_deadline(command)
+        if remaining is None:
+            return timeout
+        # Not every connection has a default read timeout (e.g. replay)
+        default = getattr(self.serial_connection, 'timeout', None)
+        return min(timeout or default or remaining, remaining)
+
+    def _judge(self, command, response):
+        if self.policy.valid(command, response):
+            return True
+        self._count('invalid' if response else 'timeouts')
+        return False
+
+    def _give_up(self, command, response, attempt, reason=None):
+        if reason is None and not self.policy.idempotent(command):
+            reason = f"is not idempotent and got {response!r}, not resending"
+        elif reason is None:
+            reason = f"got {response!r} after {attempt} attempt(s)"
+        self._count('failed')
+        raise ResponseError(f"Command {command!r} {reason}.", command, response)
+
+    def _pause(self, attempt, command):
+        delay = self.policy.delay(attempt)
+        remaining = self._check_deadline(command)
+        if remaining is not None and delay >= remaining:
+            self._count('failed')
+            raise DeadlineExceeded(f"Deadline exceeded before {command!r} got a valid reply.", command)
+        self._count('retries')
+        log.info("Resending %s (attempt %s) in %.3f s", command, attempt + 1, delay)
+        time.sleep(delay)
+
+    @contextmanager
+    def _attempt(self, attempt, command, outstanding=1, timeout=None):
+        # A resend waits out the backoff, then runs in one transaction with
+        # dropping late replies: replies to commands that timed out or were
+        # answered wrongly may still be on their way, and every write
+        # answers `:ok`, so a stale reply would pass for the resend's own.
+        # Up to `outstanding` of them are waited for (each bounded by the
+        # read timeout), then whatever is buffered is dropped. Connections
+        # without local input (daemon, replay) skip this.
+        if not attempt:
+            yield
+            return
+        self._pause(attempt, command)
+        discard = getattr(self.serial_connection, '_discard_input', None)
+        if discard is None:
+            yield
+            return
+        with self.serial_connection.transaction():
+            for _ in range(outstanding):
+                if not self.serial_connection._read_line(self._timeout(timeout, command)):
+                    break
+            discard()
+            yield
+
+    def send_command(self, command, timeout=None):
+        self._count('commands')
+        for attempt in range(self.policy.retries + 1):
+            with self._attempt(attempt, command, timeout=timeout):
+                response = self.serial_connection.send_command(command, timeout=self._timeout(timeout, command))
+            if self._judge(command, response):
+                return response
+            if not self.policy.idempotent(command):
+                break
+        self._give_up(command, response, attempt + 1)
+
+    def send_commands(self, commands, window=None):
+        # The first command without a valid reply is resent together with
+        # every command after it, in the original order, so ordering rules
+        # of the caller (apply() enables outputs last) still hold. A failed
+        # write that a later command in the burst overwrote successfully
+        # does not count as failed.
+        if not commands:
+            return []
+        self._count('commands', len(commands))
+        self._check_deadline(commands[0])
+        responses = [None] * len(commands)
+        first = outstanding = 0
+        for attempt in range(self.policy.retries + 1):
+            with self._attempt(attempt, commands[first], outstanding):
+                responses[first:] = self.serial_connection.send_commands(commands[first:], window)
+            failed = [i for i in range(first, len(commands)) if not self._judge(commands[i], responses[i])]
+            outstanding = len(failed)
+            failed = [i for i in failed if not self._superseded(commands, responses, i)]
+            if not failed:
+                return responses
+            first = failed[0]
+            blocking = next((command for command in commands[first:] if not self.policy.idempotent(command)), None)
+            if blocking == commands[first]:
+                self._give_up(commands[first], responses[first], attempt + 1)
+            if blocking is not None:
+                self._give_up(commands[first], responses[first], attempt + 1,
+                              f"got {responses[first]!r}, resending would repeat non-idempotent {blocking!r}")
+        self._give_up(commands[first], responses[first], self.policy.retries + 1)
+
+    def _superseded(self, commands, responses, index):
+        kind, register, _ = split_command(commands[index])
+        if kind != 'w':
+            return False
+        return any(split_command(commands[later])[:2] == ('w', register) and responses[later] == ':ok'
+                   for later in range(index + 1, len(commands)))
+
+    def send_raw(self, data, timeout=None):
+        command = bytes(data).decode(errors='replace').strip()
+        label = command if len(command) <= 24 else command[:24] + '...'  # uploads are ~10 kB
+        self._count('commands')
+        for attempt in range(self.policy.retries + 1):
+            with self._attempt(attempt, label, timeout=timeout):
+                response = self.serial_connection.send_raw(data, timeout=self._timeout(timeout, label))
+            if self._judge(command, response):
+                return response
+            if not self.policy.idempotent(command):
+                break
+        self._give_up(label, response, attempt + 1)
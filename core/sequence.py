@@ -0,0 +1,267 @@
+"""Declarative test sequences, compiled into a timed command schedule.
+
+A sequence is a JSON (or YAML, with PyYAML installed) document:
+
+    {"steps": [
+        {"channels": [1], "set": {"frequency": 1000, "amplitude": 2}},
+        {"channels": [1], "for": {"waveform": ["SINE", "SQUARE"]}, "steps": [
+            {"enable": true, "dwell": 0.5},
+            {"enable": false, "dwell": 0.5}]},
+        {"sync": true},
+        {"channels": [1, 2], "enable": false}
+    ]}
+
+Each channel has its own timeline: a step starts when the previous step on
+its channels has finished its dwell, so blocks for CH1 and CH2 run side by
+side. A step on both channels, or {"sync": true}, waits for both. Steps that
+land on the same instant are merged into one pipelined burst, writes that
+do not change a register are dropped, and an enable/disable pair with no
+dwell in between collapses into nothing.
+
+    python -m core.sequence sequences/hardware_test.json --dry-run
+"""
+import argparse
+import json
+import time
+from dataclasses import dataclass, field
+from typing import List
+from core.device.registerMap import ENCODER, CHANNEL_PARAMETERS
+from core.utils.utils import channel, waveform, parameters
+
+try:
+    import yaml
+except ImportError:  # pragma: no cover - only needed for YAML sequences
+    yaml = None
+
+# Parameters a step may set, in the order they are written
+SETTABLE = CHANNEL_PARAMETERS + ('arbitrary_waveform',)
+CHANNELS = (channel.CH1, channel.CH2)
+STEP_KEYS = {'channels', 'set', 'enable', 'dwell', 'for', 'steps', 'sync', 'name'}
+
+
+class SequenceError(ValueError):
+    """Invalid sequence document, raised before anything is sent."""
+
+
+def load_sequence(path):
+    with open(path) as f:
+        if path.endswith(('.yaml', '.yml')):
+            if yaml is None:
+                raise ImportError("YAML sequences require PyYAML (pip install pyyaml).")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def _waveform_value(value):
+    # "SINE" -> 0, numbers pass through
+    if isinstance(value, str):
+        try:
+            return getattr(waveform, value.upper())
+        except AttributeError:
+            raise SequenceError(f"Unknown waveform {value!r}.")
+    return value
+
+
+def _expand(steps, inherited_channels, where):
+    # Flatten 'for' blocks into plain steps: (where, channels, set, enable, dwell_us, sync)
+    for index, step in enumerate(steps):
+        position = f"{where}[{index}]"
+        if not isinstance(step, dict) or set(step) - STEP_KEYS:
+            raise SequenceError(f"{position}: unknown keys {sorted(set(step) - STEP_KEYS) if isinstance(step, dict) else step!r}.")
+        if step.get('sync'):
+            yield position, CHANNELS, {}, None, 0, True
+            continue
+        channels = tuple(step.get('channels', inherited_channels))
+        if not channels or any(ch not in CHANNELS for ch in channels):
+            raise SequenceError(f"{position}: channels must be 1 and/or 2.")
+        if 'for' in step:
+            loop = step['for']
+            if len(loop) != 1:
+                raise SequenceError(f"{position}: 'for' takes exactly one parameter.")
+            [(name, values)] = loop.items()
+            body = step.get('steps', [{}])
+            for value in values:
+                first = True
+                for expanded in _expand(body, channels, f"{position}.steps"):
+                    if first:
+                        # The loop value is set at the start of each iteration
+                        expanded = expanded[:2] + ({name: value, **expanded[2]},) + expanded[3:]
+                        first = False
+                    yield expanded
+            continue
+        dwell = step.get('dwell', 0)
+        if dwell < 0:
+            raise SequenceError(f"{position}: dwell must not be negative.")
+        yield position, channels, dict(step.get('set', {})), step.get('enable'), round(dwell * 1e6), False
+
+
+@dataclass
+class Burst:
+    time: float                  # seconds from the start of the run
+    commands: List[str]
+
+
+@dataclass
+class SequenceReport:
+    responses: List[str] = field(default_factory=list)
+    timing_errors: List[float] = field(default_factory=list)  # actual - scheduled, per burst
+    elapsed: float = 0.0
+
+    @property
+    def commands(self):
+        return len(self.responses)
+
+    @property
+    def failed(self):
+        return [i for i, response in enumerate(self.responses) if response != ':ok']
+
+    @property
+    def max_error(self):
+        return max(self.timing_errors, key=abs) if self.timing_errors else 0.0
+
+
+class VirtualClock:
+    # Stand-in for time.monotonic/time.sleep in dry runs
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += max(seconds, 0.0)
+
+
+class _DryRunConnection:
+    # Accepts every command and charges command_time of virtual time for it
+    def __init__(self, clock, command_time):
+        self.clock = clock
+        self.command_time = command_time
+
+    def send_commands(self, commands, window=None):
+        self.clock.sleep(self.command_time * len(commands))
+        return [':ok'] * len(commands)
+
+
+class Schedule:
+    """Compiled sequence: bursts of commands at fixed offsets."""
+    def __init__(self, bursts, duration):
+        self.bursts = bursts
+        self.duration = duration
+
+    @property
+    def command_count(self):
+        return sum(len(burst.commands) for burst in self.bursts)
+
+    def run(self, serial_connection, clock=time.monotonic, sleep=time.sleep):
+        # Same deadline scheme as FrequencySweep: a late burst does not
+        # push back the ones after it
+        report = SequenceReport()
+        start = clock()
+        for burst in self.bursts:
+            remaining = start + burst.time - clock()
+            if remaining > 0:
+                sleep(remaining)
+            report.timing_errors.append(clock() - start - burst.time)
+            report.responses += serial_connection.send_commands(burst.commands)
+        remaining = start + self.duration - clock()
+        if remaining > 0:
+            sleep(remaining)
+        report.elapsed = clock() - start
+        if parameters.DEBUG: print(f"Sequence done: {report.commands} commands in {report.elapsed:.3f} s")
+        return report
+
+    def dry_run(self, command_time=0.0):
+        # Run against a virtual clock: exact run time and command count,
+        # with every command costing command_time seconds
+        clock = VirtualClock()
+        return self.run(_DryRunConnection(clock, command_time), clock=clock, sleep=clock.sleep)
+
+
+def compile_sequence(spec):
+    """Compile a sequence document (dict) into a Schedule.
+
+    All values are validated and encoded here, so an invalid step fails
+    before anything is sent.
+    """
+    steps = spec.get('steps') if isinstance(spec, dict) else None
+    if not isinstance(steps, list):
+        raise SequenceError("A sequence needs a list of 'steps'.")
+    clock = {ch: 0 for ch in CHANNELS}      # microseconds, per channel
+    actions = []                            # (time_us, order, channel, register, command or enable)
+    for order, (position, channels, settings, enable, dwell, sync) in enumerate(_expand(steps, (channel.CH1,), 'steps')):
+        start = max(clock[ch] for ch in channels)
+        if sync:
+            for ch in CHANNELS:
+                clock[ch] = start
+            continue
+        for ch in channels:
+            for name, value in settings.items():
+                if name not in SETTABLE:
+                    raise SequenceError(f"{position}: unknown parameter {name!r}.")
+                if name == 'waveform':
+                    value = _waveform_value(value)
+                try:
+                    command = ENCODER.encode(name, ch, value)
+                except (ValueError, TypeError) as e:
+                    raise SequenceError(f"{position}: {e}")
+                actions.append((start, order, ch, ENCODER.register_number(name, ch), command))
+            if enable is not None:
+                actions.append((start, order, ch, None, bool(enable)))
+            clock[ch] = start + dwell
+    actions.sort(key=lambda action: (action[0], action[1]))
+
+    bursts = []
+    written = {}                            # register -> last command sent
+    enabled = {ch: None for ch in CHANNELS} # None: unknown at start
+    index = 0
+    while index < len(actions):
+        moment = actions[index][0]
+        registers = {}
+        wanted = dict(enabled)
+        while index < len(actions) and actions[index][0] == moment:
+            _, _, ch, register, value = actions[index]
+            if register is None:
+                wanted[ch] = value
+            else:
+                registers[register] = value
+            index += 1
+        commands = []
+        for register, command in sorted(registers.items()):
+            if written.get(register) != command:
+                written[register] = command
+                commands.append(command)
+        if wanted != enabled:
+            # Enable last, so a channel switches on with its new settings
+            commands.append(ENCODER.encode_enable(wanted[channel.CH1], wanted[channel.CH2]))
+            enabled = {ch: bool(on) for ch, on in wanted.items()}
+        if commands:
+            bursts.append(Burst(moment / 1e6, commands))
+    return Schedule(bursts, max(clock.values()) / 1e6)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run or dry-run a test sequence.")
+    parser.add_argument('sequence', help="JSON or YAML sequence file")
+    parser.add_argument('--port', help="serial port of the generator")
+    parser.add_argument('--dry-run', action='store_true', help="report run time and command count only")
+    parser.add_argument('--command-time', type=float, default=0.0,
+                        help="assumed seconds per command in a dry run")
+    options = parser.parse_args(argv)
+    schedule = compile_sequence(load_sequence(options.sequence))
+    if options.dry_run or not options.port:
+        report = schedule.dry_run(options.command_time)
+        print(f"{report.commands} commands in {len(schedule.bursts)} bursts, run time {report.elapsed:.3f} s")
+        return report
+    from core.serialHandler import SerialConnection
+    serial_conn = SerialConnection(options.port)
+    try:
+        report = schedule.run(serial_conn)
+    finally:
+        serial_conn.close()
+    print(f"{report.commands} commands, {len(report.failed)} failed, max timing error {report.max_error * 1e3:.3f} ms")
+    return report
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
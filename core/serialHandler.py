@@ -1,33 +1,550 @@
+import os
+import select
+import threading
 import time
+from collections import deque
+from contextlib import contextmanager
 import serial
 from core.utils.utils import parameters
+from core.device.registerCache import CACHED_REGISTERS, split_command
+from core.device.registerMap import CHANNEL_ENABLE
+from logger import get_logger
+
+# Per-command traces, enable with logger.set_level(logging.DEBUG, 'core.serialHandler')
+log = get_logger(__name__)
+
+class TransactionLock:
+    """Re-entrant lock with a priority lane, handed over in FIFO order.
+
+    When the holder releases, the oldest waiter in the priority lane gets
+    the lock, then the oldest normal waiter. Ownership is handed over
+    directly, so a thread that releases and re-acquires in a loop cannot
+    starve the others.
+    """
+    def __init__(self):
+        self._mutex = threading.Lock()
+        self._owner = None
+        self._depth = 0
+        self._lanes = (deque(), deque())  # priority, normal: (waiter, thread id)
+
+    def acquire(self, priority=False):
+        me = threading.get_ident()
+        with self._mutex:
+            if self._owner == me:
+                self._depth += 1
+                return
+            if self._owner is None:
+                self._owner, self._depth = me, 1
+                return
+            waiter = threading.Lock()
+            waiter.acquire()
+            self._lanes[0 if priority else 1].append((waiter, me))
+        waiter.acquire()  # released by the thread handing the lock over
+
+    def release(self):
+        with self._mutex:
+            if self._owner != threading.get_ident():
+                raise RuntimeError("Transaction lock released by a thread that does not hold it.")
+            self._depth -= 1
+            if self._depth:
+                return
+            for lane in self._lanes:
+                if lane:
+                    waiter, self._owner = lane.popleft()
+                    self._depth = 1
+                    waiter.release()
+                    return
+            self._owner = None
+
+    @property
+    def waiting(self):
+        return len(self._lanes[0]) + len(self._lanes[1])
+
+
+TERMINATOR = b'\r\n'
+OK_FRAME = b':ok\r\n'
+
+
+class FrameReader:
+    """Frames CRLF-terminated replies from a POSIX serial port.
+
+    Whatever bytes are available are read straight into one reusable
+    buffer (os.readv into a memoryview, no intermediate bytes objects), and
+    the terminator search resumes where the last one stopped. Bytes that
+    arrive after a reply, e.g. the next pipelined one, stay buffered.
+    read_frame() returns a memoryview into the buffer that is only valid
+    until the next call.
+    """
+    def __init__(self, ser, size=4096):
+        self.ser = ser
+        self.fd = ser.fileno()
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._start = 0   # first byte not handed out yet
+        self._end = 0     # end of the bytes read so far
+        self._scan = 0    # terminator search resumes here
+
+    @classmethod
+    def for_port(cls, ser):
+        # None for ports without a real file descriptor (mocks, wrappers,
+        # Windows), which keep using read_until()
+        try:
+            fd = ser.fileno()
+        except (AttributeError, OSError, ValueError):
+            return None
+        if os.name != 'posix' or not isinstance(fd, int):
+            return None
+        return cls(ser)
+
+    def discard(self):
+        self._start = self._end = self._scan = 0
+
+    def _make_room(self):
+        pending = self._end - self._start
+        if self._start:
+            # Move the unconsumed tail to the front
+            self._buffer[:pending] = self._view[self._start:self._end]
+        else:
+            # One reply bigger than the buffer (arbitrary waveform readback)
+            grown = bytearray(len(self._buffer) * 2)
+            grown[:pending] = self._view[:pending]
+            self._buffer, self._view = grown, memoryview(grown)
+        self._scan -= self._start
+        self._start, self._end = 0, pending
+
+    def read_frame(self, timeout):
+        # One reply including its terminator; on timeout whatever arrived
+        # (possibly nothing), like read_until()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            found = self._buffer.find(TERMINATOR, self._scan, self._end)
+            if found >= 0:
+                frame = self._view[self._start:found + 2]
+                self._start = self._scan = found + 2
+                if self._start == self._end:
+                    self.discard()
+                return frame
+            # A '\r' at the very end may be completed by the next read
+            self._scan = max(self._end - 1, self._start)
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                frame = self._view[self._start:self._end]
+                self.discard()
+                return frame
+            ready, _, _ = select.select([self.fd], [], [], remaining)
+            if not ready:
+                continue
+            if self._end == len(self._buffer):
+                self._make_room()
+            try:
+                count = os.readv(self.fd, [self._view[self._end:]])
+            except OSError as e:
+                raise serial.SerialException(f"read failed: {e}")
+            if not count:
+                raise serial.SerialException("device reports readiness to read but returned no data "
+                                             "(device disconnected or multiple access on port?)")
+            self._end += count
+
+
+class PendingResponse:
+    """Handle for a command submitted to a CommandPipeline."""
+    def __init__(self, pipeline, command):
+        self._pipeline = pipeline
+        self.command = command
+        self.response = None
+        self.sent_at = None
+
+    def done(self):
+        return self.response is not None
+
+    def result(self):
+        # Drain the pipeline until this command's reply has been matched
+        while self.response is None:
+            self._pipeline._read_one()
+        return self.response
+
+
+class CommandPipeline:
+    """Keeps up to `window` commands in flight and matches replies in FIFO order.
+
+    The JDS6600 answers every command with exactly one line, in order, so the
+    n-th line read belongs to the n-th command written.
+    """
+    def __init__(self, connection, window=8):
+        if window < 1:
+            raise ValueError("Pipeline window must be at least 1.")
+        self.connection = connection
+        self.window = window
+        self._in_flight = deque()
+
+    def submit(self, command):
+        while len(self._in_flight) >= self.window:
+            self._read_one()
+        pending = PendingResponse(self, command)
+        self.connection._write_command(command)
+        if self.connection.metrics is not None:
+            pending.sent_at = time.perf_counter()
+        self._in_flight.append(pending)
+        return pending
+
+    def flush(self):
+        while self._in_flight:
+            self._read_one()
+
+    def _read_one(self):
+        if not self._in_flight:
+            raise RuntimeError("No command in flight.")
+        response = self.connection._read_line()
+        metrics = self.connection.metrics
+        if not response:
+            # A missing reply breaks FIFO matching: fail everything in flight
+            # and drop whatever arrives late so the next burst starts clean
+            for pending in self._in_flight:
+                pending.response = ''
+                if metrics is not None:
+                    self._observe(metrics, pending, 0, timed_out=True)
+            self._in_flight.clear()
+            self.connection._discard_input()
+            return
+        pending = self._in_flight.popleft()
+        pending.response = response
+        if metrics is not None:
+            self._observe(metrics, pending, self.connection._last_reply_size)
+
+    def _observe(self, metrics, pending, received, timed_out=False):
+        if pending.sent_at is None:
+            return  # sent before metrics were attached, no start time
+        metrics.observe_command(pending.command, time.perf_counter() - pending.sent_at,
+                                len(pending.command) + 2, received, timed_out)
+
+    def __enter__(self):
+        # Holds the connection for the whole burst
+        self.connection._transaction_lock.acquire(self.connection._priority_requested())
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.flush()
+        finally:
+            self.connection._transaction_lock.release()
+
 
 class SerialConnection:
-    def __init__(self, port):
+    def __init__(self, port, timeout=1, min_gap=0.0, settle_delay=None, window=8, metrics=None):
+        # timeout:      default per-command deadline in seconds
+        # min_gap:      minimum idle time between two commands in seconds
+        # settle_delay: fixed wait before reading the reply (legacy mode),
+        #               None returns as soon as the terminator arrives
+        # window:       default number of commands in flight when pipelining
+        # metrics:      optional core.metrics.CommandMetrics to record into
+        self.timeout = timeout
+        self.min_gap = min_gap
+        self.settle_delay = settle_delay
+        self.window = window
+        self.metrics = metrics
+        if metrics is not None and metrics.port is None:
+            metrics.port = port
+        self._last_command_end = 0.0
+        self._last_reply_size = 0
+        # One transaction (command, raw line or burst) at a time across
+        # threads, see transaction() and priority()
+        self._transaction_lock = TransactionLock()
+        self._lane = threading.local()
+        self.port = port
+        self._frame_reader = None
+        self._frame_port = None
+        # Applied to every port this connection opens (session recording)
+        self._port_wrapper = None
+        self.ser = self._open_port()
+
+    def _open_port(self):
         try:
-            self.ser = serial.Serial(
-                port=port,
+            ser = serial.Serial(
+                port=self.port,
                 baudrate=115200,
                 bytesize=serial.EIGHTBITS,
                 parity=serial.PARITY_NONE,
                 stopbits=serial.STOPBITS_ONE,
-                timeout=1
+                timeout=self.timeout
             )
             if parameters.DEBUG: print("Serial port opened successfully.")
+            return ser
         except serial.SerialException as e:
             if parameters.DEBUG: print(f"Failed to open serial port: {e}")
             raise
 
-    def send_command(self, command):
+    def _wait_min_gap(self):
+        if self.min_gap > 0:
+            remaining = self._last_command_end + self.min_gap - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+
+    def _priority_requested(self):
+        return getattr(self._lane, 'priority', False)
+
+    @contextmanager
+    def transaction(self):
+        # Keep the connection for several commands, e.g. a read-modify-write.
+        # Single commands and bursts take the lock on their own.
+        self._transaction_lock.acquire(self._priority_requested())
+        try:
+            yield self
+        finally:
+            self._transaction_lock.release()
+
+    @contextmanager
+    def priority(self):
+        # Transactions started by this thread inside the block jump ahead of
+        # waiting normal ones (bulk polling), e.g. for interactive writes
+        previous = self._priority_requested()
+        self._lane.priority = True
+        try:
+            yield self
+        finally:
+            self._lane.priority = previous
+
+    def _frames(self):
+        # Buffered reader for the current port, rebuilt when the port object
+        # changes (reconnect, session recording)
+        if self._frame_port is not self.ser:
+            self._frame_port = self.ser
+            self._frame_reader = FrameReader.for_port(self.ser)
+        return self._frame_reader
+
+    def _discard_input(self):
+        # Drop late replies, both buffered and not yet read
+        frames = self._frames()
+        if frames:
+            frames.discard()
+        self.ser.reset_input_buffer()
+
+    def _read_response(self, timeout):
+        # Returns as soon as the terminator arrives, the timeout only bounds
+        # how long we wait for a silent device
+        frames = self._frames()
+        if frames and self.ser.is_open:
+            return frames.read_frame(self.timeout if timeout is None else timeout)
+        if timeout is None or timeout == self.timeout:
+            return self.ser.read_until(TERMINATOR)
+        self.ser.timeout = timeout
+        try:
+            return self.ser.read_until(TERMINATOR)
+        finally:
+            self.ser.timeout = self.timeout
+
+    @staticmethod
+    def _decode_reply(raw):
+        # Writes (and every sweep step) answer :ok, which needs no decoding
+        if raw == OK_FRAME:
+            return ':ok'
+        return str(raw, 'utf-8').strip()
+
+    def _write_command(self, command):
         full_command = f"{command}\r\n"
-        if parameters.DEBUG: print(f"Sending command: {full_command.strip()}")  # Debug logging
+        log.debug("Sending command: %s", command)
+        self._wait_min_gap()
         self.ser.write(full_command.encode())
-        time.sleep(0.1)  # Add a small delay to allow the device to process the command
-        response = self.ser.read_until(b'\r\n').decode().strip()
-        if parameters.DEBUG: print(f"Received response: {response}")  # Debug logging
+
+    def _read_line(self, timeout=None):
+        raw = self._read_response(timeout)
+        response = self._decode_reply(raw)
+        self._last_command_end = time.monotonic()
+        self._last_reply_size = len(raw)
+        log.debug("Received response: %s", response)
+        return response
+
+    def send_command(self, command, timeout=None):
+        with self.transaction():
+            if self.metrics is not None:
+                return self._send_command_measured(command, timeout)
+            self._write_command(command)
+            if self.settle_delay:
+                time.sleep(self.settle_delay)  # Legacy fixed processing delay
+            return self._read_line(timeout)
+
+    def _send_command_measured(self, command, timeout):
+        # send_command() with every phase of the round trip timed
+        clock = time.perf_counter
+        start = clock()
+        data = f"{command}\r\n".encode()
+        log.debug("Sending command: %s", command)
+        formatted = clock()
+        self._wait_min_gap()
+        gap_done = clock()
+        self.ser.write(data)
+        written = clock()
+        if self.settle_delay:
+            time.sleep(self.settle_delay)  # Legacy fixed processing delay
+        settled = clock()
+        raw = self._read_response(timeout)
+        replied = clock()
+        response = self._decode_reply(raw)
+        self._last_command_end = time.monotonic()
+        self._last_reply_size = len(raw)
+        log.debug("Received response: %s", response)
+        end = clock()
+        metrics = self.metrics
+        if metrics.phases:
+            for phase, seconds in (('format', formatted - start), ('gap_wait', gap_done - formatted),
+                                   ('write', written - gap_done), ('settle', settled - written),
+                                   ('wait_reply', replied - settled), ('decode', end - replied)):
+                metrics.observe_phase(phase, seconds)
+        metrics.observe_command(command, end - start, len(data), len(raw), raw[-2:] != TERMINATOR)
+        return response
+
+    def send_raw(self, data, timeout=None):
+        # Send a pre-encoded command line (terminator included), used by
+        # sweeps that encode their whole command stream up front
+        log.debug("Sending command: %r", data)
+        with self.transaction():
+            start = time.perf_counter()
+            self._wait_min_gap()
+            self.ser.write(data)
+            response = self._read_line(timeout)
+            if self.metrics is not None:
+                self.metrics.observe_command(data, time.perf_counter() - start, len(data),
+                                             self._last_reply_size, not response)
         return response
 
+    def pipeline(self, window=None):
+        return CommandPipeline(self, window or self.window)
+
+    def send_commands(self, commands, window=None):
+        # Send a burst of commands with up to `window` in flight and return
+        # the responses in command order
+        with self.pipeline(window) as pipe:
+            pending = [pipe.submit(command) for command in commands]
+        return [p.response for p in pending]
+
     def close(self):
         if self.ser.is_open:
             self.ser.close()
-            if parameters.DEBUG: print("Serial port closed.")
\ No newline at end of file
+            if parameters.DEBUG: print("Serial port closed.")
+
+
+class ReconnectError(serial.SerialException):
+    """The port could not be recovered, or a different unit answered on it."""
+
+
+class ResilientConnection(SerialConnection):
+    """SerialConnection that survives USB-serial adapter resets.
+
+    A failed command (port error, or no reply at all) triggers recovery:
+    the port is reopened with exponential backoff, the unit's serial number
+    is checked against the one read at connect time, and only the channel
+    registers whose device value differs from the last value written here
+    are written again. The failed command or burst is then retried once.
+
+    reconnects counts recoveries, last_resync lists the commands the last
+    one had to re-send. Bursts built by hand with pipeline() are not
+    covered; use send_commands().
+    """
+    def __init__(self, port, timeout=1, retries=8, backoff=0.05, max_backoff=2.0, **kwargs):
+        # retries:     reopen attempts per recovery before giving up
+        # backoff:     first wait between attempts, doubled up to max_backoff
+        super().__init__(port, timeout=timeout, **kwargs)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.state = {}  # register -> last payload written, channel registers only
+        self.reconnects = 0
+        self.last_resync = []
+        self.serial_number = self._identify()
+        if not self.serial_number:
+            raise ReconnectError(f"No JDS6600 answered on {port}.")
+
+    def _identify(self):
+        kind, register, payload = split_command(super().send_command(':r00='))
+        return payload if (kind, register) == ('r', 0) else None
+
+    def _remember(self, commands, responses):
+        for command, response in zip(commands, responses):
+            if response == ':ok':
+                kind, register, payload = split_command(command)
+                if kind == 'w' and register in CACHED_REGISTERS:
+                    self.state[register] = payload
+
+    def _reopen(self):
+        delay = self.backoff
+        for attempt in range(1, self.retries + 1):
+            try:
+                self.ser.close()
+            except (serial.SerialException, OSError):
+                pass
+            try:
+                self.ser = self._open_port()
+                if self._port_wrapper is not None:
+                    self.ser = self._port_wrapper(self.ser)
+                found = self._identify()
+            except (serial.SerialException, OSError) as e:
+                log.warning("Reconnect attempt %s on %s failed: %s", attempt, self.port, e)
+            else:
+                if found == self.serial_number:
+                    return
+                if found:
+                    # Someone else's generator now has this port name: never write to it
+                    self.ser.close()
+                    raise ReconnectError(f"Expected serial number {self.serial_number} on {self.port}, got {found}.")
+                log.warning("Reconnect attempt %s on %s: no reply", attempt, self.port)
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_backoff)
+        raise ReconnectError(f"Could not reconnect to {self.port} after {self.retries} attempts.")
+
+    def _resync(self):
+        # Read back only the registers written so far, rewrite those that differ
+        registers = sorted(self.state)
+        replies = super().send_commands([f':r{register:02d}=' for register in registers])
+        stale = []
+        for register, reply in zip(registers, replies):
+            if split_command(reply)[2] != self.state[register]:
+                stale.append(register)
+        # Enable last, so a channel switches on with its restored settings
+        stale.sort(key=lambda register: register == CHANNEL_ENABLE)
+        commands = [f':w{register:02d}={self.state[register]}.' for register in stale]
+        if commands:
+            super().send_commands(commands)
+        return commands
+
+    def recover(self):
+        # Reopen, verify identity and restore state; also usable after a
+        # known reset (e.g. the unit was power cycled)
+        with self.transaction():
+            try:
+                alive = self._identify() == self.serial_number
+            except (serial.SerialException, OSError):
+                alive = False
+            if not alive:
+                self._reopen()
+            self.last_resync = self._resync()
+            self.reconnects += 1
+            log.info("Recovered %s, re-sent %s command(s)", self.port, len(self.last_resync))
+            return self.last_resync
+
+    def _with_recovery(self, operation, commands):
+        with self.transaction():
+            try:
+                responses = operation()
+                if all(responses):
+                    self._remember(commands, responses)
+                    return responses
+            except (serial.SerialException, OSError) as e:
+                log.warning("Command on %s failed: %s", self.port, e)
+            self.recover()
+            responses = operation()
+            self._remember(commands, responses)
+            return responses
+
+    def send_command(self, command, timeout=None):
+        return self._with_recovery(lambda: [super(ResilientConnection, self).send_command(command, timeout)],
+                                   [command])[0]
+
+    def send_commands(self, commands, window=None):
+        if not commands:
+            return []
+        return self._with_recovery(lambda: super(ResilientConnection, self).send_commands(commands, window),
+                                   commands)
+
+    def send_raw(self, data, timeout=None):
+        command = bytes(data).decode().strip()
+        return self._with_recovery(lambda: [super(ResilientConnection, self).send_raw(data, timeout)],
+                                   [command])[0]
@@ -0,0 +1,237 @@
+"""Record serial sessions to a compact binary log and replay them offline.
+
+Log format: the 8 byte header b'JDSREC1\\n' followed by records of
+
+    <I delta_us> <B kind> <I length> <payload>
+
+where delta_us is the time since the previous record in microseconds,
+kind is COMMAND (bytes written) or RESPONSE (bytes read, b'' on timeout)
+and payload is the raw line including its terminator. Records are only
+ever appended, so a session can be extended by attaching a recorder again.
+
+    python -m core.session session.jdsrec     # summary of a recording
+"""
+import io
+import os
+import struct
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import NamedTuple
+
+MAGIC = b'JDSREC1\n'
+COMMAND = 1
+RESPONSE = 2
+RECORD = struct.Struct('<IBI')
+MAX_DELTA_US = 0xFFFFFFFF
+# 8N1 framing: 10 bits per byte on the wire
+WIRE_BITS_PER_BYTE = 10
+
+
+class ReplayError(ValueError):
+    """The driver sent something the recording does not contain."""
+
+
+class SessionEvent(NamedTuple):
+    time: float      # seconds since the first record
+    kind: int
+    data: bytes
+
+
+class SessionRecorder:
+    """Appends command/response records to a session log."""
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self._last = None
+
+    def record(self, kind, data):
+        with self._lock:
+            now = time.monotonic()
+            delta = 0 if self._last is None else min(int((now - self._last) * 1e6), MAX_DELTA_US)
+            self._last = now
+            self._file.write(RECORD.pack(delta, kind, len(data)))
+            self._file.write(data)
+
+    def attach(self, serial_connection):
+        # Record everything the connection writes and reads from now on,
+        # also on the ports a ResilientConnection reopens after a drop
+        wrap = lambda ser: _RecordingPort(ser, self)
+        serial_connection.ser = wrap(serial_connection.ser)
+        serial_connection._port_wrapper = wrap
+        return serial_connection
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class _RecordingPort:
+    # Wraps a pyserial port; every other attribute is passed through
+    def __init__(self, ser, recorder):
+        object.__setattr__(self, '_ser', ser)
+        object.__setattr__(self, '_recorder', recorder)
+
+    def write(self, data):
+        self._recorder.record(COMMAND, bytes(data))
+        return self._ser.write(data)
+
+    def read_until(self, expected=b'\n', size=None):
+        data = self._ser.read_until(expected, size)
+        self._recorder.record(RESPONSE, data)
+        return data
+
+    def fileno(self):
+        # Keeps SerialConnection on read_until(), where replies are recorded
+        raise io.UnsupportedOperation("fileno")
+
+    def __getattr__(self, name):
+        return getattr(self._ser, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._ser, name, value)
+
+
+def read_session(path):
+    """Yield the SessionEvents of a recording in order."""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a session recording.")
+        elapsed = 0.0
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return  # end of file, or a record cut short by a crash
+            delta, kind, length = RECORD.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            elapsed += delta / 1e6
+            yield SessionEvent(elapsed, kind, data)
+
+
+def _exchanges(events):
+    # Pair commands with responses in FIFO order (the device answers in order)
+    commands = deque()
+    for event in events:
+        if event.kind == COMMAND:
+            commands.append(event)
+        elif event.kind == RESPONSE and commands:
+            yield commands.popleft(), event
+
+
+class ReplayConnection:
+    """Stands in for SerialConnection, answering from a recording.
+
+    Each command sent must match the next recorded command (strict=True
+    raises ReplayError otherwise) and gets the recorded response. With
+    mode='recorded' every reply is delayed by the device latency seen in
+    the recording; mode='fast' answers immediately. transaction() and
+    priority() are accepted like on SerialConnection; a transaction only
+    keeps other threads' commands out of the block, priority has no effect.
+    """
+    FAST = 'fast'
+    RECORDED = 'recorded'
+
+    def __init__(self, path, mode=FAST, strict=True, timeout=1, window=8):
+        if mode not in (self.FAST, self.RECORDED):
+            raise ValueError("Invalid replay mode. Use 'fast' or 'recorded'.")
+        self.path = path
+        self.mode = mode
+        self.strict = strict
+        self.timeout = timeout
+        self.window = window
+        self.metrics = None
+        self._exchanges = deque(_exchanges(read_session(path)))
+        self._lock = threading.RLock()
+        self.replayed = 0
+
+    @property
+    def remaining(self):
+        return len(self._exchanges)
+
+    def _exchange(self, data):
+        if not self._exchanges:
+            if self.strict:
+                raise ReplayError(f"Recording ended before {data!r}.")
+            return b''
+        command, response = self._exchanges.popleft()
+        if self.strict and command.data != data:
+            raise ReplayError(f"Expected {command.data!r} after {self.replayed} commands, got {data!r}.")
+        self.replayed += 1
+        if self.mode == self.RECORDED:
+            time.sleep(max(response.time - command.time, 0.0))
+        return response.data
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            yield self
+
+    @contextmanager
+    def priority(self):
+        yield self
+
+    def send_raw(self, data, timeout=None):
+        with self._lock:
+            return self._exchange(bytes(data)).decode().strip()
+
+    def send_command(self, command, timeout=None):
+        return self.send_raw(f"{command}\r\n".encode(), timeout)
+
+    def send_commands(self, commands, window=None):
+        with self._lock:
+            return [self.send_command(command) for command in commands]
+
+    def close(self):
+        self._exchanges.clear()
+
+
+def summarize_session(path, baudrate=115200):
+    """Protocol overhead of a recording.
+
+    Reply latency is measured from each command record to its response
+    record. The wire time of the bytes at `baudrate` is subtracted, and
+    the rest is time spent in the device and the host stack.
+    """
+    exchanges = list(_exchanges(read_session(path)))
+    latencies = [response.time - command.time for command, response in exchanges if response.data]
+    sent = sum(len(command.data) for command, _ in exchanges)
+    received = sum(len(response.data) for _, response in exchanges)
+    wire = (sent + received) * WIRE_BITS_PER_BYTE / baudrate
+    duration = exchanges[-1][1].time - exchanges[0][0].time if exchanges else 0.0
+    busy = sum(latencies)
+    return {
+        'commands': len(exchanges),
+        'timeouts': sum(1 for _, response in exchanges if not response.data),
+        'bytes_sent': sent,
+        'bytes_received': received,
+        'duration_s': duration,
+        'mean_latency_ms': busy / len(latencies) * 1e3 if latencies else None,
+        'max_latency_ms': max(latencies) * 1e3 if latencies else None,
+        'wire_time_s': wire,
+        'overhead_s': max(busy - wire, 0.0),
+        'idle_s': max(duration - busy, 0.0),
+    }
+
+
+if __name__ == '__main__':  # pragma: no cover
+    import sys
+    for path in sys.argv[1:]:
+        print(os.path.basename(path))
+        for key, value in summarize_session(path).items():
+            print(f"  {key:16s} {value}")
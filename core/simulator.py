@@ -0,0 +1,217 @@
+import math
+import os
+import random
+import select
+import threading
+import time
+import tty
+
+# Power-on register contents, as the device would report them
+DEFAULT_REGISTERS = {
+    20: '0,0',       # channel enable CH1,CH2
+    21: '0', 22: '0',                  # waveform
+    23: '100000,0', 24: '100000,0',    # frequency, 1 kHz
+    25: '5000', 26: '5000',            # amplitude, mV
+    27: '1000', 28: '1000',            # offset, 0 V
+    29: '500', 30: '500',              # duty cycle, 50.0 %
+    31: '0', 32: '0',                  # phase
+    33: '0', 34: '0',                  # arbitrary waveform slot
+    40: '100000,0', 41: '1000000,0',   # sweep start/stop frequency
+    42: '100', 43: '0', 44: '0',       # sweep time (0.1 s), direction, lin/log
+}
+
+# Measurement page registers (see MEASUREMENT_REGISTERS in the register map)
+MEASUREMENT_READOUTS = (80, 81, 83, 84, 85, 86)
+
+EMPTY_WAVEFORM = ','.join(['2048'] * 2048)
+
+
+class JDS6600Simulator:
+    """JDS6600 stand-in on a Linux pseudo-terminal.
+
+    Implements the `:wNN=` / `:rNN=` register protocol: writes are stored
+    and acknowledged with `:ok`, reads reply `:rNN=value.`. `r00` and `r01`
+    return the serial number and device type. `:aNN=` / `:bNN=` write and
+    read the arbitrary waveform slots. The sweep engine's channel and
+    start/stop registers are undocumented, so it is only emulated with
+    `sweep_control={'channel': NN, 'run': NN}`; while it runs, reads of
+    the swept channel's frequency follow the sweep registers 40-44. The
+    measurement page (r80-r86) reads CH1 as if it were looped
+    back to the counter input. Point SerialConnection at
+    `simulator.port` to exercise the real stack without hardware.
+
+    latency and jitter (seconds) set the per-command processing time; with
+    baudrate set, the wire time of command and reply is added as well.
+    """
+    def __init__(self, serial_number='1234567890', device_type='60',
+                 latency=0.0, jitter=0.0, baudrate=None, seed=None, sweep_control=None):
+        self.serial_number = serial_number
+        self.device_type = device_type
+        self.latency = latency
+        self.jitter = jitter
+        self.baudrate = baudrate
+        self.registers = dict(DEFAULT_REGISTERS)
+        self.sweep_control = sweep_control
+        if sweep_control:
+            self.registers.update({sweep_control['channel']: '0', sweep_control['run']: '0'})
+        # Arbitrary waveform memory, slot -> comma separated codes
+        self.waveforms = {slot: EMPTY_WAVEFORM for slot in range(1, 61)}
+        self.commands = []  # every command line received, in order
+        self._random = random.Random(seed)
+        self._sweep_started = None  # monotonic time the sweep engine was started
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+        self._running = False
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True, name="jds6600-simulator")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for fd in (self.slave, self.master):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _processing_time(self, command, reply):
+        delay = self.latency
+        if self.jitter:
+            delay += self._random.uniform(-self.jitter, self.jitter)
+        if self.baudrate:
+            # 8N1: 10 bit times per byte, plus CR LF on both lines
+            delay += (len(command) + len(reply) + 4) * 10 / self.baudrate
+        return max(delay, 0.0)
+
+    def handle(self, command):
+        # Returns the reply line for one command, or None to stay silent
+        with self._lock:
+            self.commands.append(command)
+            if len(command) < 5 or command[0] != ':' or '=' not in command:
+                return None
+            kind = command[1]
+            try:
+                register = int(command[2:command.index('=')])
+            except ValueError:
+                return None
+            payload = command.split('=', 1)[1].rstrip('.')
+            if kind == 'w':
+                self.registers[register] = payload
+                if self.sweep_control and register == self.sweep_control['run']:
+                    self._sweep_started = time.monotonic() if payload == '1' else None
+                return ':ok'
+            if kind == 'r':
+                if register == 0:
+                    return f':r00={self.serial_number}.'
+                if register == 1:
+                    return f':r01={self.device_type}.'
+                if self._sweep_started is not None and register == 23 + self._swept_channel():
+                    return f':r{register:02d}={self._swept_frequency()},0.'
+                if register in MEASUREMENT_READOUTS:
+                    return f':r{register:02d}={self._measure(register)}.'
+                return f':r{register:02d}={self.registers.get(register, "0")}.'
+            if kind == 'a':
+                if register not in self.waveforms or payload.count(',') != 2047:
+                    return None
+                self.waveforms[register] = payload
+                return ':ok'
+            if kind == 'b':
+                if register not in self.waveforms:
+                    return None
+                return f':b{register:02d}={self.waveforms[register]}.'
+            return None
+
+    def _measure(self, register):
+        # Measurement page readouts, as if CH1 were looped back to the
+        # counter input
+        if self._sweep_started is not None and self._swept_channel() == 0:
+            centi_hz = self._swept_frequency()
+        else:
+            centi_hz = int(self.registers[23].split(',')[0])
+        duty = int(self.registers[29])  # 0.1 %
+        period_ns = round(1e11 / centi_hz) if centi_hz else 0
+        return {
+            80: round(centi_hz / 100 * (time.monotonic() - self._started)),
+            81: round(centi_hz / 10),
+            83: period_ns * duty // 1000,
+            84: period_ns - period_ns * duty // 1000,
+            85: period_ns,
+            86: duty,
+        }[register]
+
+    def _swept_channel(self):
+        return int(self.registers[self.sweep_control['channel']])
+
+    def _swept_frequency(self):
+        # Output frequency (0.01 Hz) of the running sweep engine
+        start, stop = (int(self.registers[r].split(',')[0]) for r in (40, 41))
+        sweep_time = int(self.registers[42]) / 10
+        direction = int(self.registers[43])
+        elapsed = time.monotonic() - self._sweep_started
+        position = (elapsed % (sweep_time * (2 if direction == 2 else 1))) / sweep_time
+        if position > 1:
+            position = 2 - position
+        if direction == 1:
+            position = 1 - position
+        if self.registers[44] == '1':
+            return round(start * math.exp(position * math.log(stop / start)))
+        return round(start + (stop - start) * position)
+
+    def _serve(self):
+        buffer = b''
+        while self._running:
+            readable, _, _ = select.select([self.master], [], [], 0.05)
+            if not readable:
+                continue
+            try:
+                buffer += os.read(self.master, 4096)
+            except OSError:
+                return
+            while b'\r\n' in buffer:
+                line, buffer = buffer.split(b'\r\n', 1)
+                command = line.decode(errors='replace').strip()
+                reply = self.handle(command)
+                if reply is None:
+                    continue
+                delay = self._processing_time(command, reply)
+                if delay:
+                    time.sleep(delay)
+                data = memoryview(reply.encode() + b'\r\n')
+                try:
+                    while data:
+                        data = data[os.write(self.master, data):]
+                except OSError:
+                    return
+
+
+if __name__ == '__main__':
+    # python -m core.simulator --latency 0.002 --jitter 0.0005
+    import argparse
+    parser = argparse.ArgumentParser(description="JDS6600 simulator on a pseudo-terminal")
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--baudrate', type=int, default=None)
+    options = parser.parse_args()
+    with JDS6600Simulator(latency=options.latency, jitter=options.jitter, baudrate=options.baudrate) as sim:
+        print(f"JDS6600 simulator listening on {sim.port}")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,256 @@
+import math
+import time
+from dataclasses import dataclass, field
+from typing import List
+from core.utils.utils import channel, parameters
+from core.device.registerMap import ENCODER, REGISTERS, SWEEP_REGISTERS
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional here
+    np = None
+
+MAX_FREQUENCY = REGISTERS['frequency'].maximum
+
+LINEAR = 'lin'
+LOGARITHMIC = 'log'
+
+# Device sweep engine: sweep time is set in 0.1 s steps
+SWEEP_TIME_STEP = 0.1
+MAX_SWEEP_TIME = 999.9
+UP = 'up'
+DOWN = 'down'
+UP_DOWN = 'updown'
+DIRECTIONS = {UP: 0, DOWN: 1, UP_DOWN: 2}
+
+
+def sweep_points(start, stop, points, spacing=LINEAR):
+    # Frequency grid in Hz, vectorised when numpy is available
+    if spacing == LINEAR:
+        if np is not None:
+            return np.linspace(start, stop, points)
+        step = (stop - start) / (points - 1)
+        return [start + i * step for i in range(points)]
+    if spacing == LOGARITHMIC:
+        if np is not None:
+            return np.geomspace(start, stop, points)
+        ratio = math.log(stop / start) / (points - 1)
+        return [start * math.exp(i * ratio) for i in range(points)]
+    raise ValueError("Invalid sweep spacing. Use 'lin' or 'log'.")
+
+
+def encode_frequency_commands(channel_num, frequencies):
+    # Whole ':w23=<centi-Hz>,0.\r\n' lines, ready to be written. Range checks
+    # are done on the grid bounds by the caller, so values are scaled in bulk.
+    register = REGISTERS['frequency']
+    prefix = b':w%02d=' % ENCODER.register_number('frequency', channel_num)
+    if np is not None:
+        values = np.rint(np.asarray(frequencies, dtype=float) * register.scale).astype(np.int64).tolist()
+    else:
+        values = [int(round(f * register.scale)) for f in frequencies]
+    line = prefix + b'%d' + register.suffix.encode() + b'.\r\n'
+    return [line % value for value in values]
+
+
+@dataclass
+class SweepReport:
+    frequencies: list
+    responses: List[str] = field(default_factory=list)
+    timing_errors: List[float] = field(default_factory=list)  # actual - scheduled, seconds
+
+    @property
+    def max_error(self):
+        return max(self.timing_errors, key=abs) if self.timing_errors else 0.0
+
+    @property
+    def mean_error(self):
+        return sum(self.timing_errors) / len(self.timing_errors) if self.timing_errors else 0.0
+
+    @property
+    def failed_steps(self):
+        return [i for i, response in enumerate(self.responses) if response != ':ok']
+
+
+class FrequencySweep:
+    """Host-timed frequency sweep with a precomputed command stream.
+
+    All step commands are validated and encoded once, up front. run() plays
+    them out against absolute monotonic deadlines (start + i * dwell), so a
+    late step does not push back the ones after it.
+    """
+    def __init__(self, channel_num, start, stop, points, spacing=LINEAR, dwell=0.01):
+        if points < 2:
+            raise ValueError("A sweep needs at least 2 points.")
+        if not (0 < start <= MAX_FREQUENCY and 0 < stop <= MAX_FREQUENCY):
+            raise ValueError("Sweep frequencies must be between 0 and 60 MHz.")
+        if dwell < 0:
+            raise ValueError("Dwell time must not be negative.")
+        self.channel_num = channel_num
+        self.dwell = dwell
+        self.frequencies = sweep_points(start, stop, points, spacing)
+        self.commands = encode_frequency_commands(channel_num, self.frequencies)
+
+    @property
+    def duration(self):
+        return self.dwell * len(self.commands)
+
+    def run(self, serial_connection, clock=time.monotonic, sleep=time.sleep):
+        report = SweepReport(frequencies=list(self.frequencies))
+        start = clock()
+        for i, command in enumerate(self.commands):
+            deadline = start + i * self.dwell
+            remaining = deadline - clock()
+            if remaining > 0:
+                sleep(remaining)
+            report.timing_errors.append(clock() - deadline)
+            report.responses.append(serial_connection.send_raw(command))
+        # Hold the last point for its dwell time as well
+        remaining = start + len(self.commands) * self.dwell - clock()
+        if remaining > 0:
+            sleep(remaining)
+        if parameters.DEBUG: print(f"Sweep done: {len(self.commands)} steps, max timing error {report.max_error * 1e3:.3f} ms")
+        return report
+
+
+@dataclass
+class DeviceSweepReport:
+    responses: dict                      # register -> response of the setup burst
+    stop_response: str = ''
+    elapsed: float = 0.0                 # seconds between start and stop
+    run_register: int = None
+
+    @property
+    def failed(self):
+        failed = [register for register, response in self.responses.items() if response != ':ok']
+        if self.stop_response != ':ok':
+            failed.append(self.run_register)
+        return failed
+
+
+class DeviceSweep:
+    """Frequency sweep run by the generator's built-in sweep engine.
+
+    program() writes the setup registers (SWEEP_REGISTERS) in one
+    pipelined burst. The registers that select the swept channel and
+    start/stop the engine are not documented, so start_sweep() and
+    stop_sweep() only work with `control_registers={'channel': NN,
+    'run': NN}` that have been verified on the unit in use; without them
+    they raise ValueError rather than write to a guessed register.
+
+    Once started, the host sends nothing until stop_sweep(), so the sweep
+    runs at hardware speed regardless of serial latency. The device
+    repeats the sweep until stopped; one period is `sweep_time` seconds,
+    twice that for UP_DOWN. frequency_at() gives the expected output
+    frequency at a time since start, to line up measurements.
+    """
+    CONTROL_REGISTERS = ('channel', 'run')
+
+    def __init__(self, channel_num, start, stop, sweep_time, spacing=LINEAR, direction=UP,
+                 control_registers=None):
+        if not (0 < start <= MAX_FREQUENCY and 0 < stop <= MAX_FREQUENCY):
+            raise ValueError("Sweep frequencies must be between 0 and 60 MHz.")
+        if start == stop:
+            raise ValueError("Sweep start and stop frequencies must differ.")
+        if spacing not in (LINEAR, LOGARITHMIC):
+            raise ValueError("Invalid sweep spacing. Use 'lin' or 'log'.")
+        if direction not in DIRECTIONS:
+            raise ValueError("Invalid sweep direction. Use 'up', 'down' or 'updown'.")
+        steps = round(sweep_time / SWEEP_TIME_STEP)
+        if not (1 <= steps <= round(MAX_SWEEP_TIME / SWEEP_TIME_STEP)):
+            raise ValueError("Sweep time must be between 0.1 s and 999.9 s.")
+        if control_registers is not None and set(control_registers) != set(self.CONTROL_REGISTERS):
+            raise ValueError("control_registers must give exactly the 'channel' and 'run' register numbers.")
+        ENCODER.register_number('frequency', channel_num)  # validates the channel
+        self.channel_num = channel_num
+        self.start = start
+        self.stop = stop
+        self.spacing = spacing
+        self.direction = direction
+        self.control_registers = dict(control_registers) if control_registers is not None else None
+        self._time_steps = steps
+        self.started_at = None
+
+    @property
+    def sweep_time(self):
+        # As programmed, rounded to the device's 0.1 s resolution
+        return self._time_steps * SWEEP_TIME_STEP
+
+    @property
+    def period(self):
+        return self.sweep_time * (2 if self.direction == UP_DOWN else 1)
+
+    def commands(self):
+        frequency = REGISTERS['frequency']
+        values = {
+            'start': f"{frequency.to_raw(self.start)}{frequency.suffix}",
+            'stop': f"{frequency.to_raw(self.stop)}{frequency.suffix}",
+            'time': self._time_steps,
+            'direction': DIRECTIONS[self.direction],
+            'spacing': int(self.spacing == LOGARITHMIC),
+        }
+        return [f":w{SWEEP_REGISTERS[name]:02d}={value}." for name, value in values.items()]
+
+    def frequency_at(self, elapsed):
+        # Expected output frequency `elapsed` seconds after start()
+        position = (elapsed % self.period) / self.sweep_time
+        if position > 1:
+            position = 2 - position      # falling half of UP_DOWN
+        if self.direction == DOWN:
+            position = 1 - position
+        if self.spacing == LOGARITHMIC:
+            return self.start * (self.stop / self.start) ** position
+        return self.start + (self.stop - self.start) * position
+
+    def time_at(self, frequency):
+        # When the first pass reaches `frequency` (inverse of frequency_at)
+        if self.spacing == LOGARITHMIC:
+            position = math.log(frequency / self.start) / math.log(self.stop / self.start)
+        else:
+            position = (frequency - self.start) / (self.stop - self.start)
+        if self.direction == DOWN:
+            position = 1 - position
+        if not 0 <= position <= 1:
+            raise ValueError("Frequency outside the sweep range.")
+        return position * self.sweep_time
+
+    def _control(self, name):
+        if self.control_registers is None:
+            raise ValueError("The sweep channel and start/stop registers are not documented. Pass "
+                             "control_registers={'channel': NN, 'run': NN} verified on your unit, "
+                             "or start the sweep from the front panel after program().")
+        return self.control_registers[name]
+
+    @staticmethod
+    def _responses(commands, responses):
+        return {int(command[2:4]): response for command, response in zip(commands, responses)}
+
+    def program(self, serial_connection):
+        # Write the setup registers only; returns register -> response
+        commands = self.commands()
+        return self._responses(commands, serial_connection.send_commands(commands))
+
+    def start_sweep(self, serial_connection):
+        # Program, select the channel and start in one burst; returns register -> response
+        channel_register, run_register = self._control('channel'), self._control('run')
+        commands = self.commands() + [f":w{channel_register:02d}={0 if self.channel_num == channel.CH1 else 1}.",
+                                      f":w{run_register:02d}=1."]
+        responses = serial_connection.send_commands(commands)
+        self.started_at = time.monotonic()
+        if parameters.DEBUG: print(f"Device sweep started: {self.start} -> {self.stop} Hz, period {self.period:.1f} s")
+        return self._responses(commands, responses)
+
+    def stop_sweep(self, serial_connection):
+        run_register = self._control('run')
+        self.started_at = None
+        return serial_connection.send_command(f":w{run_register:02d}=0.")
+
+    def run(self, serial_connection, sweeps=1, clock=time.monotonic, sleep=time.sleep):
+        # Start, leave the line idle for `sweeps` periods, stop
+        report = DeviceSweepReport(self.start_sweep(serial_connection), run_register=self._control('run'))
+        start = clock()
+        remaining = start + self.period * sweeps - clock()
+        if remaining > 0:
+            sleep(remaining)
+        report.stop_response = self.stop_sweep(serial_connection)
+        report.elapsed = clock() - start
+        return report
@@ -1,10 +1,22 @@
+import atexit
 import logging
-from datetime import datetime
+import logging.handlers
 import os
+import queue
+import threading
+from datetime import datetime
+
+# Nothing touches the filesystem at import. The first record that reaches
+# test_logger's handler starts a QueueListener thread; the file under
+# test/logs/ is only created when that thread writes the first record, so
+# log I/O never runs on the caller's (serial) thread.
+LOG_DIR = 'test/logs'
+LOG_FORMAT = '%(asctime)s %(levelname)s %(message)s'
+
 
 def setup_logger(name, log_file, level=logging.INFO):
     """Function to setup a logger"""
-    formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
+    formatter = logging.Formatter(LOG_FORMAT)
     handler = logging.FileHandler(log_file)
     handler.setFormatter(formatter)
 
@@ -14,11 +26,89 @@ def setup_logger(name, log_file, level=logging.INFO):
 
     return logger
 
-# Ensure the logs directory exists
-log_dir = 'test/logs'
-os.makedirs(log_dir, exist_ok=True)
 
-# Create a logger for the test with a timestamped log file name
-current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-log_file_name = os.path.join(log_dir, f"test_log_{current_time}.log")
-test_logger = setup_logger('test_logger', log_file_name)
\ No newline at end of file
+class _LazyFileHandler(logging.FileHandler):
+    # Creates the log directory and timestamped file on first use
+    def __init__(self, log_dir):
+        current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
+        super().__init__(os.path.join(log_dir, f"test_log_{current_time}.log"), delay=True)
+        self.log_dir = log_dir
+
+    def _open(self):
+        os.makedirs(self.log_dir, exist_ok=True)
+        return super()._open()
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    """Non-blocking handler: emit() only enqueues the record.
+
+    The listener thread and its file handler are created on the first
+    record, so a process that never logs never starts either.
+    """
+    def __init__(self, log_dir=LOG_DIR):
+        super().__init__(queue.SimpleQueue())
+        self.log_dir = log_dir
+        self.listener = None
+        self._start_lock = threading.Lock()
+        atexit.register(self.stop)
+
+    def prepare(self, record):
+        # Records stay in this process, so message formatting is left to the
+        # listener thread instead of being done on the caller's thread
+        return record
+
+    def emit(self, record):
+        if self.listener is None:
+            self.start()
+        super().emit(record)
+
+    def start(self):
+        with self._start_lock:
+            if self.listener is None:
+                target = _LazyFileHandler(self.log_dir)
+                target.setFormatter(logging.Formatter(LOG_FORMAT))
+                self.listener = logging.handlers.QueueListener(self.queue, target, respect_handler_level=True)
+                self.listener.start()
+
+    def stop(self):
+        # Flush queued records and close the file
+        with self._start_lock:
+            if self.listener is not None:
+                self.listener.stop()
+                for handler in self.listener.handlers:
+                    handler.close()
+                self.listener = None
+
+
+test_logger = logging.getLogger('test_logger')
+test_logger.setLevel(logging.INFO)
+_queue_handler = _LazyQueueHandler()
+test_logger.addHandler(_queue_handler)
+
+
+def get_logger(module_name):
+    # Per-module child of test_logger, e.g. 'test_logger.core.serialHandler'
+    return test_logger.getChild(module_name)
+
+
+def set_level(level, module_name=None):
+    """Change the log level at runtime.
+
+    With module_name only that module's logger changes (e.g.
+    set_level(logging.DEBUG, 'core.serialHandler') for per-command traces),
+    otherwise test_logger and everything below it that has no level of its own.
+    """
+    logger = get_logger(module_name) if module_name else test_logger
+    logger.setLevel(level)
+
+
+def flush_logs():
+    # Write out everything queued so far (tests, before reading the file)
+    _queue_handler.stop()
+
+
+def set_log_dir(log_dir):
+    # Later records go to a new file in log_dir, returns the previous one
+    _queue_handler.stop()
+    previous, _queue_handler.log_dir = _queue_handler.log_dir, log_dir
+    return previous
@@ -2,13 +2,16 @@ import sys
 import time
 import serial
 from core.serialHandler import SerialConnection
+from core.discovery import find_devices
 from core.utils.utils import channel, unit, amplitude, waveform
 from core.device.readFunctions import signalGenerator_read
 from core.device.writeFunctions import signalGenerator_write
 
 def main():
     try:
-        serial_conn = SerialConnection('COM2')  # Adjust 'COM2' as needed
+        devices = find_devices()
+        port = next(iter(devices.values())).port if devices else 'COM2'  # Adjust 'COM2' as needed
+        serial_conn = SerialConnection(port)
     except serial.SerialException:
         sys.exit(1)
 
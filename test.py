@@ -1,3 +1,5 @@
+import argparse
+import logging
 import sys
 import time
 import serial
@@ -5,10 +7,19 @@ import platform
 from core.device.writeFunctions import signalGenerator_write
 from core.device.readFunctions import signalGenerator_read
 from core.utils.utils import parameters, unit, waveform, channel, amplitude
-from logger import test_logger
+from logger import test_logger, set_level
 from core.serialHandler import SerialConnection
+from core.session import SessionRecorder, ReplayConnection
+from core.discovery import find_devices
+
+# Settling time between steps, skipped when replaying a recording at full speed
+pause = time.sleep
 
 def get_serial_port():
+    # A generator found by discovery wins over the per-OS default
+    devices = find_devices()
+    if devices:
+        return next(iter(devices.values())).port
     os_name = platform.system()
     if os_name == "Windows":
         return 'COM2'  # Adjust as needed
@@ -19,85 +30,105 @@ def get_serial_port():
 
 
 def test_waveforms(signal_gen_write, signal_gen_read, channel_num):
-    if parameters.TEST: test_logger.info(f"\n\nStarting waveform tests for Channel={channel_num}")
+    if parameters.TEST: test_logger.info("\n\nStarting waveform tests for Channel=%s", channel_num)
     for wf in range(17):  # There are 17 waveform types
-        if parameters.TEST: test_logger.info(f"Setting waveform: {wf} for Channel={channel_num}")
+        if parameters.TEST: test_logger.info("Setting waveform: %s for Channel=%s", wf, channel_num)
         
         signal_gen_write.set_waveform(channel_num, wf)
         signal_gen_write.set_channel_enable(channel_num)
-        time.sleep(0.5)
+        pause(0.5)
         
         signal_gen_write.set_channel_enable()
-        time.sleep(0.5)
+        pause(0.5)
     
     # Set waveform back to SQUARE after testing all waveforms
     signal_gen_write.set_waveform(channel_num, waveform.SQUARE)
     signal_gen_write.set_channel_enable()
-    time.sleep(0.5)
-    if parameters.TEST: test_logger.info(f"Set waveform back to SQUARE for Channel={channel_num}")
-    if parameters.TEST: test_logger.info(f"Completed waveform tests for Channel={channel_num}\n\n")
+    pause(0.5)
+    if parameters.TEST: test_logger.info("Set waveform back to SQUARE for Channel=%s", channel_num)
+    if parameters.TEST: test_logger.info("Completed waveform tests for Channel=%s\n\n", channel_num)
 
 def test_frequencies(signal_gen_write, signal_gen_read, channel_num):
-    if parameters.TEST: test_logger.info(f"\n\nStarting frequency tests for Channel={channel_num}")
+    if parameters.TEST: test_logger.info("\n\nStarting frequency tests for Channel=%s", channel_num)
     frequencies = [(1, unit.HZ), (1, unit.KHZ), (1, unit.MHZ)]
     for freq, freq_unit in frequencies:
         signal_gen_write.set_frequency(channel_num, freq, freq_unit)
         signal_gen_write.set_channel_enable(channel_num)
-        time.sleep(0.5)
+        pause(0.5)
         signal_gen_write.set_channel_enable()
-        time.sleep(0.5)
+        pause(0.5)
     # Reset frequency to default (1 kHz)
     signal_gen_write.set_frequency(channel_num, 1, unit.KHZ)
     signal_gen_write.set_channel_enable()
-    if parameters.TEST: test_logger.info(f"Completed frequency tests for Channel={channel_num}\n\n")
+    if parameters.TEST: test_logger.info("Completed frequency tests for Channel=%s\n\n", channel_num)
 
 def test_amplitudes(signal_gen_write, signal_gen_read, channel_num):
-    if parameters.TEST: test_logger.info(f"\n\nStarting amplitude tests for Channel={channel_num}")
+    if parameters.TEST: test_logger.info("\n\nStarting amplitude tests for Channel=%s", channel_num)
     amplitudes = [(1, amplitude.VOLT), (1, amplitude.MILLIVOLT)]
     for amp, amp_unit in amplitudes:
         signal_gen_write.set_amplitude(channel_num, amp, amp_unit)
         signal_gen_write.set_channel_enable(channel_num)
-        time.sleep(0.5)
+        pause(0.5)
         signal_gen_write.set_channel_enable()
-        time.sleep(0.5)
+        pause(0.5)
     # Reset amplitude to default (1 V)
     signal_gen_write.set_amplitude(channel_num, 3.3, amplitude.VOLT)
     signal_gen_write.set_channel_enable()
-    if parameters.TEST: test_logger.info(f"Completed amplitude tests for Channel={channel_num}\n\n")
+    if parameters.TEST: test_logger.info("Completed amplitude tests for Channel=%s\n\n", channel_num)
 
 def test_offsets(signal_gen_write, signal_gen_read, channel_num):
-    if parameters.TEST: test_logger.info(f"\n\nStarting offset tests for Channel={channel_num}")
+    if parameters.TEST: test_logger.info("\n\nStarting offset tests for Channel=%s", channel_num)
     offsets = [(1, amplitude.VOLT), (1, amplitude.MILLIVOLT)]
     for offset, offset_unit in offsets:
         signal_gen_write.set_offset(channel_num, offset, offset_unit)
         signal_gen_write.set_channel_enable(channel_num)
-        time.sleep(0.5)
+        pause(0.5)
         signal_gen_write.set_channel_enable()
-        time.sleep(0.5)
+        pause(0.5)
     # Reset offset to default (0 V)
     signal_gen_write.set_offset(channel_num, 0, amplitude.VOLT)
     signal_gen_write.set_channel_enable()
-    if parameters.TEST: test_logger.info(f"Completed offset tests for Channel={channel_num}\n\n")
+    if parameters.TEST: test_logger.info("Completed offset tests for Channel=%s\n\n", channel_num)
 
 def test_phases(signal_gen_write, signal_gen_read, channel_num):
-    if parameters.TEST: test_logger.info(f"\n\nStarting phase tests for Channel={channel_num}")
+    if parameters.TEST: test_logger.info("\n\nStarting phase tests for Channel=%s", channel_num)
     phases = [-360, -180, 0, 180, 360]
     for phase in phases:
         signal_gen_write.set_phase(channel_num, phase)
         signal_gen_write.set_channel_enable(channel_num)
-        time.sleep(0.5)
+        pause(0.5)
         signal_gen_write.set_channel_enable()
-        time.sleep(0.5)
+        pause(0.5)
     # Reset phase to default (0 degrees)
     signal_gen_write.set_phase(channel_num, 0)
     signal_gen_write.set_channel_enable()
-    if parameters.TEST: test_logger.info(f"Completed phase tests for Channel={channel_num}\n\n")
+    if parameters.TEST: test_logger.info("Completed phase tests for Channel=%s\n\n", channel_num)
+
+def main(argv=None):
+    global pause
+    parser = argparse.ArgumentParser(description="Hardware test sequence for both channels.")
+    parser.add_argument('--record', metavar='FILE', help="record the session to FILE")
+    parser.add_argument('--replay', metavar='FILE', help="run against a recorded session instead of hardware")
+    parser.add_argument('--as-recorded', action='store_true', help="replay with the recorded timing")
+    options = parser.parse_args(argv)
+    if parameters.TEST:
+        # Log every value read back, not only the settings
+        set_level(logging.DEBUG, 'core.device.readFunctions')
 
-def main():
     # Initialize serial connection
+    recorder = None
     try:
-        serial_port = get_serial_port()
-        serial_conn = SerialConnection(serial_port)
+        if options.replay:
+            mode = ReplayConnection.RECORDED if options.as_recorded else ReplayConnection.FAST
+            serial_conn = ReplayConnection(options.replay, mode=mode)
+            if not options.as_recorded:
+                pause = lambda seconds: None
+        else:
+            serial_port = get_serial_port()
+            serial_conn = SerialConnection(serial_port)
+            if options.record:
+                recorder = SessionRecorder(options.record)
+                recorder.attach(serial_conn)
         signal_gen_read = signalGenerator_read(serial_conn)
         signal_gen_write = signalGenerator_write(serial_conn)
         print("Serial port opened successfully.")
@@ -134,6 +165,9 @@ def main():
     if parameters.TEST: test_logger.info("Completed tests for Channel 2\n\n")
 
     if parameters.TEST: test_logger.info("\n\n##### Test finished successfully #####\n\n")
+    serial_conn.close()
+    if recorder is not None:
+        recorder.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,36 @@
+"""Helpers shared by the test modules (tests/ is on sys.path when they run)."""
+import atexit
+import tempfile
+import logger
+
+_log_dir = None
+
+
+def redirect_logs():
+    # Call from setUpModule(): test_logger output goes to one temporary
+    # directory for the whole run instead of the repository's test/logs/
+    global _log_dir
+    if _log_dir is None:
+        _log_dir = tempfile.TemporaryDirectory(prefix='jds6600-test-logs-')
+        logger.set_log_dir(_log_dir.name)
+        atexit.register(_remove_logs)
+    return _log_dir.name
+
+
+def _remove_logs():
+    # Registered after logger's own atexit hook, so it runs first: close
+    # the file before its directory goes
+    logger.flush_logs()
+    _log_dir.cleanup()
+
+
+class FakeClock:
+    # Virtual monotonic clock for clock=/sleep= hooks, sleep() advances it
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
@@ -0,0 +1,139 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from core.serialHandler import SerialConnection
+from core.device.readFunctions import signalGenerator_read
+from core.device.writeFunctions import signalGenerator_write
+from support import redirect_logs
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+if sys.platform.startswith('linux'):
+    from core.simulator import JDS6600Simulator
+
+if np is not None:
+    from core.device.arbitraryWaveform import quantise, encode_upload, decode_readback, ARB_POINTS, ARB_MAX
+    from core.device.waveformCache import ArbitraryWaveformCache, waveform_digest
+
+
+def setUpModule():
+    redirect_logs()
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestQuantise(unittest.TestCase):
+
+    def test_full_scale(self):
+        codes = quantise(np.array([-1.0, 1.0]))
+        self.assertEqual(codes.dtype, np.uint16)
+        self.assertEqual(len(codes), ARB_POINTS)
+        self.assertEqual(codes.min(), 0)
+        self.assertEqual(codes.max(), ARB_MAX)
+
+    def test_function_input(self):
+        codes = quantise(lambda phase: np.sin(2 * np.pi * phase))
+        self.assertEqual(codes[0], 2048)
+        self.assertEqual(codes[ARB_POINTS // 4], ARB_MAX)
+
+    def test_clip_and_normalize(self):
+        self.assertEqual(quantise(np.full(10, 5.0)).max(), ARB_MAX)
+        codes = quantise(np.linspace(0, 0.5, 4096), normalize=True)
+        self.assertEqual((codes.min(), codes.max()), (0, ARB_MAX))
+
+    def test_encode_and_decode(self):
+        codes = quantise(np.linspace(-1, 1, ARB_POINTS))
+        line = encode_upload(7, codes)
+        self.assertTrue(line.startswith(b':a07=0,'))
+        self.assertTrue(line.endswith(b',4095.\r\n'))
+        decoded = decode_readback(':b07=' + line.decode()[5:].strip())
+        np.testing.assert_array_equal(decoded, codes)
+
+    def test_invalid_slot(self):
+        with self.assertRaises(ValueError):
+            encode_upload(61, quantise(np.zeros(4)))
+        with self.assertRaises(ValueError):
+            signalGenerator_read(MagicMock()).get_arbitrary_waveform_data(0)
+
+    def test_bad_readback(self):
+        with self.assertRaises(ValueError):
+            decode_readback(':b01=1,2,3.')
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+@unittest.skipUnless(sys.platform.startswith('linux'), "simulator needs a Linux pty")
+class TestUploadSimulator(unittest.TestCase):
+
+    def test_upload_and_verify(self):
+        with JDS6600Simulator() as sim:
+            conn = SerialConnection(sim.port, timeout=0.5)
+            write = signalGenerator_write(conn)
+            read = signalGenerator_read(conn)
+            square = np.sign(np.sin(2 * np.pi * np.arange(500) / 500))
+            expected = quantise(square)
+            self.assertEqual(write.upload_arbitrary_waveform(3, square), ':ok')
+            np.testing.assert_array_equal(read.get_arbitrary_waveform_data(3), expected)
+            self.assertEqual(write.set_arbitrary_waveform(1, 3), ':ok')
+            conn.close()
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+@unittest.skipUnless(sys.platform.startswith('linux'), "simulator needs a Linux pty")
+class TestWaveformCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.index = os.path.join(self.tmp.name, 'waveforms.json')
+        self.sim = JDS6600Simulator().start()
+        self.conn = SerialConnection(self.sim.port, timeout=0.5)
+        self.write = signalGenerator_write(self.conn)
+        self.read = signalGenerator_read(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+        self.sim.stop()
+        self.tmp.cleanup()
+
+    def uploads(self):
+        return sum(1 for command in self.sim.commands if command.startswith(':a'))
+
+    def test_resident_waveform_is_only_selected(self):
+        cache = ArbitraryWaveformCache(self.write, self.read, path=self.index, slots=[1, 2])
+        sine = lambda phase: np.sin(2 * np.pi * phase)
+        self.assertEqual(cache.load(1, sine), (1, True))
+        self.assertEqual(cache.load(2, sine), (1, False))
+        self.assertEqual(self.uploads(), 1)
+        self.assertEqual(self.sim.registers[22], '101')
+
+    def test_lru_eviction(self):
+        cache = ArbitraryWaveformCache(self.write, self.read, path=self.index, slots=[4, 5])
+        a, b, c = (np.linspace(-1, 1, 8) * k for k in (0.2, 0.5, 0.9))
+        cache.load(1, a)
+        cache.load(1, b)
+        cache.load(1, a)           # a is now the most recently used
+        self.assertEqual(cache.load(1, c), (5, True))
+        self.assertEqual(cache.load(1, a), (4, False))
+
+    def test_index_persists_per_serial_number(self):
+        ArbitraryWaveformCache(self.write, self.read, path=self.index).load(1, np.zeros(4))
+        cache = ArbitraryWaveformCache(self.write, self.read, path=self.index).open()
+        self.assertEqual(cache.load(1, np.zeros(4)), (1, False))
+        self.sim.serial_number = '5555555555'
+        other = ArbitraryWaveformCache(self.write, self.read, path=self.index).open()
+        self.assertEqual(other.load(1, np.zeros(4)), (1, True))
+
+    def test_verify_drops_stale_slot(self):
+        cache = ArbitraryWaveformCache(self.write, self.read, path=self.index)
+        cache.load(1, np.ones(4))
+        self.assertTrue(cache.verify(1))
+        self.write.upload_arbitrary_waveform(1, -np.ones(4))  # changed behind the cache
+        reopened = ArbitraryWaveformCache(self.write, self.read, path=self.index).open(verify_recent=1)
+        self.assertIsNone(reopened.find(waveform_digest(quantise(np.ones(4)))))
+
+
+if __name__ == '__main__': # pragma: no cover
+    unittest.main()
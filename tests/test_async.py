@@ -0,0 +1,119 @@
+import asyncio
+import sys
+import unittest
+import serial
+from core.asyncSerialHandler import AsyncSerialConnection
+from core.device.asyncFunctions import asyncSignalGenerator_read, asyncSignalGenerator_write
+from core.device.channelConfig import ChannelConfig
+from core.device.registerCache import RegisterCache
+from core.utils.utils import channel, unit, waveform
+from support import redirect_logs
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+if sys.platform.startswith('linux'):
+    from core.simulator import JDS6600Simulator
+
+
+def setUpModule():
+    redirect_logs()
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), "simulator needs a Linux pty")
+class TestAsyncDriver(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.device = JDS6600Simulator().start()
+        self.conn = await AsyncSerialConnection.open(self.device.port, timeout=0.5)
+        self.writer = asyncSignalGenerator_write(self.conn)
+        self.reader = asyncSignalGenerator_read(self.conn)
+
+    async def asyncTearDown(self):
+        await self.conn.close()
+        self.device.stop()
+
+    async def test_write_then_read(self):
+        self.assertEqual(await self.writer.set_frequency(channel.CH1, 1, unit.KHZ), ':ok')
+        self.assertEqual(await self.reader.get_frequency(channel.CH1), ':r23=100000,0.')
+
+    async def test_apply_burst(self):
+        results = await self.writer.apply(channel.CH2, ChannelConfig(waveform=waveform.SQUARE, amplitude=1, enable=True))
+        self.assertEqual(results, {22: ':ok', 26: ':ok', 20: ':ok'})
+        self.assertEqual(self.device.registers[20], '0,1')
+
+    async def test_concurrent_commands_do_not_interleave(self):
+        await self.writer.set_waveform(channel.CH1, waveform.SINE)
+        await self.writer.set_waveform(channel.CH2, waveform.PULSE)
+        responses = await asyncio.gather(self.reader.get_waveform(channel.CH1),
+                                         self.reader.get_waveform(channel.CH2))
+        self.assertEqual(responses, [':r21=0.', ':r22=2.'])
+
+    async def test_validation_happens_before_sending(self):
+        with self.assertRaises(ValueError):
+            await self.writer.set_phase(channel.CH1, 400)
+        self.assertEqual(self.device.commands, [])
+
+    async def test_timeout_returns_empty(self):
+        self.device.latency = 0.3
+        self.assertEqual(await self.conn.send_command(':r23=', timeout=0.05), '')
+        self.device.latency = 0.0
+        await asyncio.sleep(0.35)  # Late reply is discarded
+        self.assertEqual(await self.conn.send_command(':w21=1.'), ':ok')
+
+    async def test_shared_cache(self):
+        cache = RegisterCache()
+        writer = asyncSignalGenerator_write(self.conn, cache=cache)
+        reader = asyncSignalGenerator_read(self.conn, cache=cache, max_age=None)
+        self.assertEqual(await writer.set_waveform(channel.CH1, waveform.SQUARE), ':ok')
+        self.assertEqual(await writer.set_waveform(channel.CH1, waveform.SQUARE), ':ok')
+        self.assertEqual(await writer.apply(channel.CH1, ChannelConfig(waveform=waveform.SQUARE, amplitude=1)),
+                         {21: ':ok', 25: ':ok'})
+        self.assertEqual(await reader.get_waveform(channel.CH1), ':r21=1.')
+        # Only the first waveform write and the amplitude reached the device
+        self.assertEqual(self.device.commands, [':w21=1.', ':w25=1000.'])
+
+    async def test_priority_goes_ahead_of_queued_commands(self):
+        self.device.latency = 0.05
+        writer = asyncSignalGenerator_write(self.conn, priority=True)
+        busy = asyncio.create_task(self.conn.send_command(':r23='))
+        await asyncio.sleep(0.01)
+        polls = [asyncio.create_task(self.reader.get_waveform(channel.CH1)) for _ in range(2)]
+        await asyncio.sleep(0)
+        self.assertEqual(await writer.set_waveform(channel.CH1, waveform.SQUARE), ':ok')
+        await asyncio.gather(busy, *polls)
+        self.assertEqual(self.device.commands, [':r23=', ':w21=1.', ':r21=', ':r21='])
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    async def test_arbitrary_upload_and_readback(self):
+        square = np.sign(np.sin(2 * np.pi * np.arange(500) / 500))
+        self.assertEqual(await self.writer.upload_arbitrary_waveform(3, square), ':ok')
+        codes = await self.reader.get_arbitrary_waveform_data(3)
+        self.assertEqual(len(codes), 2048)
+        self.assertEqual(self.device.waveforms[3], ','.join(str(code) for code in codes))
+        with self.assertRaises(ValueError):
+            await self.reader.get_arbitrary_waveform_data(61)
+
+    async def test_cancelled_reply_is_skipped(self):
+        self.device.latency = 0.1
+        task = asyncio.create_task(self.conn.send_command(':r21='))
+        await asyncio.sleep(0.02)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.device.latency = 0.0
+        self.assertEqual(await self.conn.send_command(':w21=3.'), ':ok')
+
+    async def test_hangup_fails_waiting_command(self):
+        self.device.latency = 0.2
+        task = asyncio.create_task(self.conn.send_command(':r21=', timeout=5))
+        await asyncio.sleep(0.05)
+        self.device.stop()  # reads of the port now fail with EIO
+        with self.assertRaises(serial.SerialException):
+            await asyncio.wait_for(task, 1)
+
+
+if __name__ == '__main__': # pragma: no cover
+    unittest.main()
@@ -0,0 +1,168 @@
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from core.daemon import ControlDaemon, DaemonClient, DaemonConnection, DaemonError, OP_COMMAND, OP_BATCH
+from core.policy import PolicyConnection, RetryPolicy
+from core.serialHandler import SerialConnection
+from core.device.channelConfig import ChannelConfig
+from core.device.writeFunctions import signalGenerator_write
+from core.utils.utils import channel, unit, waveform
+from support import redirect_logs
+
+if sys.platform.startswith('linux'):
+    from core.simulator import JDS6600Simulator
+
+
+def setUpModule():
+    redirect_logs()
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), "simulator needs a Linux pty")
+class TestControlDaemon(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.sim = JDS6600Simulator().start()
+        self.conn = SerialConnection(self.sim.port, timeout=0.5)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'jds6600.sock')
+        self.daemon = await ControlDaemon(self.conn, self.path).start()
+
+    async def asyncTearDown(self):
+        await self.daemon.stop()
+        self.conn.close()
+        self.sim.stop()
+
+    async def test_reads_coalesce(self):
+        futures = [self.daemon.submit(OP_COMMAND, b':r23=') for _ in range(5)]
+        futures.append(self.daemon.submit(OP_COMMAND, b':r24='))
+        replies = await asyncio.gather(*futures)
+        self.assertEqual(replies[:5], [b':r23=100000,0.'] * 5)
+        self.assertEqual(self.sim.commands, [':r23=', ':r24='])
+        self.assertEqual(self.daemon.stats['coalesced_reads'], 4)
+
+    async def test_superseded_writes_merge(self):
+        futures = [self.daemon.submit(OP_COMMAND, f':w25={value}.'.encode()) for value in (1000, 2000, 3000)]
+        self.assertEqual(await asyncio.gather(*futures), [b':ok'] * 3)
+        self.assertEqual(self.sim.commands, [':w25=3000.'])
+        self.assertEqual(self.daemon.stats['merged_writes'], 2)
+
+    async def test_read_after_write_is_not_merged_across(self):
+        futures = [self.daemon.submit(OP_COMMAND, b':r25='),
+                   self.daemon.submit(OP_COMMAND, b':w25=4000.'),
+                   self.daemon.submit(OP_COMMAND, b':r25='),
+                   self.daemon.submit(OP_COMMAND, b':w25=6000.')]
+        replies = await asyncio.gather(*futures)
+        self.assertEqual(replies, [b':r25=5000.', b':ok', b':r25=4000.', b':ok'])
+        self.assertEqual(self.sim.registers[25], '6000')
+
+    async def test_burst_is_a_barrier(self):
+        futures = [self.daemon.submit(OP_COMMAND, b':w21=1.'),
+                   self.daemon.submit(OP_BATCH, b':w21=2.\n:r21='),
+                   self.daemon.submit(OP_COMMAND, b':w21=3.')]
+        replies = await asyncio.gather(*futures)
+        self.assertEqual(replies[1], b':ok\n:r21=2.')
+        self.assertEqual(self.sim.commands, [':w21=1.', ':w21=2.', ':r21=', ':w21=3.'])
+
+    async def test_client_api(self):
+        def session():
+            with DaemonClient(self.path) as client:
+                client.write.set_frequency(channel.CH2, 2, unit.KHZ)
+                results = client.write.apply(channel.CH1, ChannelConfig(waveform=waveform.PULSE, enable=True))
+                return results, client.read.get_frequency(channel.CH2), client.read.snapshot()
+        results, frequency, state = await asyncio.to_thread(session)
+        self.assertEqual(results, {21: ':ok', 20: ':ok'})
+        self.assertEqual(frequency, ':r24=200000,0.')
+        self.assertEqual(state.ch1.waveform, waveform.PULSE)
+        self.assertEqual(state.ch2.frequency, 2000)
+
+    async def test_policy_deadline(self):
+        def session():
+            connection = PolicyConnection(DaemonConnection(self.path), RetryPolicy())
+            try:
+                with connection.deadline(1):
+                    return connection.send_command(':r26=')
+            finally:
+                connection.serial_connection.close()
+        self.assertEqual(await asyncio.to_thread(session), ':r26=5000.')
+        self.assertEqual(self.sim.commands, [':r26='])
+
+    async def test_concurrent_clients(self):
+        self.sim.latency = 0.002  # keeps the port busy so requests queue up
+        def poll():
+            connection = DaemonConnection(self.path)
+            try:
+                return [connection.send_command(':r26=') for _ in range(20)]
+            finally:
+                connection.close()
+        replies = await asyncio.gather(*(asyncio.to_thread(poll) for _ in range(4)))
+        self.assertTrue(all(reply == ':r26=5000.' for client in replies for reply in client))
+        coalesced = self.daemon.stats['coalesced_reads']
+        self.assertGreater(coalesced, 0)
+        self.assertEqual(len(self.sim.commands), 80 - coalesced)
+
+    async def test_transaction_holds_the_device(self):
+        entered = threading.Event()
+        def read_modify_write():
+            connection = DaemonConnection(self.path)
+            try:
+                with connection.transaction():
+                    value = connection.send_command(':r25=')
+                    entered.set()
+                    time.sleep(0.1)  # the other client's write has to wait
+                    connection.send_command(f':w25={int(value[5:-1]) + 1}.')
+            finally:
+                connection.close()
+        def interfere():
+            entered.wait(1)
+            connection = DaemonConnection(self.path)
+            try:
+                return connection.send_command(':w25=9000.')
+            finally:
+                connection.close()
+        await asyncio.gather(asyncio.to_thread(read_modify_write), asyncio.to_thread(interfere))
+        self.assertEqual(self.sim.commands, [':r25=', ':w25=5001.', ':w25=9000.'])
+        self.assertEqual(self.daemon.stats['transactions'], 1)
+
+    async def test_timed_out_connection_is_not_reused(self):
+        holding, done = threading.Event(), threading.Event()
+        def holder():
+            connection = DaemonConnection(self.path)
+            try:
+                with connection.transaction():
+                    holding.set()
+                    done.wait(2)
+                return connection.send_command(':r00=')
+            finally:
+                connection.close()
+        def blocked():
+            holding.wait(2)
+            connection = DaemonConnection(self.path, timeout=0.1)
+            try:
+                with self.assertRaises(TimeoutError):
+                    connection.send_command(':r23=')
+                # Its late reply must not be taken for this one
+                with self.assertRaises(DaemonError):
+                    connection.send_command(':r00=')
+            finally:
+                connection.close()
+                done.set()
+        reply, _ = await asyncio.gather(asyncio.to_thread(holder), asyncio.to_thread(blocked))
+        self.assertEqual(reply, ':r00=1234567890.')
+
+    async def test_priority_writer(self):
+        def write():
+            connection = DaemonConnection(self.path)
+            try:
+                return signalGenerator_write(connection, priority=True).set_waveform(channel.CH1, waveform.SQUARE)
+            finally:
+                connection.close()
+        self.assertEqual(await asyncio.to_thread(write), ':ok')
+
+
+if __name__ == '__main__': # pragma: no cover
+    unittest.main()
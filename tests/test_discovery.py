@@ -0,0 +1,110 @@
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from core.discovery import DeviceInfo, PortMap, discover, probe
+from core.serialHandler import SerialConnection
+from support import redirect_logs
+
+if sys.platform.startswith('linux'):
+    from core.simulator import JDS6600Simulator
+
+
+def setUpModule():
+    redirect_logs()
+
+
+class NoisyConnection:
+    # Some other device that answers with bytes that are not UTF-8
+    def __init__(self, port, timeout):
+        pass
+
+    def send_commands(self, commands):
+        return [SerialConnection._decode_reply(b'\xff\xfe\x80\r\n') for _ in commands]
+
+    def close(self):
+        pass
+
+
+class TestProbe(unittest.TestCase):
+
+    def test_undecodable_reply_is_not_a_generator(self):
+        self.assertIsNone(probe('/dev/noisy', connection_factory=NoisyConnection))
+        self.assertEqual(discover(['/dev/noisy'], connection_factory=NoisyConnection), {})
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), "simulator needs a Linux pty")
+class TestDiscovery(unittest.TestCase):
+
+    def setUp(self):
+        self.sims = [JDS6600Simulator(serial_number=f'10000000{i:02d}').start() for i in range(3)]
+        for sim in self.sims:
+            self.addCleanup(sim.stop)
+        self.ports = [sim.port for sim in self.sims] + ['/dev/does-not-exist']
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'ports.json')
+        self.opened = []
+
+    def connect(self, port, timeout):
+        self.opened.append(port)
+        return SerialConnection(port, timeout=timeout)
+
+    def test_probe(self):
+        self.assertEqual(probe(self.sims[0].port), DeviceInfo(self.sims[0].port, '1000000000', '60'))
+        self.assertEqual(self.sims[0].commands, [':r00=', ':r01='])
+        self.assertIsNone(probe('/dev/does-not-exist'))
+
+    def test_discover_in_parallel(self):
+        start = time.perf_counter()
+        devices = discover(self.ports)
+        elapsed = time.perf_counter() - start
+        self.assertEqual(sorted(devices), ['1000000000', '1000000001', '1000000002'])
+        self.assertEqual(devices['1000000002'].port, self.sims[2].port)
+        self.assertLess(elapsed, 1.0)
+
+    def test_cached_ports_are_revalidated_only(self):
+        PortMap(self.path).refresh(self.ports)
+        port_map = PortMap(self.path, connection_factory=self.connect)
+        devices = port_map.refresh(self.ports)
+        self.assertEqual(len(devices), 3)
+        # Nothing moved: the non-generator port is not probed again
+        self.assertEqual(sorted(self.opened), sorted(sim.port for sim in self.sims))
+
+    def test_moved_device_triggers_rescan(self):
+        PortMap(self.path).refresh(self.ports)
+        with open(self.path) as f:
+            cached = json.load(f)
+        # Pretend the first two generators swapped ports since the last run
+        first, second = cached['1000000000'][0], cached['1000000001'][0]
+        cached['1000000000'][0], cached['1000000001'][0] = second, first
+        with open(self.path, 'w') as f:
+            json.dump(cached, f)
+        port_map = PortMap(self.path)
+        self.assertEqual(port_map.port_for('1000000000', self.ports), self.sims[0].port)
+        self.assertEqual(port_map.devices['1000000001'].port, self.sims[1].port)
+
+    def test_vanished_port_triggers_rescan(self):
+        # The first generator re-enumerated: its cached port is gone
+        with open(self.path, 'w') as f:
+            json.dump({'1000000000': ['/dev/gone', '1000000000', '60'],
+                       '1000000001': [self.sims[1].port, '1000000001', '60']}, f)
+        devices = PortMap(self.path).refresh([self.sims[0].port, self.sims[1].port])
+        self.assertEqual(sorted(devices), ['1000000000', '1000000001'])
+        self.assertEqual(devices['1000000000'].port, self.sims[0].port)
+
+    def test_unwritable_cache_is_not_fatal(self):
+        with open(self.path, 'w') as f:
+            f.write('not a directory')
+        devices = PortMap(os.path.join(self.path, 'ports.json')).refresh(self.ports)
+        self.assertEqual(len(devices), 3)
+
+    def test_unknown_serial_number(self):
+        with self.assertRaises(ValueError):
+            PortMap(self.path).port_for('999', self.ports)
+
+
+if __name__ == '__main__': # pragma: no cover
+    unittest.main()
@@ -0,0 +1,155 @@
+import asyncio
+import itertools
+import math
+import os
+import sys
+import tempfile
+import unittest
+from core.measurement import MeasurementStream, Sample, decode_measurement, measurement_command
+from core.serialHandler import SerialConnection
+from core.device.readFunctions import signalGenerator_read
+from core.device.writeFunctions import signalGenerator_write
+from core.utils.utils import channel, unit
+from support import FakeClock, redirect_logs
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+if sys.platform.startswith('linux'):
+    from core.simulator import JDS6600Simulator
+    from core.asyncSerialHandler import AsyncSerialConnection
+
+
+def setUpModule():
+    redirect_logs()
+
+
+class ScriptedConnection:
+    # Answers measurement reads from a list of frequencies (Hz), one per poll,
+    # taking `busy` seconds of virtual time per poll
+    def __init__(self, clock, frequencies, busy=0.0):
+        self.clock = clock
+        self.frequencies = iter(frequencies)
+        self.busy = busy
+        self.polls = []
+
+    def send_commands(self, commands):
+        self.polls.append(self.clock())
+        self.clock.sleep(self.busy)
+        value = next(self.frequencies)
+        return [f':r81={round(value * 10)}.' if value is not None else '' for _ in commands]
+
+
+class TestMeasurementStream(unittest.TestCase):
+
+    def test_decode(self):
+        self.assertEqual(measurement_command('period'), ':r85=')
+        self.assertEqual(decode_measurement('frequency', ':r81=12345.'), 1234.5)
+        self.assertEqual(decode_measurement('period', ':r85=1000000.'), 0.001)
+        for response in ('', ':r82=1.', ':r81=abc.', ':ok'):
+            with self.subTest(response=response), self.assertRaises(ValueError):
+                decode_measurement('frequency', response)
+        with self.assertRaises(ValueError):
+            measurement_command('voltage')
+
+    def test_fixed_rate(self):
+        clock = FakeClock()
+        conn = ScriptedConnection(clock, [100, 200, 300])
+        stream = MeasurementStream(conn, rate=10, clock=clock, sleep=clock.sleep)
+        samples = list(itertools.islice(stream, 3))
+        self.assertEqual([s.values for s in samples], [(100.0,), (200.0,), (300.0,)])
+        self.assertEqual(conn.polls, [0.0, 0.1, 0.2])
+        self.assertAlmostEqual(samples[2].time, 0.2)
+
+    def test_late_polls_skip_slots(self):
+        clock = FakeClock()
+        conn = ScriptedConnection(clock, [1] * 3, busy=0.25)
+        stream = MeasurementStream(conn, rate=10, clock=clock, sleep=clock.sleep)
+        list(itertools.islice(stream, 3))
+        # A late poll goes out at once for the current slot, the slots it
+        # missed (0.1, 0.3, 0.4) are skipped rather than sent back to back
+        self.assertEqual([round(t, 6) for t in conn.polls], [0.0, 0.25, 0.5])
+        self.assertEqual(stream.overruns, 3)
+
+    def test_decimation_and_malformed(self):
+        clock = FakeClock()
+        conn = ScriptedConnection(clock, [100, 300, 500, None])
+        stream = MeasurementStream(conn, rate=10, decimation=2, clock=clock, sleep=clock.sleep)
+        first, second = itertools.islice(stream, 2)
+        self.assertEqual(first.values, (200.0,))
+        self.assertAlmostEqual(first.time, 0.05)
+        self.assertTrue(math.isnan(second.values[0]))
+        self.assertEqual((stream.polls, stream.malformed), (4, 1))
+
+    def test_invalid_arguments(self):
+        for kwargs in ({'rate': 0}, {'decimation': 0}, {'quantities': ('voltage',)}):
+            with self.subTest(kwargs=kwargs), self.assertRaises(ValueError):
+                MeasurementStream(None, **kwargs)
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), "simulator needs a Linux pty")
+class TestMeasurementSimulator(unittest.TestCase):
+
+    def setUp(self):
+        self.sim = JDS6600Simulator().start()
+        self.addCleanup(self.sim.stop)
+        self.conn = SerialConnection(self.sim.port, timeout=0.5)
+        self.addCleanup(self.conn.close)
+        self.read = signalGenerator_read(self.conn)
+
+    def test_readout(self):
+        signalGenerator_write(self.conn).set_frequency(channel.CH1, 2, unit.KHZ)
+        self.assertEqual(self.read.get_measurement('frequency'), 2000)
+        self.assertEqual(self.read.get_measurement('period'), 0.0005)
+        self.assertEqual(self.read.get_measurement('duty_cycle'), 50)
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_to_array(self):
+        stream = self.read.measurement_stream(('frequency', 'duty_cycle'), rate=200)
+        rows = stream.to_array(5)
+        self.assertEqual(rows.shape, (5, 3))
+        self.assertTrue((rows[:, 1] == 1000).all())
+        self.assertTrue((np.diff(rows[:, 0]) > 0).all())
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_record_to_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run.npy')
+            stream = self.read.measurement_stream(('frequency',), rate=500)
+            stream.record(path, 20)
+            rows = np.load(path)
+        self.assertEqual(rows.shape, (20, 2))
+        self.assertTrue((rows[:, 1] == 1000).all())
+
+    def test_async_with_blocking_connection(self):
+        async def first_samples():
+            stream = self.read.measurement_stream(rate=100)
+            samples = []
+            async for sample in stream:
+                samples.append(sample)
+                if len(samples) == 3:
+                    return samples
+        samples = asyncio.run(first_samples())
+        self.assertEqual([s.values for s in samples], [(1000.0,)] * 3)
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), "simulator needs a Linux pty")
+class TestMeasurementAsync(unittest.IsolatedAsyncioTestCase):
+
+    async def test_async_connection(self):
+        with JDS6600Simulator() as sim:
+            conn = await AsyncSerialConnection.open(sim.port, timeout=0.5)
+            try:
+                stream = MeasurementStream(conn, ('frequency', 'period'), rate=100)
+                async for sample in stream:
+                    break
+            finally:
+                await conn.close()
+        self.assertIsInstance(sample, Sample)
+        self.assertEqual(sample.values, (1000.0, 0.001))
+
+
+if __name__ == '__main__': # pragma: no cover
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import sys
+import tempfile
+import unittest
+from core.metrics import CommandMetrics, Histogram, command_labels, prometheus_text, write_prometheus
+from core.serialHandler import SerialConnection
+from core.device.readFunctions import signalGenerator_read
+from core.device.writeFunctions import signalGenerator_write
+from core.utils.utils import channel, unit
+from support import redirect_logs
+
+if sys.platform.startswith('linux'):
+    from core.simulator import JDS6600Simulator
+
+
+def setUpModule():
+    redirect_logs()
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_buckets_and_quantiles(self):
+        histogram = Histogram((0.001, 0.01, 0.1))
+        for value in (0.0005, 0.002, 0.003, 0.05, 3.0):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [1, 2, 1, 1])
+        self.assertEqual(histogram.count, 5)
+        self.assertEqual(histogram.quantile(0.5), 0.01)
+        self.assertEqual(histogram.quantile(1.0), float('inf'))
+
+    def test_command_labels(self):
+        self.assertEqual(command_labels(':r23='), ('read', '23'))
+        self.assertEqual(command_labels(b':w24=100,0.\r\n'), ('write', '24'))
+        self.assertEqual(command_labels('garbage'), ('other', ''))
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), "simulator needs a Linux pty")
+class TestConnectionMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.sim = JDS6600Simulator().start()
+        self.metrics = CommandMetrics(phases=True)
+        self.conn = SerialConnection(self.sim.port, timeout=0.2, metrics=self.metrics)
+        self.read = signalGenerator_read(self.conn)
+        self.write = signalGenerator_write(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+        self.sim.stop()
+
+    def test_commands_and_bytes(self):
+        self.write.set_frequency(channel.CH1, 1, unit.KHZ)
+        self.read.get_frequency(channel.CH1)
+        self.conn.send_commands([':r25=', ':r26='])
+        stats = self.metrics.stats()
+        self.assertEqual(stats['port'], self.sim.port)
+        self.assertEqual(stats['commands'], 4)
+        self.assertEqual(stats['latency']['write:23']['count'], 1)
+        self.assertEqual(stats['latency']['read:25']['count'], 1)
+        self.assertEqual(stats['bytes_sent'], len(':w23=100000,0.\r\n') + 3 * len(':r23=\r\n'))
+        self.assertEqual(stats['phases']['wait_reply']['count'], 2)
+
+    def test_timeouts_and_malformed(self):
+        self.assertEqual(self.conn.send_command('garbage'), '')
+        self.assertEqual(self.conn.send_commands([':r23=', 'garbage']), [':r23=100000,0.', ''])
+        with self.assertRaises(ValueError):
+            self.read._report_frequency(':r23=abc.')
+        stats = self.metrics.stats()
+        self.assertEqual(stats['timeouts'], 2)
+        self.assertEqual(stats['timeouts_by_register'], {'other:': 2})
+        self.assertEqual(stats['latency']['read:23']['count'], 1)
+        self.assertEqual(stats['malformed_by_operation'], {'frequency': 1})
+
+    def test_metrics_attached_mid_burst(self):
+        self.conn.metrics = None
+        with self.conn.pipeline() as pipe:
+            early = [pipe.submit(':r23='), pipe.submit(':r24=')]
+            self.conn.metrics = self.metrics
+            late = pipe.submit(':r25=')
+        self.assertEqual([p.result() for p in early + [late]], [':r23=100000,0.', ':r24=100000,0.', ':r25=5000.'])
+        # Only the command sent after attaching has a start time to measure from
+        self.assertEqual(self.metrics.stats()['commands'], 1)
+
+    def test_prometheus_export(self):
+        self.read.get_waveform(channel.CH2)
+        text = prometheus_text(self.metrics)
+        port = self.sim.port
+        self.assertIn('# TYPE jds6600_command_duration_seconds histogram', text)
+        self.assertIn(f'jds6600_command_duration_seconds_count{{port="{port}",operation="read",register="22"}} 1', text)
+        self.assertIn(f'jds6600_commands_total{{port="{port}",operation="read",register="22"}} 1', text)
+        self.assertIn(f'jds6600_command_duration_seconds_bucket{{port="{port}",operation="read",register="22",le="+Inf"}} 1', text)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'jds6600.prom')
+            write_prometheus(path, self.metrics)
+            with open(path) as f:
+                self.assertEqual(f.read(), text)
+
+    def test_reset(self):
+        self.read.get_waveform(channel.CH1)
+        self.metrics.reset()
+        self.assertEqual(self.metrics.stats()['commands'], 0)
+
+
+if __name__ == '__main__': # pragma: no cover
+    unittest.main()
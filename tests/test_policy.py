@@ -0,0 +1,148 @@
+import sys
+import time
+import unittest
+from core.policy import PolicyConnection, RetryPolicy, ResponseError, DeadlineExceeded
+from core.serialHandler import SerialConnection
+from core.device.channelConfig import ChannelConfig
+from core.device.writeFunctions import signalGenerator_write
+from core.utils.utils import channel, waveform
+from support import redirect_logs
+
+if sys.platform.startswith('linux'):
+    from core.simulator import JDS6600Simulator
+
+    class FlakySimulator(JDS6600Simulator):
+        # Drops or garbles the reply to selected commands, `times` times each;
+        # commands in `late` are answered that many seconds late, once
+        def __init__(self, faults, times=1, late=None):
+            super().__init__()
+            self.faults = faults
+            self.remaining = {command: times for command in faults}
+            self.late = dict(late or {})
+
+        def handle(self, command):
+            reply = super().handle(command)
+            if command in self.late:
+                time.sleep(self.late.pop(command))
+            if self.remaining.get(command, 0) > 0:
+                self.remaining[command] -= 1
+                return self.faults[command]
+            return reply
+
+
+def setUpModule():
+    redirect_logs()
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_expected_responses(self):
+        policy = RetryPolicy()
+        self.assertTrue(policy.valid(':w23=100000,0.', ':ok'))
+        self.assertFalse(policy.valid(':w23=100000,0.', ':r23=100000,0.'))
+        self.assertTrue(policy.valid(':r23=', ':r23=100000,0.'))
+        self.assertFalse(policy.valid(':r23=', ':r24=100000,0.'))
+        self.assertFalse(policy.valid(':r23=', ':r23=1000'))
+        self.assertFalse(policy.valid(':r23=', ''))
+
+    def test_custom_matcher(self):
+        policy = RetryPolicy(expected={'w': lambda command, response: response in (':ok', ':OK')})
+        self.assertTrue(policy.valid(':w20=1,0.', ':OK'))
+
+    def test_jittered_backoff(self):
+        policy = RetryPolicy(backoff=0.1, jitter=0.5, seed=1)
+        delays = [policy.delay(attempt) for attempt in (1, 2, 3)]
+        for delay, base in zip(delays, (0.1, 0.2, 0.4)):
+            self.assertGreaterEqual(delay, base * 0.5)
+            self.assertLessEqual(delay, base * 1.5)
+
+    def test_non_idempotent(self):
+        policy = RetryPolicy(non_idempotent={40})
+        self.assertFalse(policy.idempotent(':w40=1.'))
+        self.assertTrue(policy.idempotent(':r40='))
+        self.assertTrue(policy.idempotent(':w23=100000,0.'))
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), "simulator needs a Linux pty")
+class TestPolicyConnection(unittest.TestCase):
+
+    def connect(self, faults, times=1, late=None, **policy):
+        self.sim = FlakySimulator(faults, times, late).start()
+        self.addCleanup(self.sim.stop)
+        serial_conn = SerialConnection(self.sim.port, timeout=0.1)
+        self.addCleanup(serial_conn.close)
+        return PolicyConnection(serial_conn, RetryPolicy(backoff=0.001, **policy))
+
+    def test_lost_reply_is_resent(self):
+        conn = self.connect({':r23=': None})
+        self.assertEqual(conn.send_command(':r23='), ':r23=100000,0.')
+        self.assertEqual(conn.stats, {'commands': 1, 'retries': 1, 'invalid': 0, 'timeouts': 1, 'failed': 0})
+
+    def test_wrong_reply_is_resent(self):
+        conn = self.connect({':w25=1000.': ':r25=5000.'})
+        self.assertEqual(conn.send_command(':w25=1000.'), ':ok')
+        self.assertEqual(conn.stats['invalid'], 1)
+
+    def test_gives_up(self):
+        conn = self.connect({':w25=1000.': ':err'}, times=5, retries=2)
+        with self.assertRaises(ResponseError) as raised:
+            conn.send_command(':w25=1000.')
+        self.assertEqual(raised.exception.response, ':err')
+        self.assertEqual(self.sim.commands.count(':w25=1000.'), 3)
+        self.assertEqual(conn.stats['failed'], 1)
+
+    def test_non_idempotent_write_is_not_resent(self):
+        conn = self.connect({':w40=1.': None}, non_idempotent={40})
+        with self.assertRaises(ResponseError):
+            conn.send_command(':w40=1.')
+        self.assertEqual(self.sim.commands, [':w40=1.'])
+
+    def test_late_reply_is_not_taken_for_the_next_one(self):
+        conn = self.connect({}, late={':w25=1000.': 0.15})
+        self.assertEqual(conn.send_command(':w25=1000.'), ':ok')
+        self.assertEqual([conn.send_command(command) for command in (':r23=', ':r24=', ':r25=')],
+                         [':r23=100000,0.', ':r24=100000,0.', ':r25=1000.'])
+        self.assertEqual(conn.stats, {'commands': 4, 'retries': 1, 'invalid': 0, 'timeouts': 1, 'failed': 0})
+
+    def test_late_reply_in_burst(self):
+        conn = self.connect({}, late={':w21=1.': 0.15})
+        self.assertEqual(conn.send_commands([':w21=1.', ':r21=', ':r22=']), [':ok', ':r21=1.', ':r22=0.'])
+        self.assertEqual(conn.send_command(':r23='), ':r23=100000,0.')
+        self.assertEqual(conn.stats['invalid'], 0)
+
+    def test_burst_resends_failure_and_everything_after_it(self):
+        conn = self.connect({':w22=1.': ':err'})
+        writer = signalGenerator_write(conn)
+        results = writer.apply((channel.CH1, channel.CH2), ChannelConfig(waveform=waveform.SQUARE, enable=True))
+        self.assertEqual(set(results.values()), {':ok'})
+        # Outputs are still enabled last, after CH2's waveform went through
+        self.assertEqual(self.sim.commands, [':w21=1.', ':w22=1.', ':w20=1,1.', ':w22=1.', ':w20=1,1.'])
+        self.assertEqual(conn.stats['retries'], 1)
+
+    def test_burst_does_not_repeat_non_idempotent_commands(self):
+        conn = self.connect({':w22=1.': ':err'}, non_idempotent={40})
+        with self.assertRaises(ResponseError):
+            conn.send_commands([':w22=1.', ':w40=1.'])
+        self.assertEqual(self.sim.commands, [':w22=1.', ':w40=1.'])
+
+    def test_superseded_write_is_not_resent(self):
+        conn = self.connect({':w25=1000.': ':err'})
+        self.assertEqual(conn.send_commands([':w25=1000.', ':w25=2000.']), [':err', ':ok'])
+        self.assertEqual(conn.stats['retries'], 0)
+
+    def test_deadline(self):
+        conn = self.connect({':r23=': None}, times=100, retries=100)
+        start = time.monotonic()
+        with self.assertRaises(DeadlineExceeded), conn.deadline(0.25):
+            conn.send_command(':r23=')
+        self.assertLess(time.monotonic() - start, 0.4)
+
+    def test_passes_through(self):
+        conn = self.connect({})
+        with conn.transaction():
+            self.assertEqual(conn.send_commands([':r20=', ':r21=']), [':r20=0,0.', ':r21=0.'])
+        self.assertIsNone(conn.metrics)
+
+
+if __name__ == '__main__': # pragma: no cover
+    unittest.main()
@@ -0,0 +1,117 @@
+import os
+import sys
+import tempfile
+import unittest
+from core.sequence import compile_sequence, load_sequence, SequenceError, VirtualClock
+from core.serialHandler import SerialConnection
+from support import redirect_logs
+
+if sys.platform.startswith('linux'):
+    from core.simulator import JDS6600Simulator
+
+TOGGLE = [{"enable": True, "dwell": 0.5}, {"enable": False, "dwell": 0.5}]
+
+
+def setUpModule():
+    redirect_logs()
+
+
+class TestCompile(unittest.TestCase):
+
+    def test_loop_schedule(self):
+        schedule = compile_sequence({"steps": [
+            {"channels": [1], "for": {"waveform": ["SINE", "SQUARE"]}, "steps": TOGGLE}]})
+        self.assertEqual([(b.time, b.commands) for b in schedule.bursts], [
+            (0.0, [':w21=0.', ':w20=1,0.']),
+            (0.5, [':w20=0,0.']),
+            (1.0, [':w21=1.', ':w20=1,0.']),
+            (1.5, [':w20=0,0.']),
+        ])
+        self.assertEqual(schedule.duration, 2.0)
+
+    def test_channels_interleave(self):
+        block = {"for": {"phase": [0, 90]}, "steps": TOGGLE}
+        schedule = compile_sequence({"steps": [dict(block, channels=[1]), dict(block, channels=[2])]})
+        self.assertEqual(schedule.duration, 2.0)
+        self.assertEqual(schedule.bursts[0].commands, [':w31=0.', ':w32=0.', ':w20=1,1.'])
+
+    def test_sync_waits_for_both_channels(self):
+        schedule = compile_sequence({"steps": [
+            {"channels": [1], "enable": True, "dwell": 2},
+            {"channels": [2], "enable": True, "dwell": 0.5},
+            {"sync": True},
+            {"channels": [2], "set": {"amplitude": 1}},
+        ]})
+        self.assertEqual(schedule.bursts[-1].time, 2.0)
+
+    def test_redundant_commands_collapse(self):
+        schedule = compile_sequence({"steps": [
+            {"set": {"frequency": 1000}, "enable": True, "dwell": 1},
+            {"enable": False},
+            {"set": {"frequency": 1000}, "enable": True, "dwell": 1},
+            {"set": {"frequency": 1000, "amplitude": 2}},
+        ]})
+        self.assertEqual([(b.time, b.commands) for b in schedule.bursts], [
+            (0.0, [':w23=100000,0.', ':w20=1,0.']),
+            (2.0, [':w25=2000.']),
+        ])
+
+    def test_invalid_steps(self):
+        for spec in ({"steps": [{"set": {"phase": 400}}]},
+                     {"steps": [{"set": {"gain": 1}}]},
+                     {"steps": [{"channels": [3]}]},
+                     {"steps": [{"dwell": -1}]},
+                     {"steps": [{"wait": 1}]},
+                     {"steps": [{"set": {"waveform": "SAWTOOTH"}}]},
+                     {}):
+            with self.subTest(spec=spec), self.assertRaises(SequenceError):
+                compile_sequence(spec)
+
+    def test_dry_run(self):
+        schedule = compile_sequence({"steps": [{"for": {"duty_cycle": [10, 20, 30]}, "steps": TOGGLE}]})
+        report = schedule.dry_run()
+        self.assertEqual((report.commands, report.elapsed), (9, 3.0))
+        # 0.8 s bursts of two commands overrun the 0.5 s dwell and delay the end
+        report = schedule.dry_run(command_time=0.4)
+        self.assertAlmostEqual(report.elapsed, 3.6)
+        self.assertAlmostEqual(report.max_error, 0.7)
+        self.assertEqual(report.failed, [])
+
+    def test_example_sequence(self):
+        path = os.path.join(os.path.dirname(__file__), '..', 'sequences', 'hardware_test.json')
+        schedule = compile_sequence(load_sequence(path))
+        self.assertEqual(schedule.dry_run().elapsed, schedule.duration)
+
+    def test_yaml(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'sequence.yaml')
+            with open(path, 'w') as f:
+                f.write("steps:\n  - channels: [2]\n    set: {offset: -1}\n    enable: true\n")
+            try:
+                spec = load_sequence(path)
+            except ImportError:
+                self.skipTest("PyYAML not installed")
+        self.assertEqual(compile_sequence(spec).bursts[0].commands, [':w28=900.', ':w20=0,1.'])
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), "simulator needs a Linux pty")
+class TestRun(unittest.TestCase):
+
+    def test_run_on_simulator(self):
+        schedule = compile_sequence({"steps": [
+            {"channels": [1, 2], "set": {"waveform": "TRIANGLE", "frequency": 50}, "enable": True, "dwell": 1},
+            {"channels": [2], "enable": False},
+        ]})
+        clock = VirtualClock()
+        with JDS6600Simulator() as sim:
+            conn = SerialConnection(sim.port, timeout=0.5)
+            report = schedule.run(conn, clock=clock, sleep=clock.sleep)
+            conn.close()
+            self.assertEqual(report.failed, [])
+            self.assertEqual(sim.registers[20], '1,0')
+            self.assertEqual(sim.registers[22], '3')
+        self.assertEqual(clock.now, 1.0)
+
+
+if __name__ == '__main__': # pragma: no cover
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from core.session import (SessionRecorder, ReplayConnection, ReplayError, read_session,
+                          summarize_session, COMMAND, RESPONSE, MAGIC)
+from core.serialHandler import SerialConnection
+from core.device.readFunctions import signalGenerator_read
+from core.device.writeFunctions import signalGenerator_write
+from core.device.channelConfig import ChannelConfig
+from core.utils.utils import channel, unit, waveform
+from support import redirect_logs
+
+if sys.platform.startswith('linux'):
+    from core.simulator import JDS6600Simulator
+
+
+def run_sequence(connection):
+    # A short bench session: single writes, a pipelined apply and reads
+    read = signalGenerator_read(connection)
+    write = signalGenerator_write(connection)
+    results = [read.getSerialnumber(), write.set_frequency(channel.CH1, 2, unit.KHZ)]
+    results.append(write.apply(channel.CH2, ChannelConfig(waveform=waveform.TRIANGLE, amplitude=1.5, enable=True)))
+    results.append(read.get_frequency(channel.CH1))
+    results.append(read.snapshot().ch2)
+    return results
+
+
+def setUpModule():
+    redirect_logs()
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), "simulator needs a Linux pty")
+class TestSession(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'session.jdsrec')
+        with JDS6600Simulator(latency=0.01) as sim:
+            conn = SerialConnection(sim.port, timeout=0.5)
+            with SessionRecorder(self.path) as recorder:
+                recorder.attach(conn)
+                self.recorded = run_sequence(conn)
+                self.assertEqual(conn.send_command('garbage', timeout=0.05), '')
+            conn.close()
+
+    def test_log_format(self):
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(len(MAGIC)), MAGIC)
+        events = list(read_session(self.path))
+        self.assertEqual(events[0].kind, COMMAND)
+        self.assertEqual(events[0].data, b':r00=\r\n')
+        self.assertEqual(events[1], (events[1].time, RESPONSE, b':r00=1234567890.\r\n'))
+        self.assertEqual(events[-1].data, b'')
+        self.assertEqual([e.time for e in events], sorted(e.time for e in events))
+
+    def test_fast_replay(self):
+        replay = ReplayConnection(self.path)
+        start = time.monotonic()
+        self.assertEqual(run_sequence(replay), self.recorded)
+        self.assertLess(time.monotonic() - start, 0.05)
+        self.assertEqual(replay.send_command('garbage'), '')
+        self.assertEqual(replay.remaining, 0)
+
+    def test_replay_as_recorded(self):
+        replay = ReplayConnection(self.path, mode=ReplayConnection.RECORDED)
+        start = time.monotonic()
+        replay.send_command(':r00=')
+        replay.send_command(':w23=200000,0.')
+        self.assertGreaterEqual(time.monotonic() - start, 0.02)
+
+    def test_transaction_and_priority(self):
+        replay = ReplayConnection(self.path)
+        with replay.transaction():
+            self.assertEqual(signalGenerator_read(replay).getSerialnumber(), ':r00=1234567890.')
+        write = signalGenerator_write(replay, priority=True)
+        self.assertEqual(write.set_frequency(channel.CH1, 2, unit.KHZ), ':ok')
+
+    def test_mismatch(self):
+        replay = ReplayConnection(self.path)
+        with self.assertRaises(ReplayError):
+            replay.send_command(':r01=')
+        lenient = ReplayConnection(self.path, strict=False)
+        self.assertEqual(lenient.send_command(':r01='), ':r00=1234567890.')
+
+    def test_append(self):
+        count = len(list(read_session(self.path)))
+        with SessionRecorder(self.path) as recorder:
+            recorder.record(COMMAND, b':r01=\r\n')
+            recorder.record(RESPONSE, b':r01=60.\r\n')
+        self.assertEqual(len(list(read_session(self.path))), count + 2)
+
+    def test_summary(self):
+        summary = summarize_session(self.path)
+        self.assertEqual(summary['commands'], 1 + 1 + 3 + 1 + 13 + 1)
+        self.assertEqual(summary['timeouts'], 1)
+        self.assertGreater(summary['mean_latency_ms'], 0)
+        self.assertGreater(summary['bytes_received'], summary['bytes_sent'])
+
+
+if __name__ == '__main__': # pragma: no cover
+    unittest.main()
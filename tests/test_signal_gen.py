@@ -1,9 +1,25 @@
+import logging
+import os
+import tempfile
+import threading
+import time
 import unittest
 from unittest.mock import patch, MagicMock
 import serial
 from core.device.writeFunctions import signalGenerator_write
 from core.utils.utils import unit, waveform, channel, amplitude
-from core.serialHandler import SerialConnection
+from core.serialHandler import SerialConnection, TransactionLock, FrameReader
+from core.device.channelConfig import ChannelConfig
+from core.device.readFunctions import signalGenerator_read
+from core.device.registerCache import RegisterCache
+from core.devicePool import DevicePool
+from core.device.registerMap import ENCODER, REGISTERS
+import logger
+from support import redirect_logs
+
+def setUpModule():
+    redirect_logs()
+
 
 class TestJDS660SignalGenerator(unittest.TestCase):
 
@@ -186,8 +202,263 @@ class TestJDS660SignalGenerator(unittest.TestCase):
     def test_invalid_frequency_unit(self):
         with self.assertRaises(ValueError):
             self.signal_gen.set_frequency(channel.CH1, 1000, "x")  # Invalid unit
+
+    def test_apply_single_burst(self):
+        self.mock_serial_instance.send_commands.side_effect = lambda commands: [':ok'] * len(commands)
+        config = ChannelConfig(waveform=waveform.SQUARE, frequency=1000, amplitude=2.5,
+                               offset=-1, duty_cycle=25, phase=-90, enable=True)
+        results = self.signal_gen.apply(channel.CH1, config)
+        self.mock_serial_instance.send_commands.assert_called_once_with(
+            [':w21=1.', ':w23=100000,0.', ':w25=2500.', ':w27=900.', ':w29=250.', ':w31=2700.', ':w20=1,0.'])
+        self.assertEqual(results, {21: ':ok', 23: ':ok', 25: ':ok', 27: ':ok', 29: ':ok', 31: ':ok', 20: ':ok'})
+        self.mock_serial_instance.send_command.assert_not_called()
+
+    def test_apply_both_channels(self):
+        self.mock_serial_instance.send_commands.side_effect = lambda commands: [':ok'] * len(commands)
+        self.signal_gen.apply({channel.CH1: ChannelConfig(frequency=10, enable=True),
+                               channel.CH2: ChannelConfig(frequency=20, enable=True)})
+        self.mock_serial_instance.send_commands.assert_called_once_with(
+            [':w23=1000,0.', ':w24=2000,0.', ':w20=1,1.'])
+
+    def test_apply_invalid_sends_nothing(self):
+        config = ChannelConfig(waveform=waveform.SINE, frequency=1000, phase=400)
+        with self.assertRaises(ValueError):
+            self.signal_gen.apply((channel.CH1, channel.CH2), config)
+        with self.assertRaises(ValueError):
+            self.signal_gen.apply(3, ChannelConfig(waveform=waveform.SINE))
+        self.mock_serial_instance.send_commands.assert_not_called()
+        self.mock_serial_instance.send_command.assert_not_called()
     
     
+class TestRegisterMap(unittest.TestCase):
+
+    def test_encode(self):
+        self.assertEqual(ENCODER.encode('frequency', channel.CH2, 1234.567), ':w24=123457,0.')
+        self.assertEqual(ENCODER.encode('offset', channel.CH1, -9.99), ':w27=1.')
+        self.assertEqual(ENCODER.encode('phase', channel.CH1, -90), ':w31=2700.')
+        self.assertEqual(ENCODER.encode('arbitrary_waveform', channel.CH2, 60), ':w22=160.')
+        self.assertEqual(ENCODER.encode_line('duty_cycle', channel.CH1, 50), b':w29=500.\r\n')
+
+    def test_encoded_commands_are_memoised(self):
+        first = ENCODER.encode('amplitude', channel.CH1, 1.5)
+        self.assertIs(ENCODER.encode('amplitude', channel.CH1, 1.5), first)
+
+    def test_encode_invalid(self):
+        with self.assertRaises(ValueError):
+            ENCODER.encode('waveform', channel.CH1, 2.5)
+        with self.assertRaises(ValueError):
+            ENCODER.encode('duty_cycle', 3, 50)
+        with self.assertRaises(ValueError):
+            ENCODER.read_command('phase', 0)
+
+    def test_decode(self):
+        self.assertEqual(ENCODER.decode('frequency', '100000,0.'), 1000.0)
+        self.assertAlmostEqual(ENCODER.decode('frequency', '25786,3'), 0.25786)
+        self.assertEqual(ENCODER.decode('offset', '900'), -1.0)
+        self.assertEqual(ENCODER.decode('phase', '3700'), 10.0)
+        self.assertEqual(REGISTERS['amplitude'].decode('2500'), 2.5)
+        with self.assertRaises(ValueError):
+            ENCODER.decode('amplitude', 'abc')
+
+
+class TestLogging(unittest.TestCase):
+
+    def setUp(self):
+        self.log_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.log_dir.cleanup)
+        previous = logger.set_log_dir(os.path.join(self.log_dir.name, 'logs'))
+        self.addCleanup(logger.set_log_dir, previous)
+
+    def test_file_created_on_first_record(self):
+        self.assertFalse(os.path.exists(os.path.join(self.log_dir.name, 'logs')))
+        logger.test_logger.info("Frequency value: %s %s", 1.5, "kHz")
+        logger.flush_logs()
+        [name] = os.listdir(os.path.join(self.log_dir.name, 'logs'))
+        with open(os.path.join(self.log_dir.name, 'logs', name)) as f:
+            self.assertIn("Frequency value: 1.5 kHz", f.read())
+
+    def test_per_module_level(self):
+        module_logger = logger.get_logger('core.serialHandler')
+        self.assertFalse(module_logger.isEnabledFor(logging.DEBUG))
+        logger.set_level(logging.DEBUG, 'core.serialHandler')
+        self.addCleanup(logger.set_level, logging.NOTSET, 'core.serialHandler')
+        self.assertTrue(module_logger.isEnabledFor(logging.DEBUG))
+        self.assertFalse(logger.get_logger('core.asyncSerialHandler').isEnabledFor(logging.DEBUG))
+
+    def test_getters_trace_at_debug(self):
+        conn = MagicMock()
+        conn.send_command.return_value = ':r25=1500,0.'
+        reader = signalGenerator_read(conn)
+        with patch('builtins.print') as mock_print:
+            reader.get_amplitude(channel.CH1)
+        mock_print.assert_not_called()
+        logger.set_level(logging.DEBUG, 'core.device.readFunctions')
+        self.addCleanup(logger.set_level, logging.NOTSET, 'core.device.readFunctions')
+        with self.assertLogs(logger.get_logger('core.device.readFunctions'), logging.DEBUG) as logs:
+            reader.get_amplitude(channel.CH1)
+        self.assertIn("Amplitude value: 1.5 V", logs.output[-1])
+
+
+class TestRegisterCache(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = MagicMock()
+        self.conn.send_command.side_effect = lambda command: ':ok' if command.startswith(':w') else ':r23=5000,0.'
+        self.conn.send_commands.side_effect = lambda commands: [':ok'] * len(commands)
+        self.cache = RegisterCache()
+        self.writer = signalGenerator_write(self.conn, cache=self.cache)
+        self.reader = signalGenerator_read(self.conn, cache=self.cache, max_age=None)
+
+    def test_skips_unchanged_write(self):
+        self.writer.set_channel_enable()
+        self.writer.set_channel_enable()
+        self.writer.set_channel_enable(channel.CH1)
+        sent = [c.args[0] for c in self.conn.send_command.call_args_list]
+        self.assertEqual(sent, [':w20=0,0.', ':w20=1,0.'])
+
+    def test_failed_write_is_not_cached(self):
+        self.conn.send_command.side_effect = lambda command: ''
+        self.writer.set_waveform(channel.CH1, waveform.SINE)
+        self.writer.set_waveform(channel.CH1, waveform.SINE)
+        self.assertEqual(self.conn.send_command.call_count, 2)
+
+    def test_apply_skips_cached_registers(self):
+        self.writer.set_frequency(channel.CH1, 1, unit.KHZ)
+        self.writer.apply(channel.CH1, ChannelConfig(frequency=1000, amplitude=1))
+        self.conn.send_commands.assert_called_once_with([':w25=1000.'])
+
+    def test_read_from_cache(self):
+        self.writer.set_frequency(channel.CH1, 1, unit.KHZ)
+        self.assertEqual(self.reader.get_frequency(channel.CH1), ':r23=100000,0.')
+        self.assertEqual(self.conn.send_command.call_count, 1)
+
+    def test_read_staleness_bound(self):
+        self.reader.max_age = 0.0
+        self.writer.set_frequency(channel.CH1, 1, unit.KHZ)
+        self.assertEqual(self.reader.get_frequency(channel.CH1), ':r23=5000,0.')
+        self.assertEqual(self.cache.get(23), '5000,0')
+
+    def test_invalidate(self):
+        self.writer.set_channel_enable()
+        self.cache.invalidate(20)
+        self.writer.set_channel_enable()
+        self.assertEqual(self.conn.send_command.call_count, 2)
+
+    def test_resync(self):
+        self.conn.send_commands.side_effect = lambda commands: [f':r{c[2:4]}={c[2:4]}.' for c in commands]
+        values = self.cache.resync(self.conn)
+        self.assertEqual(values[20], '20')
+        self.assertEqual(len(values), 13)
+
+
+class SlowConnection:
+    # Stand-in connection that takes a fixed time per command
+    def __init__(self, port, delay=0.05):
+        if port == 'BROKEN':
+            raise serial.SerialException("could not open port")
+        self.port = port
+        self.delay = delay
+        self.closed = False
+
+    def send_command(self, command):
+        time.sleep(self.delay)
+        if self.port == 'FAULTY':
+            return ''
+        return ':ok' if command.startswith(':w') else f'{command}100000,0.'
+
+    def send_commands(self, commands):
+        return [self.send_command(command) for command in commands]
+
+    def close(self):
+        self.closed = True
+
+
+class TestDevicePool(unittest.TestCase):
+
+    def test_fan_out_runs_in_parallel(self):
+        ports = [f'COM{n}' for n in range(8)]
+        with DevicePool(ports, connection_factory=SlowConnection) as pool:
+            start = time.monotonic()
+            results = pool.apply_all(channel.CH1, ChannelConfig(waveform=waveform.SINE, frequency=1000, enable=True))
+            elapsed = time.monotonic() - start
+        self.assertEqual(set(results), set(ports))
+        self.assertTrue(all(r.ok for r in results.values()))
+        # 3 commands x 50 ms per device; sequential would take 1.2 s
+        self.assertLess(elapsed, 0.6)
+
+    def test_error_isolation(self):
+        with DevicePool(['COM1', 'FAULTY', 'BROKEN'], connection_factory=SlowConnection, delay=0) as pool:
+            self.assertIn('BROKEN', pool.errors)
+            results = pool.read_all('get_frequency', channel.CH1)
+        self.assertEqual(results['COM1'].value, ':r23=100000,0.')
+        self.assertIsInstance(results['FAULTY'].error, ValueError)
+        self.assertNotIn('BROKEN', results)
+
+    def test_unavailable_ports_get_error_results(self):
+        with DevicePool(['COM1', 'BROKEN'], connection_factory=SlowConnection, delay=0) as pool:
+            results = pool.run(lambda device: device.read.get_frequency(channel.CH1), ['COM1', 'BROKEN', 'COM9'])
+        self.assertEqual(list(results), ['COM1', 'BROKEN', 'COM9'])
+        self.assertTrue(results['COM1'].ok)
+        self.assertIsInstance(results['BROKEN'].error, serial.SerialException)
+        self.assertIsInstance(results['COM9'].error, ValueError)
+
+
+class TestTransactionLock(unittest.TestCase):
+
+    def _waiter(self, lock, priority, order, name):
+        # Start a thread that queues on the lock and wait until it is queued
+        def run():
+            lock.acquire(priority)
+            order.append(name)
+            lock.release()
+        queued = lock.waiting
+        thread = threading.Thread(target=run)
+        thread.start()
+        while lock.waiting == queued:
+            time.sleep(0.001)
+        return thread
+
+    def test_priority_lane_goes_first(self):
+        lock = TransactionLock()
+        order = []
+        lock.acquire()
+        threads = [self._waiter(lock, False, order, 'poll1'),
+                   self._waiter(lock, False, order, 'poll2'),
+                   self._waiter(lock, True, order, 'write')]
+        lock.release()
+        for thread in threads:
+            thread.join(1)
+        self.assertEqual(order, ['write', 'poll1', 'poll2'])
+
+    def test_reentrant(self):
+        lock = TransactionLock()
+        lock.acquire()
+        lock.acquire()
+        lock.release()
+        acquired = []
+        thread = threading.Thread(target=lambda: (lock.acquire(), acquired.append(True), lock.release()))
+        thread.start()
+        thread.join(0.05)
+        self.assertEqual(acquired, [])
+        lock.release()
+        thread.join(1)
+        self.assertEqual(acquired, [True])
+
+    def test_release_by_other_thread(self):
+        lock = TransactionLock()
+        lock.acquire()
+        errors = []
+        def release():
+            try:
+                lock.release()
+            except RuntimeError as e:
+                errors.append(e)
+        thread = threading.Thread(target=release)
+        thread.start()
+        thread.join(1)
+        self.assertEqual(len(errors), 1)
+
+
 class TestSerialConnection(unittest.TestCase):
 
     @patch('serial.Serial')
@@ -218,6 +489,74 @@ class TestSerialConnection(unittest.TestCase):
         response = conn.send_command(':r01=')
         self.assertEqual(response, '')
 
+    @patch('core.serialHandler.time.sleep')
+    @patch('serial.Serial')
+    def test_send_command_no_fixed_delay(self, mock_serial, mock_sleep):
+        mock_serial.return_value.read_until.return_value = b':ok\r\n'
+        conn = SerialConnection('COM2')
+        self.assertEqual(conn.send_command(':w21=0.'), ':ok')
+        mock_sleep.assert_not_called()
+
+    @patch('core.serialHandler.time.sleep')
+    @patch('serial.Serial')
+    def test_send_command_settle_delay(self, mock_serial, mock_sleep):
+        mock_serial.return_value.read_until.return_value = b':ok\r\n'
+        conn = SerialConnection('COM2', settle_delay=0.1)
+        conn.send_command(':w21=0.')
+        mock_sleep.assert_called_once_with(0.1)
+
+    @patch('core.serialHandler.time.sleep')
+    @patch('serial.Serial')
+    def test_send_command_min_gap(self, mock_serial, mock_sleep):
+        mock_serial.return_value.read_until.return_value = b':ok\r\n'
+        conn = SerialConnection('COM2', min_gap=0.05)
+        conn.send_command(':w21=0.')
+        conn.send_command(':w22=0.')
+        self.assertEqual(mock_sleep.call_count, 1)
+        self.assertLessEqual(mock_sleep.call_args[0][0], 0.05)
+
+    @patch('serial.Serial')
+    def test_send_command_timeout_override(self, mock_serial):
+        mock_serial_instance = mock_serial.return_value
+        mock_serial_instance.read_until.return_value = b''
+        conn = SerialConnection('COM2', timeout=1)
+        self.assertEqual(conn.send_command(':r01=', timeout=0.2), '')
+        self.assertEqual(mock_serial_instance.timeout, 1)
+
+    @patch('serial.Serial')
+    def test_send_commands_fifo(self, mock_serial):
+        mock_serial_instance = mock_serial.return_value
+        mock_serial_instance.read_until.side_effect = [b':ok\r\n', b':r23=100000,0.\r\n', b':ok\r\n']
+        conn = SerialConnection('COM2')
+        responses = conn.send_commands([':w21=0.', ':r23=', ':w25=1000.'], window=2)
+        self.assertEqual(responses, [':ok', ':r23=100000,0.', ':ok'])
+        written = [c.args[0] for c in mock_serial_instance.write.call_args_list]
+        self.assertEqual(written, [b':w21=0.\r\n', b':r23=\r\n', b':w25=1000.\r\n'])
+
+    @patch('serial.Serial')
+    def test_pipeline_window(self, mock_serial):
+        mock_serial_instance = mock_serial.return_value
+        mock_serial_instance.read_until.return_value = b':ok\r\n'
+        conn = SerialConnection('COM2')
+        pipe = conn.pipeline(window=2)
+        first = pipe.submit(':w21=0.')
+        pipe.submit(':w22=0.')
+        self.assertFalse(first.done())
+        pipe.submit(':w23=100,0.')  # Window full, oldest reply is read first
+        self.assertTrue(first.done())
+        self.assertEqual(mock_serial_instance.read_until.call_count, 1)
+        pipe.flush()
+        self.assertEqual(mock_serial_instance.read_until.call_count, 3)
+
+    @patch('serial.Serial')
+    def test_pipeline_timeout_fails_in_flight(self, mock_serial):
+        mock_serial_instance = mock_serial.return_value
+        mock_serial_instance.read_until.side_effect = [b':ok\r\n', b'']
+        conn = SerialConnection('COM2')
+        responses = conn.send_commands([':w21=0.', ':w22=0.', ':w23=100,0.'])
+        self.assertEqual(responses, [':ok', '', ''])
+        mock_serial_instance.reset_input_buffer.assert_called_once()
+
     @patch('serial.Serial')
     def test_close(self, mock_serial):
         mock_serial_instance = mock_serial.return_value
@@ -226,5 +565,50 @@ class TestSerialConnection(unittest.TestCase):
         mock_serial_instance.close.assert_called_once()
 
 
+@unittest.skipUnless(os.name == 'posix', "needs POSIX file descriptors")
+class TestFrameReader(unittest.TestCase):
+
+    class _Port:
+        def __init__(self, fd):
+            self.fd = fd
+
+        def fileno(self):
+            return self.fd
+
+    def setUp(self):
+        read_fd, self.write_fd = os.pipe()
+        self.addCleanup(os.close, read_fd)
+        self.addCleanup(os.close, self.write_fd)
+        self.frames = FrameReader(self._Port(read_fd), size=16)
+
+    def test_pipelined_replies_in_one_read(self):
+        os.write(self.write_fd, b':ok\r\n:r23=100000,0.\r\n:o')
+        self.assertEqual(bytes(self.frames.read_frame(1)), b':ok\r\n')
+        self.assertEqual(bytes(self.frames.read_frame(1)), b':r23=100000,0.\r\n')
+        os.write(self.write_fd, b'k\r\n')
+        self.assertEqual(bytes(self.frames.read_frame(1)), b':ok\r\n')
+
+    def test_terminator_split_across_reads(self):
+        os.write(self.write_fd, b':r20=1,0.\r')
+        threading.Timer(0.05, os.write, (self.write_fd, b'\n')).start()
+        self.assertEqual(bytes(self.frames.read_frame(1)), b':r20=1,0.\r\n')
+
+    def test_reply_larger_than_buffer(self):
+        line = b':b01=' + b','.join([b'4095'] * 50) + b'.\r\n'
+        os.write(self.write_fd, line + b':ok\r\n')
+        self.assertEqual(bytes(self.frames.read_frame(1)), line)
+        self.assertEqual(bytes(self.frames.read_frame(1)), b':ok\r\n')
+
+    def test_timeout_returns_partial(self):
+        os.write(self.write_fd, b':r2')
+        start = time.monotonic()
+        self.assertEqual(bytes(self.frames.read_frame(0.05)), b':r2')
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(bytes(self.frames.read_frame(0.01)), b'')
+
+    def test_mock_ports_use_read_until(self):
+        self.assertIsNone(FrameReader.for_port(MagicMock()))
+
+
 if __name__ == '__main__': # pragma: no cover
     unittest.main()
\ No newline at end of file
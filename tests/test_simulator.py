@@ -0,0 +1,226 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from core.serialHandler import SerialConnection, ResilientConnection, ReconnectError
+from core.device.readFunctions import signalGenerator_read
+from core.device.writeFunctions import signalGenerator_write
+from core.device.channelConfig import ChannelConfig
+from core.device.snapshot import diff
+from core.session import SessionRecorder, read_session, COMMAND
+from core.utils.utils import channel, unit, amplitude, waveform
+from support import redirect_logs
+
+if sys.platform.startswith('linux'):
+    from core.simulator import JDS6600Simulator
+
+
+def setUpModule():
+    redirect_logs()
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), "simulator needs a Linux pty")
+class TestSimulator(unittest.TestCase):
+
+    def setUp(self):
+        self.sim = JDS6600Simulator(serial_number='9876543210').start()
+        self.conn = SerialConnection(self.sim.port, timeout=0.5)
+        self.read = signalGenerator_read(self.conn)
+        self.write = signalGenerator_write(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+        self.sim.stop()
+
+    def test_identity(self):
+        self.assertEqual(self.read.getSerialnumber(), ':r00=9876543210.')
+        self.assertEqual(self.read.getDevicetype(), ':r01=60.')
+
+    def test_register_round_trip(self):
+        self.assertEqual(self.write.set_frequency(channel.CH2, 2.5, unit.KHZ), ':ok')
+        self.assertEqual(self.write.set_amplitude(channel.CH2, 1.5, amplitude.VOLT), ':ok')
+        self.assertEqual(self.read.get_frequency(channel.CH2), ':r24=250000,0.')
+        self.assertEqual(self.read.get_amplitude(channel.CH2), ':r26=1500.')
+        self.assertEqual(self.sim.registers[24], '250000,0')
+
+    def test_pipelined_apply(self):
+        config = ChannelConfig(waveform=waveform.TRIANGLE, frequency=50, amplitude=2,
+                               offset=0, duty_cycle=50, phase=0, enable=True)
+        results = self.write.apply((channel.CH1, channel.CH2), config)
+        self.assertTrue(all(response == ':ok' for response in results.values()))
+        self.assertEqual(self.sim.registers[20], '1,1')
+        self.assertEqual(self.sim.registers[22], '3')
+
+    def test_snapshot(self):
+        config = ChannelConfig(waveform=waveform.SQUARE, frequency=1234.5, amplitude=2.5,
+                               offset=-1, duty_cycle=25, phase=270, enable=True)
+        self.write.apply(channel.CH1, config)
+        self.write.set_arbitrary_waveform(channel.CH2, 7)
+        state = self.read.snapshot()
+        self.assertEqual(state.ch1.to_config(), config)
+        self.assertFalse(state.ch2.enable)
+        self.assertIsNone(state.ch2.waveform)
+        self.assertEqual(state.ch2.arbitrary_waveform, 7)
+        with self.assertRaises(AttributeError):
+            state.ch1.frequency = 1
+
+    def test_snapshot_diff(self):
+        before = self.read.snapshot()
+        self.write.set_frequency(channel.CH2, 10, unit.KHZ)
+        after = self.read.snapshot()
+        changes = diff(before, after)
+        self.assertEqual([(c.channel, c.name, c.register, c.new) for c in changes],
+                         [(channel.CH2, 'frequency', 24, 10000.0)])
+        self.assertEqual(diff(after, after), [])
+
+    def test_silent_on_malformed_command(self):
+        self.assertEqual(self.conn.send_command('garbage', timeout=0.1), '')
+
+    def test_latency(self):
+        self.sim.latency = 0.02
+        start = time.monotonic()
+        self.read.get_waveform(channel.CH1)
+        self.assertGreaterEqual(time.monotonic() - start, 0.02)
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), "simulator needs a Linux pty")
+class TestSharedConnection(unittest.TestCase):
+
+    def setUp(self):
+        self.sim = JDS6600Simulator().start()
+        self.conn = SerialConnection(self.sim.port, timeout=0.5)
+
+    def tearDown(self):
+        self.conn.close()
+        self.sim.stop()
+
+    def test_threads_get_their_own_replies(self):
+        errors = []
+        def poll(register, count):
+            for _ in range(count):
+                for response in [self.conn.send_command(f':r{register}=')] + self.conn.send_commands([f':r{register}='] * 3):
+                    if not response.startswith(f':r{register}='):
+                        errors.append((register, response))
+        threads = [threading.Thread(target=poll, args=(register, 20)) for register in range(21, 29)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(errors, [])
+
+    def test_priority_writes_overtake_polling(self):
+        self.sim.latency = 0.005
+        write = signalGenerator_write(self.conn, priority=True)
+        stop = threading.Event()
+        def poll():
+            while not stop.is_set():
+                self.conn.send_commands([f':r{register}=' for register in range(20, 33)])
+        pollers = [threading.Thread(target=poll) for _ in range(3)]
+        for thread in pollers:
+            thread.start()
+        time.sleep(0.05)
+        start = time.monotonic()
+        self.assertEqual(write.set_frequency(channel.CH1, 5, unit.KHZ), ':ok')
+        waited = time.monotonic() - start
+        stop.set()
+        for thread in pollers:
+            thread.join(5)
+        # Only the burst in progress (~65 ms) is ahead of the write, not
+        # the other pollers' queued bursts as well
+        self.assertLess(waited, 0.12)
+        self.assertEqual(self.sim.registers[23], '500000,0')
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), "simulator needs a Linux pty")
+class TestResilientConnection(unittest.TestCase):
+    # The port name is a symlink, re-pointed at a fresh simulator to mimic
+    # an adapter that drops off the bus and comes back
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.link = os.path.join(directory.name, 'ttyJDS')
+        self.sim = self.plug(JDS6600Simulator().start())
+        self.conn = ResilientConnection(self.link, timeout=0.3, backoff=0.02)
+        self.write = signalGenerator_write(self.conn)
+        self.write.set_frequency(channel.CH1, 2, unit.KHZ)
+        self.write.set_amplitude(channel.CH1, 3, amplitude.VOLT)
+        self.write.set_channel_enable(channel.CH1)
+
+    def tearDown(self):
+        self.conn.close()
+        self.sim.stop()
+
+    def plug(self, sim):
+        if os.path.lexists(self.link):
+            os.unlink(self.link)
+        os.symlink(sim.port, self.link)
+        return sim
+
+    def unplug(self):
+        self.sim.stop()
+        os.unlink(self.link)
+
+    def test_incremental_resync(self):
+        self.unplug()
+        replacement = JDS6600Simulator()
+        replacement.registers[25] = '3000'  # survived the reset
+        threading.Timer(0.2, lambda: self.plug(replacement).start()).start()
+        self.sim = replacement
+        self.assertEqual(self.conn.send_command(':r23='), ':r23=200000,0.')
+        self.assertEqual(self.conn.reconnects, 1)
+        self.assertEqual(self.conn.last_resync, [':w23=200000,0.', ':w20=1,0.'])
+        self.assertEqual(replacement.commands, [':r00=', ':r20=', ':r23=', ':r25=',
+                                                ':w23=200000,0.', ':w20=1,0.', ':r23='])
+
+    def test_recording_survives_reconnect(self):
+        path = os.path.join(os.path.dirname(self.link), 'session.jdsrec')
+        with SessionRecorder(path) as recorder:
+            recorder.attach(self.conn)
+            self.unplug()
+            self.sim = self.plug(JDS6600Simulator().start())
+            self.assertEqual(self.conn.send_command(':r23='), ':r23=200000,0.')
+        commands = [event.data for event in read_session(path) if event.kind == COMMAND]
+        # Everything the replacement unit received was recorded, in order
+        received = [f'{command}\r\n'.encode() for command in self.sim.commands]
+        self.assertEqual(commands[-len(received):], received)
+        self.assertEqual(received[0], b':r00=\r\n')
+
+    def test_power_cycle_on_same_port(self):
+        self.sim.registers.update({20: '0,0', 23: '100000,0'})
+        self.assertEqual(self.conn.recover(), [':w23=200000,0.', ':w20=1,0.'])
+        self.assertEqual(self.sim.registers[20], '1,0')
+
+    def test_other_unit_is_rejected(self):
+        self.unplug()
+        self.sim = self.plug(JDS6600Simulator(serial_number='5555555555').start())
+        with self.assertRaises(ReconnectError):
+            self.conn.send_command(':r23=')
+        self.assertFalse(any(command.startswith(':w') for command in self.sim.commands))
+
+    def test_gives_up(self):
+        self.unplug()
+        self.conn.retries = 3
+        with self.assertRaises(ReconnectError):
+            self.conn.send_commands([':r20=', ':r21='])
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), "simulator needs a Linux pty")
+class TestBenchmark(unittest.TestCase):
+
+    def test_benchmark_report(self):
+        from benchmarks.benchmark import run
+        results = run(repeat=5, latency=0.0, jitter=0.0, baudrate=None)
+        round_trip = results['benchmarks']['round_trip']
+        self.assertEqual(round_trip['operations'], 5)
+        self.assertLessEqual(round_trip['p50_ms'], round_trip['p99_ms'])
+        self.assertIn('channel_setup_apply', results['benchmarks'])
+        self.assertIn('parse_response_us', results['benchmarks']['hot_path'])
+        self.assertFalse(results['benchmarks']['import']['created_files'])
+        self.assertIn('set_us_queued', results['benchmarks']['logging_overhead'])
+
+
+if __name__ == '__main__': # pragma: no cover
+    unittest.main()
@@ -0,0 +1,147 @@
+import sys
+import time
+import unittest
+from unittest.mock import MagicMock
+from core.serialHandler import SerialConnection
+from core.sweep import FrequencySweep, DeviceSweep, sweep_points, encode_frequency_commands, UP_DOWN, DOWN
+from core.utils.utils import channel
+from support import FakeClock, redirect_logs
+
+if sys.platform.startswith('linux'):
+    from core.simulator import JDS6600Simulator
+
+
+def setUpModule():
+    redirect_logs()
+
+
+class TestFrequencySweep(unittest.TestCase):
+
+    def test_linear_points(self):
+        self.assertEqual([float(f) for f in sweep_points(100, 500, 5)], [100, 200, 300, 400, 500])
+
+    def test_log_points(self):
+        points = [round(float(f), 6) for f in sweep_points(10, 1000, 3, 'log')]
+        self.assertEqual(points, [10, 100, 1000])
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            FrequencySweep(channel.CH1, 100, 70000000, 10)
+        with self.assertRaises(ValueError):
+            FrequencySweep(channel.CH1, 100, 1000, 1)
+        with self.assertRaises(ValueError):
+            FrequencySweep(3, 100, 1000, 10)
+        with self.assertRaises(ValueError):
+            FrequencySweep(channel.CH1, 100, 1000, 10, spacing='cubic')
+
+    def test_precomputed_commands(self):
+        self.assertEqual(encode_frequency_commands(channel.CH2, [1.005, 1000]),
+                         [b':w24=100,0.\r\n', b':w24=100000,0.\r\n'])
+
+    def test_deadlines_compensate_drift(self):
+        clock = FakeClock(100.0)
+        conn = MagicMock()
+
+        def slow_send(data):
+            clock.now += 0.015  # each step takes longer than the dwell
+            return ':ok'
+        conn.send_raw.side_effect = slow_send
+        sweep = FrequencySweep(channel.CH1, 100, 1000, 4, dwell=0.01)
+        report = sweep.run(conn, clock=clock, sleep=clock.sleep)
+        self.assertEqual(conn.send_raw.call_count, 4)
+        self.assertEqual(report.failed_steps, [])
+        # Lateness accumulates 5 ms per step instead of 15 ms
+        self.assertAlmostEqual(report.timing_errors[3], 0.015, places=6)
+        self.assertAlmostEqual(report.max_error, 0.015, places=6)
+
+
+class TestDeviceSweep(unittest.TestCase):
+
+    def test_setup_commands(self):
+        sweep = DeviceSweep(channel.CH2, 100, 10000, 2.04, spacing='log', direction=UP_DOWN)
+        self.assertEqual(sweep.commands(), [':w40=10000,0.', ':w41=1000000,0.', ':w42=20.',
+                                            ':w43=2.', ':w44=1.'])
+        self.assertAlmostEqual(sweep.sweep_time, 2.0)
+        self.assertAlmostEqual(sweep.period, 4.0)
+
+    def test_expected_timing(self):
+        sweep = DeviceSweep(channel.CH1, 100, 10000, 10, spacing='log')
+        self.assertAlmostEqual(sweep.frequency_at(5), 1000)
+        self.assertAlmostEqual(sweep.frequency_at(15), 1000)   # second pass
+        self.assertAlmostEqual(sweep.time_at(1000), 5)
+        falling = DeviceSweep(channel.CH1, 1000, 2000, 4, direction=DOWN)
+        self.assertAlmostEqual(falling.frequency_at(1), 1750)
+        self.assertAlmostEqual(falling.time_at(1750), 1)
+        with self.assertRaises(ValueError):
+            falling.time_at(3000)
+
+    def test_invalid_parameters(self):
+        for args, kwargs in (((channel.CH1, 0, 100, 1), {}),
+                             ((channel.CH1, 100, 7e7, 1), {}),
+                             ((channel.CH1, 100, 200, 0.01), {}),
+                             ((channel.CH1, 100, 200, 1000), {}),
+                             ((channel.CH1, 100, 200, 1), {'spacing': 'cubic'}),
+                             ((channel.CH1, 100, 200, 1), {'direction': 'sideways'}),
+                             ((channel.CH1, 100, 100, 1), {}),
+                             ((channel.CH1, 100, 200, 1), {'control_registers': {'run': 46}}),
+                             ((3, 100, 200, 1), {})):
+            with self.subTest(args=args, kwargs=kwargs), self.assertRaises(ValueError):
+                DeviceSweep(*args, **kwargs)
+
+    def test_no_control_writes_without_verified_registers(self):
+        conn = MagicMock()
+        conn.send_commands.side_effect = lambda commands: [':ok'] * len(commands)
+        sweep = DeviceSweep(channel.CH1, 100, 200, 30)
+        self.assertEqual(sorted(sweep.program(conn)), [40, 41, 42, 43, 44])
+        for method in (sweep.start_sweep, sweep.stop_sweep, sweep.run):
+            with self.subTest(method=method.__name__), self.assertRaises(ValueError):
+                method(conn)
+        self.assertEqual(conn.send_commands.call_count, 1)
+        conn.send_command.assert_not_called()
+
+    def test_run_is_one_burst_and_a_stop(self):
+        conn = MagicMock()
+        conn.send_commands.side_effect = lambda commands: [':ok'] * len(commands)
+        conn.send_command.return_value = ':ok'
+        clock = FakeClock(100.0)
+        sweep = DeviceSweep(channel.CH2, 100, 200, 30, control_registers={'channel': 90, 'run': 91})
+        report = sweep.run(conn, sweeps=2, clock=clock, sleep=clock.sleep)
+        self.assertEqual(conn.send_commands.call_count, 1)
+        self.assertEqual(conn.send_commands.call_args[0][0][-2:], [':w90=1.', ':w91=1.'])
+        conn.send_command.assert_called_once_with(':w91=0.')
+        self.assertEqual(report.failed, [])
+        self.assertAlmostEqual(report.elapsed, 60)
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), "simulator needs a Linux pty")
+class TestSweepSimulator(unittest.TestCase):
+
+    def test_sweep_end_to_end(self):
+        with JDS6600Simulator() as sim:
+            conn = SerialConnection(sim.port, timeout=0.5)
+            report = FrequencySweep(channel.CH1, 1000, 2000, 11, dwell=0.005).run(conn)
+            conn.close()
+            self.assertEqual(report.failed_steps, [])
+            self.assertEqual(sim.registers[23], '200000,0')
+            self.assertLess(abs(report.max_error), 0.005)
+
+    def test_device_sweep(self):
+        # The control registers are placeholders agreed between this test and
+        # the simulator, they say nothing about real hardware
+        control = {'channel': 90, 'run': 91}
+        sweep = DeviceSweep(channel.CH2, 1000, 2000, 0.5, control_registers=control)
+        with JDS6600Simulator(sweep_control=control) as sim:
+            conn = SerialConnection(sim.port, timeout=0.5)
+            self.assertEqual(set(sweep.start_sweep(conn).values()), {':ok'})
+            sent = len(sim.commands)
+            time.sleep(0.25)
+            self.assertEqual(len(sim.commands), sent)  # no host traffic while sweeping
+            frequency = float(conn.send_command(':r24=').split('=')[1].split(',')[0]) / 100
+            self.assertAlmostEqual(frequency, sweep.frequency_at(time.monotonic() - sweep.started_at), delta=200)
+            self.assertEqual(sweep.stop_sweep(conn), ':ok')
+            self.assertEqual(sim.registers[91], '0')
+            conn.close()
+
+
+if __name__ == '__main__': # pragma: no cover
+    unittest.main()